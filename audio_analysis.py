@@ -0,0 +1,646 @@
+"""
+Модуль анализа аудио: BPM, тональность и характеристики для AI-чата.
+
+Функции синхронные и выполняются в процессах-воркерах (см. audio_jobs.py), чтобы
+декодирование и librosa не блокировали event loop бота. Источник аудио - путь
+к файлу, файловый объект или bytes с содержимым файла.
+
+Файл декодируется один раз (ANALYSIS_DURATION секунд, ANALYSIS_SAMPLE_RATE), из этого
+буфера extract_features получает все признаки: onset-огибающую и темп для BPM,
+хромаграмму для тональности и спектральные характеристики для настроения.
+Весь путь работает в float32 (фильтр, onset-огибающая, STFT, автокорреляция), а большие
+массивы по возможности изменяются на месте - память на анализ вдвое меньше, чем в float64.
+
+Настроение (AI-чат) оценивается локально по тем же признакам: estimate_mood сравнивает
+вектор признаков с прототипами настроений; внешняя модель нужна, только если уверенность низкая.
+
+Для Key & BPM одного файла анализ двухэтапный: analyze_bpm_fast быстро оценивает BPM по
+короткому окну (FAST_BPM_DURATION секунд), бот сразу показывает его, затем analyze_audio
+считает тональность. Если на коротком окне beat_track и автокорреляция совпали в пределах
+BPM_AGREEMENT_TOLERANCE, оценка окончательная и analyze_audio не пересчитывает BPM.
+"""
+import io
+import logging
+import os
+import time
+from typing import Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from audio_decode import audio_file_duration, decode_segment, open_audio_source
+
+# --- Константы декодирования ---
+ANALYSIS_SAMPLE_RATE = 22050  # Частота дискретизации для всего анализа
+ANALYSIS_DURATION = 90  # Сколько секунд от начала файла декодируется
+N_FFT = 2048  # Размер окна STFT (хромаграмма и спектральные характеристики)
+STFT_HOP_LENGTH = 512  # Hop STFT
+MOOD_ANALYSIS_DURATION = 30  # Фрагмент для спектральных характеристик настроения (секунды от начала)
+TUNING_ANALYSIS_DURATION = 30  # Фрагмент для оценки строя перед хромаграммой (секунды от начала)
+
+# --- Константы для анализа BPM ---
+BPM_ANALYSIS_START = 10  # Начало анализируемого фрагмента (секунды) - пропускаем начало трека
+BPM_ANALYSIS_END = 40  # Конец анализируемого фрагмента (секунды) - пропускаем концовку
+BPM_ANALYSIS_DURATION = BPM_ANALYSIS_END - BPM_ANALYSIS_START  # Длительность анализируемого фрагмента
+BPM_MIN = 80  # Минимальный BPM
+BPM_MAX = 180  # Максимальный BPM
+BPM_DEFAULT = 120  # BPM по умолчанию
+HOP_LENGTH = 256  # Длина hop для onset-огибающей (~86 кадров/с при 22050 Гц)
+ONSET_DELTA = 0.07  # Порог для обнаружения onset'ов
+ONSET_WAIT = 30  # Минимальное время между onset'ами (в кадрах)
+TEMPO_AC_SIZE = 8.0  # Окно автокорреляции темпограммы (секунды), как в librosa.beat.beat_track
+TEMPO_START_BPM = 120.0  # Центр априорного распределения темпа, как в librosa.beat.beat_track
+TEMPO_BLOCK_FRAMES = 256  # Столбцов темпограммы за один шаг (ограничивает память)
+FAST_BPM_DURATION = 15  # Окно быстрой оценки BPM (секунды от BPM_ANALYSIS_START)
+BPM_AGREEMENT_TOLERANCE = 2  # Методы BPM считаются совпавшими, если отличаются не больше (BPM)
+
+# --- Отпечаток содержимого ---
+FINGERPRINT_CHROMA_SEGMENTS = 8  # Отрезков хромаграммы (по 12 бит)
+FINGERPRINT_ONSET_BITS = 32  # Бит onset-огибающей
+FINGERPRINT_BITS = FINGERPRINT_CHROMA_SEGMENTS * 12 + FINGERPRINT_ONSET_BITS  # 128
+
+# --- Настроение ---
+# Прототипы настроений в пространстве признаков mood_vector (каждый признак 0-1):
+# темп, яркость (спектральный центроид), громкость (RMS), шумность (ZCR), мажор
+MOOD_NAMES = ["energetic", "aggressive", "happy", "calm", "melancholic", "dark"]
+MOOD_PROTOTYPES = np.array([
+    [0.75, 0.6, 0.8, 0.5, 0.6],
+    [0.8, 0.8, 1.0, 0.8, 0.2],
+    [0.6, 0.6, 0.6, 0.4, 1.0],
+    [0.2, 0.3, 0.2, 0.2, 0.7],
+    [0.2, 0.3, 0.3, 0.2, 0.0],
+    [0.5, 0.2, 0.6, 0.3, 0.0],
+])
+MOOD_FEATURE_WEIGHTS = np.array([1.0, 1.0, 1.0, 0.5, 0.7])  # Лад определяется хуже остальных признаков
+MOOD_TEMPERATURE = 0.1  # Температура softmax: между двумя прототипами уверенность ~0.5
+
+# --- Прогрев воркера ---
+WARMUP_SAMPLE_RATE = 44100  # Не совпадает с ANALYSIS_SAMPLE_RATE, чтобы прогреть и ресемплинг
+WARMUP_DURATION = 12  # Секунды синтетического сигнала
+
+# --- Профили тональностей (Krumhansl-Schmuckler key profiles) ---
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+def _build_key_profiles() -> tuple[np.ndarray, list]:
+    """
+    Матрица 24x12 из циклических сдвигов профилей (порядок: C major, C minor, C# major, ...),
+    строки центрированы и нормированы - корреляция Пирсона сводится к скалярному произведению.
+    """
+    rows, names = [], []
+    for i, pitch in enumerate(PITCH_CLASSES):
+        for profile, mode in ((MAJOR_PROFILE, "major"), (MINOR_PROFILE, "minor")):
+            rows.append(np.roll(profile, i))
+            names.append(f"{pitch} {mode}")
+    profiles = np.array(rows)
+    profiles -= profiles.mean(axis=1, keepdims=True)
+    profiles /= np.linalg.norm(profiles, axis=1, keepdims=True)
+    return profiles, names
+
+
+KEY_PROFILES, KEY_NAMES = _build_key_profiles()
+
+
+def score_keys(chroma_mean: np.ndarray) -> np.ndarray:
+    """Корреляции средней хромаграммы со всеми 24 тональностями (порядок KEY_NAMES)."""
+    chroma = np.asarray(chroma_mean, dtype=np.float64)
+    chroma = chroma - chroma.mean()
+    norm = np.linalg.norm(chroma)
+    if norm == 0 or not np.isfinite(norm):
+        # Тишина или шум без выраженных нот - тональность не определяется
+        return np.zeros(len(KEY_NAMES))
+    return KEY_PROFILES @ (chroma / norm)
+
+
+# --- Функции анализа аудио ---
+def fix_bpm(bpm: float, min_bpm: float = BPM_MIN, max_bpm: float = BPM_MAX) -> float:
+    """
+    Исправляет BPM, приводя значение в диапазон min_bpm-max_bpm.
+    Проверяет октавы (деление/умножение на 2, 3, 4).
+    
+    Args:
+        bpm: Исходное значение BPM
+        min_bpm: Минимальный BPM (по умолчанию BPM_MIN)
+        max_bpm: Максимальный BPM (по умолчанию BPM_MAX)
+    
+    Returns:
+        float: Исправленное значение BPM в диапазоне min_bpm-max_bpm
+    """
+    # Если уже в диапазоне, возвращаем как есть
+    if min_bpm <= bpm <= max_bpm:
+        return bpm
+    
+    # Пробуем разные варианты нормализации
+    candidates = []
+    
+    # Если значение слишком высокое, пробуем разделить
+    if bpm > max_bpm:
+        for divisor in [2, 3, 4]:
+            normalized = bpm / divisor
+            if min_bpm <= normalized <= max_bpm:
+                candidates.append(normalized)
+    
+    # Если значение слишком низкое, пробуем умножить
+    if bpm < min_bpm:
+        for multiplier in [2, 3, 4]:
+            normalized = bpm * multiplier
+            if min_bpm <= normalized <= max_bpm:
+                candidates.append(normalized)
+    
+    # Выбираем ближайшее к исходному значению
+    if candidates:
+        return min(candidates, key=lambda x: abs(x - bpm))
+    
+    # Если ничего не подошло, просто ограничиваем диапазоном
+    if bpm < min_bpm:
+        return min_bpm
+    elif bpm > max_bpm:
+        return max_bpm
+    
+    return bpm
+
+
+
+
+def load_audio(source) -> tuple[np.ndarray, int]:
+    """
+    Декодирует первые ANALYSIS_DURATION секунд файла (моно, ANALYSIS_SAMPLE_RATE).
+    Это единственное декодирование на один анализ; файл целиком не декодируется
+    даже при ошибке (см. audio_decode.decode_segment).
+    """
+    source = open_audio_source(source)
+    if isinstance(source, str):
+        # Проверяем существование файла
+        if not os.path.exists(source):
+            raise Exception(f"Файл не найден: {source}")
+        
+        # Проверяем размер файла
+        if os.path.getsize(source) == 0:
+            raise Exception("Файл пуст")
+    
+    y, sr = decode_segment(source, ANALYSIS_SAMPLE_RATE, duration=ANALYSIS_DURATION, reuse_buffer=True)
+    if len(y) == 0:
+        raise Exception("Аудиофайл пуст или поврежден")
+    return y, sr
+
+
+def _bpm_segment(y: np.ndarray, sr: int) -> np.ndarray:
+    """
+    Участок BPM_ANALYSIS_START-BPM_ANALYSIS_END (пропускаем начало и концовку трека),
+    нормализованный и без частот ниже 40 Гц.
+    """
+    start_sample = int(BPM_ANALYSIS_START * sr)
+    end_sample = int(BPM_ANALYSIS_END * sr)
+    # Если файл короче, используем что есть
+    return _preprocess_bpm_segment(y[start_sample:end_sample] if start_sample < len(y) else y, sr)
+
+
+def _preprocess_bpm_segment(segment: np.ndarray, sr: int) -> np.ndarray:
+    """
+    Нормализация громкости и high-pass фильтр 40 Гц перед onset-огибающей.
+    segment - срез буфера декодирования, он не изменяется; результат - новый float32-массив.
+    """
+    # Предобработка: нормализация громкости
+    # Нормализуем до максимальной амплитуды 0.95 (оставляем запас) - одна копия без промежуточных массивов
+    max_val = max(float(segment.max(initial=0.0)), -float(segment.min(initial=0.0)))
+    scale = 0.95 / max_val if max_val > 0 else 1.0
+    segment = np.multiply(segment, np.float32(scale), dtype=np.float32)
+    
+    # Предобработка: high-pass фильтр на 40 Hz для удаления очень низких частот
+    # (в форме SOS с float32-коэффициентами: filtfilt с (b, a) переводил сигнал в float64)
+    from scipy import signal
+    try:
+        sos = signal.butter(4, 40.0 / (sr / 2), btype='high', output='sos').astype(np.float32)
+        segment = signal.sosfiltfilt(sos, segment)
+    except Exception as e:
+        logging.warning(f"Не удалось применить фильтр: {e}")
+        # Продолжаем без фильтрации
+    return segment
+
+
+def _onset_features(segment: np.ndarray, sr: int, beat_track: bool = True) -> dict:
+    """
+    onset-огибающая участка (считается один раз и используется обоими методами BPM)
+    и темп beat_track по ней.
+    
+    Returns:
+        dict: onset_env, frame_rate, beat_tempo (None, если beat_track не считался или не сработал)
+    """
+    onset_env = librosa.onset.onset_strength(
+        y=segment,
+        sr=sr,
+        aggregate=np.median,
+        hop_length=HOP_LENGTH
+    )
+    features = {"onset_env": onset_env, "frame_rate": sr / HOP_LENGTH, "beat_tempo": None}
+    if not beat_track:
+        return features
+    try:
+        features["beat_tempo"] = beat_tempo(onset_env, sr)
+    except Exception as e:
+        logging.warning(f"Метод beat_track не сработал: {e}")
+    return features
+
+
+def beat_tempo(onset_env: np.ndarray, sr: int) -> Optional[float]:
+    """
+    Темп, который возвращает librosa.beat.beat_track (нужен только он, сами доли не используются):
+    средняя по времени темпограмма с лог-нормальным априорным распределением вокруг TEMPO_START_BPM.
+    
+    Темпограмма (TEMPO_AC_SIZE секунд x число кадров) в librosa строится целиком и в float64;
+    здесь столбцы считаются блоками по TEMPO_BLOCK_FRAMES в float32 и сразу суммируются -
+    то же среднее без массивов размера всей темпограммы.
+    
+    Returns:
+        float: Темп или None, если onset-огибающая нулевая
+    """
+    if not onset_env.any():
+        return None
+    n = len(onset_env)
+    win_length = int(librosa.time_to_frames(TEMPO_AC_SIZE, sr=sr, hop_length=HOP_LENGTH))
+    from scipy.signal import get_window
+    ac_window = get_window("hann", win_length, fftbins=True).astype(np.float32)[:, np.newaxis]
+    # Центрирование окон, как в librosa.feature.tempogram
+    padded = np.pad(onset_env.astype(np.float32), win_length // 2, mode="linear_ramp", end_values=0)
+    frames = librosa.util.frame(padded, frame_length=win_length, hop_length=1)[:, :n]
+    
+    tg_sum = np.zeros(win_length)
+    for start in range(0, n, TEMPO_BLOCK_FRAMES):
+        block = frames[:, start:start + TEMPO_BLOCK_FRAMES] * ac_window
+        tg_block = librosa.util.normalize(librosa.autocorrelate(block, axis=0), norm=np.inf, axis=0)
+        tg_sum += tg_block.sum(axis=1)
+    tg_mean = (tg_sum / n)[:, np.newaxis]
+    tempo = librosa.feature.tempo(tg=tg_mean, sr=sr, hop_length=HOP_LENGTH, start_bpm=TEMPO_START_BPM,
+                                  aggregate=None)
+    return float(tempo[0])
+
+
+def extract_features(y: np.ndarray, sr: int, beat_track: bool = True) -> dict:
+    """
+    Все признаки для BPM, тональности и настроения из одного декодированного буфера.
+    
+    Args:
+        beat_track: False - не считать beat_track (BPM уже известен из analyze_bpm_fast)
+    
+    Returns:
+        dict: onset_env и frame_rate (BPM), beat_tempo (темп beat_track по той же огибающей),
+        chroma_mean (12 значений), centroid, rolloff, zcr (первые MOOD_ANALYSIS_DURATION секунд),
+        duration (длительность декодированного фрагмента), fingerprint (см. compute_fingerprint)
+    """
+    features = {"duration": len(y) / sr}
+    
+    # BPM: onset-огибающая нужна и для отпечатка, поэтому считается всегда
+    features.update(_onset_features(_bpm_segment(y, sr), sr, beat_track))
+    onset_env = features["onset_env"]
+    
+    # Одна STFT (complex64) на весь буфер: спектр настроения - по началу, хромаграмма - по всему фрагменту
+    S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=STFT_HOP_LENGTH))
+    
+    mood_frames = int(MOOD_ANALYSIS_DURATION * sr / STFT_HOP_LENGTH) + 1
+    S_mood = S[:, :mood_frames]
+    features["centroid"] = float(np.mean(librosa.feature.spectral_centroid(S=S_mood, sr=sr, n_fft=N_FFT)[0]))
+    features["rolloff"] = float(np.mean(librosa.feature.spectral_rolloff(S=S_mood, sr=sr, n_fft=N_FFT)[0]))
+    features["zcr"] = float(np.mean(librosa.feature.zero_crossing_rate(
+        y[:int(MOOD_ANALYSIS_DURATION * sr)], hop_length=STFT_HOP_LENGTH)[0]))
+    features["rms"] = float(np.mean(librosa.feature.rms(S=S_mood, frame_length=N_FFT)[0]))
+    
+    # Модуль больше не нужен - возводим в квадрат на месте (мощность для хромаграммы).
+    # Строй оцениваем по началу: piptrack по всему окну создает несколько массивов размера S
+    np.square(S, out=S)
+    tuning_frames = int(TUNING_ANALYSIS_DURATION * sr / STFT_HOP_LENGTH) + 1
+    tuning = librosa.estimate_tuning(S=S[:, :tuning_frames], sr=sr, n_fft=N_FFT, bins_per_octave=12)
+    chroma = librosa.feature.chroma_stft(S=S, sr=sr, n_fft=N_FFT, hop_length=STFT_HOP_LENGTH, tuning=tuning)
+    del S
+    features["chroma_mean"] = np.mean(chroma, axis=1)
+    features["fingerprint"] = compute_fingerprint(chroma, onset_env)
+    return features
+
+
+def autocorr_bpm(onset_env: np.ndarray, frame_rate: float) -> Optional[float]:
+    """
+    BPM по самому сильному пику автокорреляции onset-огибающей в окне задержек BPM_MIN-BPM_MAX.
+    
+    Автокорреляция считается через FFT (O(n log n) вместо O(n²) у np.correlate),
+    и из нее берутся только задержки из окна. Пики ищутся векторно.
+    
+    Returns:
+        float: BPM или None, если пиков нет
+    """
+    # Нормализуем onset strength (float32, на месте в копии)
+    onset_norm = onset_env.astype(np.float32)
+    onset_norm -= onset_norm.mean()
+    onset_norm /= onset_norm.std() + 1e-10
+    n = len(onset_norm)
+    
+    # Определяем диапазон для поиска BPM (BPM_MIN - BPM_MAX)
+    min_period_frames = int(frame_rate * 60 / BPM_MAX)  # Минимальный период для BPM_MAX
+    max_period_frames = int(frame_rate * 60 / BPM_MIN)  # Максимальный период для BPM_MIN
+    
+    # Ограничиваем диапазон поиска
+    if max_period_frames >= n or min_period_frames >= max_period_frames:
+        return None
+    
+    # Автокорреляция через FFT: дополняем нулями до 2n, чтобы не было циклического наложения
+    n_fft = 1 << (2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(onset_norm, n_fft)
+    spectrum *= spectrum.conj()
+    autocorr = np.fft.irfft(spectrum, n_fft)
+    autocorr_range = autocorr[min_period_frames:max_period_frames]
+    if len(autocorr_range) < 3:
+        return None
+    
+    # Локальные максимумы выше половины максимума окна
+    threshold = np.max(autocorr_range) * 0.5
+    inner = autocorr_range[1:-1]
+    is_peak = (inner > autocorr_range[:-2]) & (inner > autocorr_range[2:]) & (inner > threshold)
+    peak_indices = np.flatnonzero(is_peak) + 1
+    if len(peak_indices) == 0:
+        return None
+    
+    # Самый сильный пик (при равенстве - с меньшей задержкой)
+    strongest_peak_idx = peak_indices[np.argmax(autocorr_range[peak_indices])]
+    period_frames = strongest_peak_idx + min_period_frames
+    return 60.0 / (period_frames / frame_rate)
+
+
+def compute_fingerprint(chroma: np.ndarray, onset_env: np.ndarray) -> str:
+    """
+    Компактный отпечаток содержимого (FINGERPRINT_BITS бит, hex), устойчивый к перекодированию
+    и громкости: для FINGERPRINT_CHROMA_SEGMENTS отрезков хромаграммы - какая из соседних нот
+    сильнее, для onset-огибающей - растет ли энергия между соседними блоками.
+    Похожесть - расстояние Хэмминга (см. audio_fingerprint.py).
+    """
+    bits = []
+    if chroma.shape[1] >= FINGERPRINT_CHROMA_SEGMENTS:
+        segments = np.array([seg.mean(axis=1) for seg in np.array_split(chroma, FINGERPRINT_CHROMA_SEGMENTS, axis=1)])
+        bits.append((segments > np.roll(segments, -1, axis=1)).ravel())
+    else:
+        bits.append(np.zeros(FINGERPRINT_CHROMA_SEGMENTS * 12, dtype=bool))
+    if len(onset_env) > FINGERPRINT_ONSET_BITS:
+        energy = np.array([block.sum() for block in np.array_split(onset_env, FINGERPRINT_ONSET_BITS + 1)])
+        bits.append(energy[1:] > energy[:-1])
+    else:
+        bits.append(np.zeros(FINGERPRINT_ONSET_BITS, dtype=bool))
+    return np.packbits(np.concatenate(bits)).tobytes().hex()
+
+
+def _bpm_candidates(features: dict) -> list:
+    """Оценки BPM обоими методами (после fix_bpm): beat_track и автокорреляция."""
+    bpm_candidates = []
+    
+    # Метод 1: темп beat_track (см. beat_tempo)
+    if features.get("beat_tempo"):
+        # Обязательно прогоняем через fix_bpm
+        bpm_candidates.append(fix_bpm(features["beat_tempo"]))
+    
+    # Метод 2: Автокорреляция onset-функции
+    try:
+        bpm_from_autocorr = autocorr_bpm(features["onset_env"], features["frame_rate"])
+        if bpm_from_autocorr is not None:
+            # Применяем fix_bpm для консистентности
+            bpm_candidates.append(fix_bpm(bpm_from_autocorr))
+    except Exception as e:
+        logging.warning(f"Метод автокорреляции не сработал: {e}")
+    return bpm_candidates
+
+
+def estimate_bpm(features: dict) -> int:
+    """
+    Определяет BPM по признакам extract_features.
+    
+    Returns:
+        int: BPM в диапазоне BPM_MIN-BPM_MAX
+    """
+    return _combine_bpm_candidates(_bpm_candidates(features))
+
+
+def _combine_bpm_candidates(bpm_candidates: list) -> int:
+    """
+    Медиана оценок методов с коррекцией в диапазон BPM_MIN-BPM_MAX. Без оценок возвращает
+    BPM_DEFAULT - вызывающий код отмечает такой BPM как неизмеренный (bpm_estimated).
+    """
+    # Логика коррекции BPM
+    if len(bpm_candidates) == 0:
+        logging.warning("Не удалось определить BPM ни одним методом")
+        return BPM_DEFAULT
+    
+    # Используем медиану для устойчивости к выбросам
+    # Если только одно значение, используем его
+    if len(bpm_candidates) == 1:
+        avg_bpm = bpm_candidates[0]
+    else:
+        # Используем медиану для более устойчивого результата
+        avg_bpm = np.median(bpm_candidates)
+    
+    # Коррекция BPM
+    corrected_bpm = avg_bpm
+    
+    # Если результат < BPM_MIN, пробуем умножить на 2
+    if corrected_bpm < BPM_MIN:
+        doubled = corrected_bpm * 2
+        if BPM_MIN <= doubled <= BPM_MAX:
+            corrected_bpm = doubled
+    
+    # Если результат > 200, пробуем разделить на 2
+    if corrected_bpm > 200:
+        halved = corrected_bpm / 2
+        if BPM_MIN <= halved <= BPM_MAX:
+            corrected_bpm = halved
+    
+    # Выбираем ближайшее значение в допустимом диапазоне
+    if corrected_bpm < BPM_MIN:
+        corrected_bpm = BPM_MIN
+    elif corrected_bpm > BPM_MAX:
+        corrected_bpm = BPM_MAX
+    
+    # Округляем до целого
+    return int(round(corrected_bpm))
+
+
+def estimate_key(features: dict) -> dict:
+    """
+    Определяет тональность по средней хромаграмме: корреляция со всеми 24 профилями
+    (KEY_PROFILES) одним умножением матрицы на вектор.
+    
+    Returns:
+        dict: key, confidence - корреляция с профилем тональности (0-1),
+        second_key и margin - вторая по корреляции тональность и отрыв от нее
+    """
+    chroma_mean = features["chroma_mean"]
+    if len(chroma_mean) != 12:
+        raise Exception("Не удалось извлечь chromagram")
+    
+    correlations = score_keys(chroma_mean)
+    # argmax берет первый максимум - при равенстве побеждает меньший сдвиг, мажор раньше минора
+    order = np.argsort(-correlations, kind="stable")
+    best, second = order[0], order[1]
+    return {
+        "key": KEY_NAMES[best],
+        "confidence": float(np.clip(correlations[best], 0.0, 1.0)),
+        "second_key": KEY_NAMES[second],
+        "margin": float(correlations[best] - correlations[second]),
+    }
+
+
+def mood_vector(tempo: float, centroid: float, rms: float, zcr: float, major: bool) -> np.ndarray:
+    """Признаки настроения, приведенные к 0-1 (порядок как в MOOD_PROTOTYPES)."""
+    return np.clip(np.array([
+        (tempo - 70.0) / 110.0,  # 70-180 BPM
+        (centroid - 1000.0) / 3000.0,  # 1-4 кГц
+        (rms - 0.02) / 0.23,  # от тихой акустики до громкого мастеринга
+        zcr / 0.15,
+        1.0 if major else 0.0,
+    ]), 0.0, 1.0)
+
+
+def estimate_mood(tempo: float, centroid: float, rms: float, zcr: float, key: str) -> dict:
+    """
+    Оценивает настроение по расстоянию до прототипов (все настроения одной операцией).
+    
+    Returns:
+        dict: mood, confidence (вероятность лучшего настроения, softmax по расстояниям),
+        style - описание звучания (темп, тембр, лад)
+    """
+    vector = mood_vector(tempo, centroid, rms, zcr, key.endswith("major"))
+    distances = ((MOOD_PROTOTYPES - vector) ** 2) @ MOOD_FEATURE_WEIGHTS
+    scores = np.exp(-(distances - distances.min()) / MOOD_TEMPERATURE)
+    probabilities = scores / scores.sum()
+    best = int(np.argmax(probabilities))
+    
+    tempo_text = "slow" if tempo < 90 else "mid-tempo" if tempo < 130 else "fast"
+    timbre_text = "dark" if vector[1] < 0.3 else "warm" if vector[1] < 0.6 else "bright"
+    energy_text = "soft" if vector[2] < 0.3 else "punchy" if vector[2] > 0.7 else "balanced"
+    mode_text = "major" if key.endswith("major") else "minor"
+    return {
+        "mood": MOOD_NAMES[best],
+        "confidence": float(probabilities[best]),
+        "style": f"{tempo_text}, {timbre_text} and {energy_text} sound in a {mode_text} key",
+    }
+
+
+def analyze_bpm_fast(source) -> dict:
+    """
+    Быстрая оценка BPM (первый этап Key & BPM): декодируется только окно FAST_BPM_DURATION
+    секунд с BPM_ANALYSIS_START (или с начала, если файл короче), без хромаграммы и спектра.
+    
+    Returns:
+        dict: bpm, estimated (False - ни один метод не сработал, bpm = BPM_DEFAULT) и final - True,
+        если beat_track и автокорреляция совпали в пределах BPM_AGREEMENT_TOLERANCE и второй
+        этап может не пересчитывать BPM
+    """
+    source = open_audio_source(source)
+    y, sr = decode_segment(source, ANALYSIS_SAMPLE_RATE, offset=BPM_ANALYSIS_START, duration=FAST_BPM_DURATION,
+                           reuse_buffer=True)
+    if len(y) == 0:
+        y, sr = decode_segment(source, ANALYSIS_SAMPLE_RATE, duration=FAST_BPM_DURATION, reuse_buffer=True)
+    if len(y) == 0:
+        raise Exception("Аудиофайл пуст или поврежден")
+    candidates = _bpm_candidates(_onset_features(_preprocess_bpm_segment(y, sr), sr))
+    final = len(candidates) == 2 and bool(abs(candidates[0] - candidates[1]) <= BPM_AGREEMENT_TOLERANCE)
+    return {"bpm": _combine_bpm_candidates(candidates), "estimated": bool(candidates), "final": final}
+
+
+def analyze_audio(source, bpm: Optional[int] = None) -> dict:
+    """
+    Полный анализ файла за одно декодирование (функция для процесса-воркера).
+    
+    Args:
+        bpm: Окончательный BPM из analyze_bpm_fast - beat_track не считается
+    
+    Returns:
+        dict: key, bpm, bpm_estimated (False - BPM не определен, bpm = BPM_DEFAULT), confidence,
+        second_key, key_margin, tempo, centroid, rolloff, zcr, rms, duration,
+        file_duration (длительность всего файла), fingerprint, mood, mood_confidence, style -
+        только небольшие значения, которые дешево передать обратно из процесса
+    """
+    try:
+        y, sr = load_audio(source)
+        features = extract_features(y, sr, beat_track=bpm is None)
+        del y
+        
+        # Определяем BPM и тональность по одним и тем же признакам
+        bpm_estimated = True
+        if bpm is None:
+            candidates = _bpm_candidates(features)
+            bpm, bpm_estimated = _combine_bpm_candidates(candidates), bool(candidates)
+        key_result = estimate_key(features)
+        tempo = features["beat_tempo"] or float(bpm)
+        # Для настроения - итоговый BPM (темп beat_track может быть вдвое меньше)
+        mood = estimate_mood(bpm, features["centroid"], features["rms"], features["zcr"], key_result["key"])
+        
+        return {
+            "key": key_result["key"],
+            "bpm": bpm,
+            "bpm_estimated": bpm_estimated,
+            "confidence": key_result["confidence"],
+            "second_key": key_result["second_key"],
+            "key_margin": key_result["margin"],
+            "tempo": tempo,
+            "centroid": features["centroid"],
+            "rolloff": features["rolloff"],
+            "zcr": features["zcr"],
+            "rms": features["rms"],
+            "duration": features["duration"],
+            "file_duration": audio_file_duration(source) or features["duration"],
+            "fingerprint": features["fingerprint"],
+            "mood": mood["mood"],
+            "mood_confidence": mood["confidence"],
+            "style": mood["style"],
+        }
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        logging.error(f"Ошибка анализа аудио: {e}\n{error_details}")
+        raise
+
+
+def analyze_bpm(path) -> int:
+    """
+    Анализирует аудиофайл и определяет BPM.
+    
+    Args:
+        path: Путь к локальному аудиофайлу (mp3/wav/ogg), файловый объект или bytes с его содержимым
+    
+    Returns:
+        int: BPM в диапазоне BPM_MIN-BPM_MAX
+    """
+    try:
+        y, sr = load_audio(path)
+        return estimate_bpm(extract_features(y, sr))
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        logging.error(f"Ошибка анализа BPM: {e}\n{error_details}")
+        return BPM_DEFAULT
+
+
+def analyze_key_bpm(source) -> tuple[str, int, float]:
+    """
+    Анализирует аудиофайл (путь, файловый объект или bytes) и определяет тональность (Key) и BPM.
+    Возвращает (key, bpm, confidence), где confidence - корреляция с профилем тональности (0-1)
+    """
+    result = analyze_audio(source)
+    return result["key"], result["bpm"], result["confidence"]
+
+
+def warm_up() -> float:
+    """
+    Прогревает процесс-воркер: прогоняет через analyze_audio короткий синтетический WAV
+    (клики 120 BPM и аккорд ля минор). Первый вызов загружает модули librosa/scipy и
+    numba-ядра (onset, темпограмма, chroma) - с дисковым кешем numba это секунды, без
+    него - десятки секунд; после прогрева первый запрос пользователя не медленнее остальных.
+
+    Returns:
+        float: Время прогрева (секунды)
+    """
+    started = time.perf_counter()
+    t = np.arange(WARMUP_SAMPLE_RATE * WARMUP_DURATION) / WARMUP_SAMPLE_RATE
+    y = 0.2 * sum(np.sin(2 * np.pi * freq * t) for freq in (220.0, 261.63, 329.63))
+    y[::WARMUP_SAMPLE_RATE // 2] += 1.0
+    buffer = io.BytesIO()
+    sf.write(buffer, y.astype(np.float32), WARMUP_SAMPLE_RATE, format="WAV")
+    analyze_audio(buffer.getvalue())
+    return time.perf_counter() - started
@@ -0,0 +1,293 @@
+"""
+Пакетный режим Key & BPM: альбом (media group) или ZIP-архив с аудиофайлами.
+
+Файлы анализируются параллельно в пуле процессов (audio_jobs.py) с учетом кеша
+(audio_cache.py), а одна таблица "файл / тональность / BPM" редактируется по мере
+готовности результатов. ZIP читается из буфера скачивания (audio_download.py): записи
+распаковываются в память по одной, непосредственно перед отправкой в воркер, на диск
+ничего не пишется.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import zipfile
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+
+from audio_cache import ANALYSIS_ALGO_VERSION, get_cached_analysis, pick_features, save_analysis
+from audio_download import BUFFER_DECODABLE_EXTENSIONS, download_audio
+from audio_fingerprint import match_and_register
+from audio_jobs import AUDIO_USER_MAX_JOBS, AUDIO_USER_MAX_RUNNING, AudioJobCancelledError, audio_queue
+from audio_validation import AudioValidationError, probe_file_name, probe_telegram_audio
+
+# Максимальное количество файлов в одном пакете (не больше лимита заданий пользователя в очереди)
+KEY_BPM_BATCH_MAX_FILES = min(int(os.getenv("KEY_BPM_BATCH_MAX_FILES", "20")), AUDIO_USER_MAX_JOBS)
+# Максимальный размер одного файла в ZIP после распаковки
+KEY_BPM_ZIP_MAX_ENTRY_MB = float(os.getenv("KEY_BPM_ZIP_MAX_ENTRY_MB", "50"))
+# Сколько ждать остальные файлы альбома после последнего полученного (секунды)
+KEY_BPM_MEDIA_GROUP_WAIT = float(os.getenv("KEY_BPM_MEDIA_GROUP_WAIT", "1.5"))
+# Как часто обновлять таблицу результатов (секунды)
+KEY_BPM_BATCH_UPDATE_INTERVAL = float(os.getenv("KEY_BPM_BATCH_UPDATE_INTERVAL", "2"))
+
+# Функции анализа для процесса-воркера (audio_analysis импортируется только в воркере)
+ANALYZE_AUDIO = "audio_analysis:analyze_audio"
+ANALYZE_BPM_FAST = "audio_analysis:analyze_bpm_fast"
+
+# Расширения, которые принимает Key & BPM
+KEY_BPM_AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg')
+
+
+class BatchItem:
+    """Файл пакета и его результат."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"  # 'pending', 'done', 'error', 'skipped', 'unsupported', 'rejected', 'cancelled'
+        self.key: Optional[str] = None
+        self.bpm: Optional[int] = None
+        self.error: Optional[str] = None
+
+
+async def analyze_telegram_file(bot: Bot, user_id: int, file_id: str, file_unique_id: Optional[str],
+                                file_name: str, on_position: Optional[Callable] = None,
+                                on_bpm: Optional[Callable[[int], Awaitable[None]]] = None,
+                                source: str = "key_bpm", with_features: bool = False,
+                                duration: Optional[float] = None) -> Dict:
+    """
+    Анализ файла из Telegram: кеш по file_unique_id, проверка заголовка (audio_validation.py),
+    скачивание, кеш по хешу, анализ в пуле процессов и сохранение результата.
+
+    Args:
+        on_bpm: Если задан, анализ двухэтапный: сначала быстрая оценка BPM по короткому окну
+            (audio_analysis.analyze_bpm_fast) передается в on_bpm, затем считается тональность
+        source: Раздел для индекса отпечатков ('key_bpm', 'ai_chat')
+        with_features: Нужны признаки настроения (AI-чат) - запись кеша без них не используется
+        duration: Длительность из метаданных Telegram (для индекса отпечатков)
+
+    Returns:
+        {"key", "bpm", "bpm_estimated", "confidence", "cached", "features"}; features - см.
+        audio_cache.pick_features; bpm_estimated=False - BPM не определен (BPM_DEFAULT)
+
+    Raises:
+        AudioValidationError: Файл отклонен по заголовку до скачивания
+    """
+    # Тот же файл уже анализировали - отвечаем без скачивания
+    cached = await get_cached_analysis(file_unique_id=file_unique_id)
+    if _is_usable(cached, with_features):
+        logging.info(f"Анализ аудио из кеша для {file_unique_id}: {cached['key']}, {cached['bpm']}")
+        return _cached_result(cached)
+
+    # Проверяем начало файла до скачивания: формат, кодек и длительность
+    file_info = await bot.get_file(file_id)
+    probe = await probe_telegram_audio(bot, file_info, file_name)
+
+    # Скачиваем файл в память (sha256 считается во время скачивания)
+    audio = await download_audio(bot, file_id, probe_file_name(file_name, probe), file_info=file_info)
+    try:
+        # Тот же файл мог быть загружен заново (другой file_unique_id)
+        cached = await get_cached_analysis(file_unique_id=file_unique_id, content_hash=audio.content_hash)
+        if _is_usable(cached, with_features):
+            return _cached_result(cached)
+
+        # Анализируем аудио в пуле процессов (с позицией в очереди в статусе)
+        worker_source = audio.worker_source()
+        if on_bpm:
+            fast = await audio_queue.run(user_id, ANALYZE_BPM_FAST, worker_source, on_position=on_position)
+            if fast["estimated"]:
+                await on_bpm(fast["bpm"])
+            # Методы BPM совпали на коротком окне - второй этап BPM не пересчитывает
+            result = await audio_queue.run(user_id, ANALYZE_AUDIO, worker_source,
+                                           fast["bpm"] if fast["final"] else None)
+        else:
+            result = await audio_queue.run(user_id, ANALYZE_AUDIO, worker_source, on_position=on_position)
+        # Длительность файла для отпечатка: из метаданных или заголовка, иначе - от декодера в воркере
+        file_duration = duration or (probe or {}).get("duration")
+        if file_duration:
+            result = dict(result, file_duration=file_duration)
+        return await _save_result(result, user_id, file_unique_id, audio.content_hash, source)
+    finally:
+        # Освобождаем буфер (и временный файл, если формат не читается из памяти)
+        audio.close()
+
+
+async def analyze_zip_entry(user_id: int, archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Dict:
+    """Key & BPM для записи ZIP-архива: распаковка (до KEY_BPM_ZIP_MAX_ENTRY_MB) - в потоке, не в event loop."""
+    data = await asyncio.to_thread(read_zip_entry, archive, info)
+    return await analyze_audio_bytes(user_id, data)
+
+
+async def analyze_audio_bytes(user_id: int, data: bytes) -> Dict:
+    """Key & BPM для содержимого файла (запись ZIP-архива): кеш по хешу, затем анализ."""
+    # sha256 десятков мегабайт - тоже в потоке (hashlib отпускает GIL)
+    content_hash = (await asyncio.to_thread(hashlib.sha256, data)).hexdigest()
+    cached = await get_cached_analysis(content_hash=content_hash)
+    if cached:
+        return _cached_result(cached)
+    result = await audio_queue.run(user_id, ANALYZE_AUDIO, data)
+    return await _save_result(result, user_id, None, content_hash, "key_bpm")
+
+
+def _is_usable(cached: Optional[Dict], with_features: bool) -> bool:
+    return bool(cached) and (not with_features or bool(cached["features"]))
+
+
+def _cached_result(cached: Dict) -> Dict:
+    return {"key": cached["key"], "bpm": cached["bpm"], "bpm_estimated": True, "confidence": cached["confidence"],
+            "cached": True, "features": cached["features"]}
+
+
+async def _save_result(result: Dict, user_id: int, file_unique_id: Optional[str], content_hash: str,
+                       source: str) -> Dict:
+    """
+    Сверяет отпечаток с индексом, сохраняет результат в кеш и приводит его к виду _cached_result.
+    Результат без измеренного BPM (BPM_DEFAULT) не кешируется и не попадает в индекс отпечатков:
+    иначе запасное значение отдавалось бы как результат анализа для этого и похожих файлов.
+    """
+    features = pick_features(result)
+    bpm_estimated = result.get("bpm_estimated", True)
+    if bpm_estimated:
+        result = await _reuse_fingerprint_match(result, user_id, file_unique_id, content_hash, source)
+        features = pick_features(result)
+        await save_analysis(file_unique_id, content_hash, result["key"], result["bpm"], result["confidence"],
+                            features)
+    else:
+        logging.warning(f"BPM не определен (файл {file_unique_id or content_hash[:12]}), результат не кешируется")
+    return {"key": result["key"], "bpm": result["bpm"], "bpm_estimated": bpm_estimated,
+            "confidence": result["confidence"], "cached": False, "features": features}
+
+
+async def _reuse_fingerprint_match(result: Dict, user_id: int, file_unique_id: Optional[str],
+                                   content_hash: str, source: str) -> Dict:
+    """
+    Та же запись уже анализировалась в другом файле (перекодирована, загружена заново) -
+    отдаем прежние тональность и BPM, чтобы ответ для одной записи не менялся. Результат
+    прежней версии анализа не переиспользуется: иначе он попал бы в кеш под новой версией.
+    """
+    match = await match_and_register(result, source, user_id, file_unique_id, content_hash, ANALYSIS_ALGO_VERSION)
+    if match and match["key"]:
+        return dict(result, key=match["key"], bpm=match["bpm"])
+    return result
+
+
+def list_zip_audio(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Аудиофайлы архива (без папок и служебных файлов macOS)."""
+    entries = []
+    for info in archive.infolist():
+        base_name = os.path.basename(info.filename)
+        if info.is_dir() or not base_name or base_name.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        if os.path.splitext(base_name)[1].lower() in KEY_BPM_AUDIO_EXTENSIONS:
+            entries.append(info)
+    return entries
+
+
+def read_zip_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """
+    Распаковывает запись в память с ограничением размера (размер в заголовке ZIP
+    может не соответствовать содержимому, поэтому проверяется и при чтении).
+    """
+    max_size = int(KEY_BPM_ZIP_MAX_ENTRY_MB * 1024 * 1024)
+    if info.file_size > max_size:
+        raise ValueError(f"Файл в архиве слишком большой: {info.file_size} байт")
+    chunks, size = [], 0
+    with archive.open(info) as entry:
+        for chunk in iter(lambda: entry.read(1024 * 1024), b""):
+            size += len(chunk)
+            if size > max_size:
+                raise ValueError(f"Файл в архиве слишком большой: больше {max_size} байт")
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def run_batch(items: List[BatchItem], analyze: List[Callable[[], Awaitable[Dict]]],
+                    on_update: Callable[[List[BatchItem]], Awaitable[None]]) -> List[BatchItem]:
+    """
+    Выполняет analyze[i]() для items[i] параллельно (не больше AUDIO_USER_MAX_RUNNING одновременно,
+    чтобы распакованные файлы не ждали в памяти) и вызывает on_update не чаще
+    KEY_BPM_BATCH_UPDATE_INTERVAL секунд и в конце.
+    """
+    semaphore = asyncio.Semaphore(AUDIO_USER_MAX_RUNNING)
+    state = {"cancelled": False, "last_update": time.monotonic()}
+
+    async def run_item(item: BatchItem, func: Callable[[], Awaitable[Dict]]):
+        if item.status != "pending":
+            return
+        async with semaphore:
+            if state["cancelled"]:
+                item.status = "cancelled"
+                return
+            try:
+                result = await func()
+                item.key, item.bpm, item.status = result["key"], result["bpm"], "done"
+            except AudioJobCancelledError:
+                # /cancel - остальные файлы пакета не запускаем
+                state["cancelled"] = True
+                item.status = "cancelled"
+            except AudioValidationError as e:
+                item.status = "unsupported" if e.reason == "unsupported" else "rejected"
+                item.error = str(e)
+            except Exception as e:
+                logging.error(f"Ошибка анализа файла пакета {item.name}: {e}")
+                item.status, item.error = "error", str(e)
+        if time.monotonic() - state["last_update"] >= KEY_BPM_BATCH_UPDATE_INTERVAL:
+            state["last_update"] = time.monotonic()
+            await _safe_update(on_update, items)
+
+    await asyncio.gather(*(run_item(item, func) for item, func in zip(items, analyze)))
+    await _safe_update(on_update, items)
+    return items
+
+
+async def _safe_update(on_update: Callable, items: List[BatchItem]):
+    try:
+        await on_update(items)
+    except Exception as e:
+        logging.debug(f"Не удалось обновить таблицу Key & BPM: {e}")
+
+
+def format_batch_table(items: List[BatchItem], lang: str = "ru") -> str:
+    """Таблица результатов пакета (Markdown, моноширинный блок)."""
+    done = sum(1 for item in items if item.status not in ("pending",))
+    finished = done == len(items)
+    if lang == "ru":
+        title = "✅ *Анализ завершен*" if finished else "🔍 *Анализирую файлы...*"
+        pending_text, error_text, skipped_text, cancelled_text = "⏳", "ошибка", "не аудио", "отменено"
+        unsupported_text, rejected_text = "формат не поддерживается", "превышен лимит"
+    else:
+        title = "✅ *Analysis complete*" if finished else "🔍 *Analyzing files...*"
+        pending_text, error_text, skipped_text, cancelled_text = "⏳", "error", "not audio", "cancelled"
+        unsupported_text, rejected_text = "unsupported format", "over the limit"
+
+    lines = []
+    for number, item in enumerate(items, 1):
+        name = item.name.replace("`", "'")
+        if len(name) > 28:
+            name = name[:25] + "..."
+        if item.status == "done":
+            result = f"{item.key:<9} {item.bpm:>3} BPM"
+        elif item.status == "error":
+            result = error_text
+        elif item.status == "skipped":
+            result = skipped_text
+        elif item.status == "unsupported":
+            result = unsupported_text
+        elif item.status == "rejected":
+            result = rejected_text
+        elif item.status == "cancelled":
+            result = cancelled_text
+        else:
+            result = pending_text
+        lines.append(f"{number:>2}. {name:<28} {result}")
+    return f"{title} ({done}/{len(items)})\n\n```\n" + "\n".join(lines) + "\n```"
+
+
+def is_zip_name(file_name: str) -> bool:
+    return file_name.lower().endswith(".zip")
+
+
+def is_buffer_decodable(file_name: str) -> bool:
+    """Запись ZIP передается в воркер как bytes - поддерживаются только форматы, читаемые из памяти."""
+    return os.path.splitext(file_name)[1].lower() in BUFFER_DECODABLE_EXTENSIONS
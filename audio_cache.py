@@ -0,0 +1,100 @@
+"""
+Модуль кеша результатов анализа Key & BPM.
+
+Результат сохраняется по file_unique_id Telegram (одинаковый для одного файла у всех
+пользователей и ботов) и по sha256 содержимого (считается при скачивании, см. audio_download.py) - если тот же файл загрузили заново
+и у него другой file_unique_id. Записи другой версии алгоритма не используются.
+
+Вместе с Key & BPM хранятся признаки настроения (features): файл, уже разобранный в Key & BPM,
+AI-чат описывает без повторного анализа, и наоборот.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from database import get_db
+
+# Версия алгоритма анализа. Увеличивается при изменении анализа, чтобы не отдавать старые результаты
+ANALYSIS_ALGO_VERSION = "2"
+# Поля результата audio_analysis.analyze_audio, которые сохраняются в features
+CACHED_FEATURE_KEYS = ("tempo", "centroid", "rolloff", "zcr", "rms", "mood", "mood_confidence", "style")
+
+
+def pick_features(result: Dict) -> Optional[Dict]:
+    """Признаки настроения из результата анализа (None, если их нет)."""
+    if not all(name in result for name in CACHED_FEATURE_KEYS):
+        return None
+    return {name: result[name] for name in CACHED_FEATURE_KEYS}
+
+
+async def _find(db, column: str, value: str) -> Optional[Dict]:
+    cursor = await db.execute(f"""
+        SELECT * FROM audio_analysis_cache
+        WHERE {column} = ? AND algo_version = ?
+        ORDER BY id DESC LIMIT 1
+    """, (value, ANALYSIS_ALGO_VERSION))
+    row = await cursor.fetchone()
+    if not row:
+        return None
+    await db.execute("UPDATE audio_analysis_cache SET hits = hits + 1 WHERE id = ?", (row["id"],))
+    await db.commit()
+    result = dict(row)
+    result["features"] = json.loads(result["features"]) if result.get("features") else None
+    return result
+
+
+async def get_cached_analysis(file_unique_id: str = None, content_hash: str = None) -> Optional[Dict]:
+    """
+    Ищет результат анализа по file_unique_id, затем по хешу содержимого.
+
+    Returns:
+        {"key", "bpm", "confidence", "features", ...} или None; features - словарь или None
+        (запись сохранена без признаков)
+    """
+    if not file_unique_id and not content_hash:
+        return None
+    db = await get_db()
+    try:
+        result = None
+        if file_unique_id:
+            result = await _find(db, "file_unique_id", file_unique_id)
+        if result is None and content_hash:
+            result = await _find(db, "content_hash", content_hash)
+            if result is not None and file_unique_id:
+                # Запоминаем новый file_unique_id, чтобы следующий запрос обошелся без скачивания
+                await db.execute("""
+                    INSERT INTO audio_analysis_cache (file_unique_id, content_hash, key, bpm, confidence, features,
+                                                      algo_version, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (file_unique_id, content_hash, result["key"], result["bpm"], result["confidence"],
+                      json.dumps(result["features"]) if result["features"] else None,
+                      ANALYSIS_ALGO_VERSION, datetime.now().isoformat()))
+                await db.commit()
+        return result
+    except Exception as e:
+        logging.error(f"Ошибка чтения кеша анализа аудио: {e}")
+        return None
+    finally:
+        await db.close()
+
+
+async def save_analysis(file_unique_id: Optional[str], content_hash: Optional[str], key: str, bpm: int,
+                        confidence: Optional[float] = None, features: Optional[Dict] = None) -> None:
+    """Сохраняет результат анализа в кеш (features - см. pick_features)."""
+    if not file_unique_id and not content_hash:
+        return
+    db = await get_db()
+    try:
+        await db.execute("""
+            INSERT INTO audio_analysis_cache (file_unique_id, content_hash, key, bpm, confidence, features,
+                                              algo_version, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (file_unique_id, content_hash, key, int(bpm), confidence, json.dumps(features) if features else None,
+              ANALYSIS_ALGO_VERSION, datetime.now().isoformat()))
+        await db.commit()
+    except Exception as e:
+        logging.error(f"Ошибка сохранения кеша анализа аудио: {e}")
+        await db.rollback()
+    finally:
+        await db.close()
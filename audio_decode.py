@@ -0,0 +1,144 @@
+"""
+Декодирование фрагмента аудиофайла с ограничением памяти.
+
+decode_segment декодирует только окно [offset, offset + duration): для форматов,
+которые читает soundfile (WAV, FLAC, OGG, MP3), файл перематывается на начало окна
+и читается блоками по DECODE_BLOCK_FRAMES кадров; каждый блок сразу сводится в моно
+и записывается в заранее выделенный float32-массив. Количество декодируемых сэмплов
+ограничено AUDIO_DECODE_MAX_SAMPLES, поэтому память на анализ не зависит от длины
+загруженного файла. Остальные форматы (m4a) декодируются через librosa/audioread,
+которые тоже останавливаются на конце окна.
+
+С reuse_buffer=True декодирование идет в буфер процесса-воркера, который переиспользуется
+между анализами (растет до самого длинного окна, не больше AUDIO_DECODE_MAX_SAMPLES): большой
+массив не выделяется и не возвращается системе на каждый файл.
+"""
+import io
+import logging
+import os
+from typing import Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+# Максимум декодируемых сэмплов (на исходной частоте, после сведения в моно):
+# 90 секунд при 96 кГц. Длинное окно на высокой частоте обрезается
+AUDIO_DECODE_MAX_SAMPLES = int(os.getenv("AUDIO_DECODE_MAX_SAMPLES", str(90 * 96000)))
+# Размер блока чтения (кадров)
+DECODE_BLOCK_FRAMES = 65536
+
+# Переиспользуемый буфер декодирования процесса (см. _scratch_buffer)
+_scratch: Optional[np.ndarray] = None
+
+
+def _scratch_buffer(frames: int) -> np.ndarray:
+    """float32-буфер на frames кадров из общего буфера процесса (увеличивается при необходимости)."""
+    global _scratch
+    if _scratch is None or len(_scratch) < frames:
+        _scratch = np.empty(frames, dtype=np.float32)
+    return _scratch[:frames]
+
+
+def open_audio_source(source):
+    """
+    Приводит источник к виду, который принимает librosa.load: bytes (содержимое файла,
+    переданное в процесс-воркер) оборачиваются в BytesIO, путь возвращается как есть.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def _rewind_audio_source(source):
+    """
+    Источник аудио - путь к файлу или файловый объект (буфер из audio_download.py).
+    Файловый объект перед каждым декодированием возвращается в начало.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def _decode_soundfile(source, offset: float, duration: Optional[float],
+                      reuse_buffer: bool = False) -> tuple[np.ndarray, int]:
+    """Читает окно через soundfile блоками со сведением в моно. Возвращает сигнал на исходной частоте."""
+    with sf.SoundFile(source) as f:
+        native_sr = f.samplerate
+        start = int(offset * native_sr)
+        if f.frames > 0:
+            start = min(start, f.frames)
+        if start:
+            f.seek(start)
+
+        max_frames = AUDIO_DECODE_MAX_SAMPLES
+        if duration is not None:
+            max_frames = min(max_frames, int(duration * native_sr))
+        if f.frames > 0:
+            max_frames = min(max_frames, f.frames - start)
+        elif duration is not None and int(duration * native_sr) > AUDIO_DECODE_MAX_SAMPLES:
+            logging.warning(f"Окно декодирования обрезано до {AUDIO_DECODE_MAX_SAMPLES} сэмплов")
+
+        max_frames = max(max_frames, 0)
+        y = _scratch_buffer(max_frames) if reuse_buffer else np.empty(max_frames, dtype=np.float32)
+        pos = 0
+        for block in f.blocks(blocksize=DECODE_BLOCK_FRAMES, frames=len(y), dtype="float32", always_2d=True):
+            n = len(block)
+            if block.shape[1] == 1:
+                y[pos:pos + n] = block[:, 0]
+            else:
+                np.mean(block, axis=1, out=y[pos:pos + n])
+            pos += n
+        return y[:pos], native_sr
+
+
+def audio_file_duration(source) -> Optional[float]:
+    """
+    Длительность всего файла (секунды) по заголовку, без декодирования; None, если ее не узнать.
+    Нужна для индекса отпечатков: декодируется только окно, его длина у длинных треков одинаковая.
+    """
+    source = open_audio_source(source)
+    try:
+        with sf.SoundFile(_rewind_audio_source(source)) as f:
+            if f.frames > 0 and f.samplerate:
+                return f.frames / f.samplerate
+    except (RuntimeError, TypeError):
+        # m4a: длительность из метаданных через audioread (только для пути к файлу)
+        if isinstance(source, str):
+            try:
+                return librosa.get_duration(path=source)
+            except Exception as e:
+                logging.debug(f"Не удалось определить длительность файла: {e}")
+    return None
+
+
+def decode_segment(source, sr: int, offset: float = 0.0, duration: Optional[float] = None,
+                   reuse_buffer: bool = False) -> tuple[np.ndarray, int]:
+    """
+    Декодирует окно [offset, offset + duration) в моно с частотой sr.
+
+    Args:
+        source: Путь, файловый объект или bytes с содержимым файла
+        sr: Частота дискретизации результата
+        offset: Начало окна (секунды)
+        duration: Длина окна (секунды); None - до конца файла, но не больше AUDIO_DECODE_MAX_SAMPLES
+        reuse_buffer: Декодировать в буфер процесса - результат действителен до следующего
+            вызова decode_segment с reuse_buffer=True
+
+    Returns:
+        (y, sr): float32-сигнал (пустой, если файл короче offset)
+    """
+    source = open_audio_source(source)
+    try:
+        y, native_sr = _decode_soundfile(_rewind_audio_source(source), offset, duration, reuse_buffer)
+    except (RuntimeError, TypeError) as e:
+        # Формат не читается soundfile (m4a) - audioread декодирует последовательно и тоже
+        # останавливается на конце окна
+        logging.debug(f"soundfile не открыл файл, декодирую через librosa: {e}")
+        if duration is None:
+            duration = AUDIO_DECODE_MAX_SAMPLES / sr
+        return librosa.load(_rewind_audio_source(source), sr=sr, mono=True, offset=offset, duration=duration)
+
+    if native_sr != sr and len(y):
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+    return y, sr
@@ -0,0 +1,158 @@
+"""
+Модуль скачивания аудиофайлов для анализа без записи на диск.
+
+Файл потоково скачивается из Telegram в SpooledTemporaryFile: до AUDIO_SPOOL_MEMORY_MB
+он хранится в памяти, больше - автоматически переносится во временный файл.
+Размер проверяется во время скачивания, sha256 считается на лету.
+
+MP3, WAV, FLAC и OGG декодируются через soundfile прямо из буфера. Для остальных
+форматов (m4a) librosa нужен путь к файлу - буфер записывается во временный файл
+только в этом случае (см. DownloadedAudio.decode_source).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.types import File
+
+# Максимальный размер файла для анализа (Bot API отдает файлы до 20 МБ)
+AUDIO_MAX_DOWNLOAD_MB = float(os.getenv("AUDIO_MAX_DOWNLOAD_MB", "20"))
+# До какого размера файл хранится в памяти
+AUDIO_SPOOL_MEMORY_MB = float(os.getenv("AUDIO_SPOOL_MEMORY_MB", "32"))
+# Таймаут скачивания (секунды)
+AUDIO_DOWNLOAD_TIMEOUT = int(os.getenv("AUDIO_DOWNLOAD_TIMEOUT", "60"))
+
+# Форматы, которые soundfile читает из файлового объекта
+BUFFER_DECODABLE_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".oga", ".aiff", ".aif")
+
+
+class AudioTooLargeError(Exception):
+    """Файл больше AUDIO_MAX_DOWNLOAD_MB."""
+
+
+class DownloadedAudio:
+    """Скачанный аудиофайл: буфер, размер и sha256 содержимого."""
+
+    def __init__(self, buffer, size: int, content_hash: str, file_name: str):
+        self.buffer = buffer
+        self.size = size
+        self.content_hash = content_hash
+        self.file_name = file_name
+        self._tmp_path: Optional[str] = None
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.file_name)[1].lower() or ".mp3"
+
+    @property
+    def in_memory(self) -> bool:
+        """Файл целиком в памяти (не был перенесен на диск)."""
+        return not getattr(self.buffer, "_rolled", False)
+
+    def decode_source(self):
+        """
+        Возвращает источник для librosa.load: сам буфер (с начала) или путь к временному
+        файлу, если формат не читается из памяти.
+        """
+        if self.extension in BUFFER_DECODABLE_EXTENSIONS:
+            self.buffer.seek(0)
+            return self.buffer
+        return self._materialize()
+
+    def worker_source(self):
+        """
+        Возвращает источник для процесса-воркера анализа (audio_jobs.py): bytes для файла
+        в памяти или путь к временному файлу (файловый объект нельзя передать в процесс).
+        """
+        if self.in_memory and self.extension in BUFFER_DECODABLE_EXTENSIONS:
+            return self.read_bytes()
+        return self._materialize()
+
+    def _materialize(self) -> str:
+        """Записывает содержимое во временный файл (один раз) и возвращает путь."""
+        if self._tmp_path is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=self.extension) as tmp_file:
+                self.buffer.seek(0)
+                for chunk in iter(lambda: self.buffer.read(1024 * 1024), b""):
+                    tmp_file.write(chunk)
+                self._tmp_path = tmp_file.name
+        return self._tmp_path
+
+    def read_bytes(self) -> bytes:
+        """Возвращает содержимое файла целиком."""
+        self.buffer.seek(0)
+        return self.buffer.read()
+
+    def close(self):
+        try:
+            self.buffer.close()
+        finally:
+            if self._tmp_path and os.path.exists(self._tmp_path):
+                try:
+                    os.unlink(self._tmp_path)
+                except OSError:
+                    pass
+            self._tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def download_audio(bot: Bot, file_id: str, file_name: str = "audio.mp3",
+                         max_size_mb: float = AUDIO_MAX_DOWNLOAD_MB,
+                         file_info: Optional[File] = None) -> DownloadedAudio:
+    """
+    Потоково скачивает файл из Telegram в буфер.
+
+    Args:
+        file_info: Результат bot.get_file, если уже получен (проверка заголовка в audio_validation.py)
+
+    Raises:
+        AudioTooLargeError: Файл больше max_size_mb
+    """
+    max_size = int(max_size_mb * 1024 * 1024)
+    if file_info is None:
+        file_info = await bot.get_file(file_id)
+    if file_info.file_size and file_info.file_size > max_size:
+        raise AudioTooLargeError(f"Файл слишком большой: {file_info.file_size} байт")
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=int(AUDIO_SPOOL_MEMORY_MB * 1024 * 1024))
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        if bot.session.api.is_local:
+            # Локальный Bot API сервер отдает путь к файлу на диске
+            stream = _read_local_file(bot.session.api.wrap_local_file.to_local(file_info.file_path))
+        else:
+            url = bot.session.api.file_url(bot.token, file_info.file_path)
+            stream = bot.session.stream_content(url=url, timeout=AUDIO_DOWNLOAD_TIMEOUT, raise_for_status=True)
+        async for chunk in stream:
+            size += len(chunk)
+            if size > max_size:
+                await stream.aclose()
+                raise AudioTooLargeError(f"Файл слишком большой: больше {max_size} байт")
+            digest.update(chunk)
+            buffer.write(chunk)
+    except Exception:
+        buffer.close()
+        raise
+
+    if size == 0:
+        buffer.close()
+        raise Exception("Файл не был скачан или пуст")
+
+    buffer.seek(0)
+    logging.info(f"Скачан файл {file_name}: {size} байт, в памяти: {not getattr(buffer, '_rolled', False)}")
+    return DownloadedAudio(buffer, size, digest.hexdigest(), file_name)
+
+
+async def _read_local_file(path: str, chunk_size: int = 65536):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield chunk
@@ -0,0 +1,135 @@
+"""
+Индекс отпечатков аудио.
+
+Отпечаток (audio_analysis.compute_fingerprint, 128 бит) считается во время анализа и
+почти не меняется при перекодировании (MP3/WAV, другой битрейт) и повторной загрузке,
+в отличие от file_unique_id и sha256. Поиск: индекс SQLite по (версия, BPM, длительность) отбирает
+кандидатов, среди них ищется ближайший по расстоянию Хэмминга. Длительность - всего файла
+(метаданные Telegram, заголовок или декодер), а не декодированного окна: окно ограничено
+ANALYSIS_DURATION, и у всех длинных треков одного темпа оно одинаковое.
+
+Так одна и та же запись узнается в разных разделах (Key & BPM, AI-чат, заказы):
+результат анализа переиспользуется, а повторные референсы можно отметить. Вместе с
+отпечатком хранится версия анализа (audio_cache.ANALYSIS_ALGO_VERSION): тональность и BPM
+переиспользуются только из записей текущей версии.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from audio_cache import ANALYSIS_ALGO_VERSION
+from database import get_db
+
+# Версия отпечатка. Увеличивается при изменении compute_fingerprint или полей индекса
+# ("2": длительность всего файла вместо длительности декодированного окна)
+FINGERPRINT_VERSION = "2"
+# Максимальное расстояние Хэмминга (из 128 бит), при котором записи считаются одинаковыми
+FINGERPRINT_MAX_DISTANCE = int(os.getenv("FINGERPRINT_MAX_DISTANCE", "24"))
+# Допуски для отбора кандидатов
+FINGERPRINT_BPM_TOLERANCE = 2
+FINGERPRINT_DURATION_TOLERANCE = 1
+
+
+def hamming_distance(a: str, b: str) -> int:
+    """Количество различающихся бит двух отпечатков (hex)."""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+async def find_matches(fingerprint: str, bpm: int, duration: float, source: Optional[str] = None) -> List[Dict]:
+    """
+    Записи с тем же содержимым, от ближайшей.
+
+    Args:
+        source: Только из этого раздела ('key_bpm', 'ai_chat', 'order'); None - из всех
+
+    Returns:
+        Список записей audio_fingerprints с полем distance
+    """
+    duration = int(round(duration))
+    query = """
+        SELECT * FROM audio_fingerprints
+        WHERE fingerprint_version = ? AND bpm BETWEEN ? AND ? AND duration BETWEEN ? AND ?
+    """
+    params = [FINGERPRINT_VERSION, bpm - FINGERPRINT_BPM_TOLERANCE, bpm + FINGERPRINT_BPM_TOLERANCE,
+              duration - FINGERPRINT_DURATION_TOLERANCE, duration + FINGERPRINT_DURATION_TOLERANCE]
+    if source:
+        query += " AND source = ?"
+        params.append(source)
+
+    db = await get_db()
+    try:
+        cursor = await db.execute(query, params)
+        rows = await cursor.fetchall()
+    except Exception as e:
+        logging.error(f"Ошибка поиска отпечатка аудио: {e}")
+        return []
+    finally:
+        await db.close()
+
+    matches = []
+    for row in rows:
+        distance = hamming_distance(fingerprint, row["fingerprint"])
+        if distance <= FINGERPRINT_MAX_DISTANCE:
+            matches.append(dict(row, distance=distance))
+    matches.sort(key=lambda match: (match["distance"], match["id"]))
+    return matches
+
+
+async def save_fingerprint(fingerprint: str, bpm: int, duration: float, key: Optional[str], source: str,
+                           ref_id: Optional[int] = None, file_unique_id: Optional[str] = None,
+                           content_hash: Optional[str] = None) -> None:
+    """
+    Сохраняет отпечаток с текущей версией анализа (повторно тот же файл из того же раздела
+    той же версии не сохраняется).
+    """
+    db = await get_db()
+    try:
+        if content_hash:
+            cursor = await db.execute("""
+                SELECT 1 FROM audio_fingerprints
+                WHERE content_hash = ? AND source = ? AND ref_id IS ? AND fingerprint_version = ?
+                    AND algo_version IS ?
+            """, (content_hash, source, ref_id, FINGERPRINT_VERSION, ANALYSIS_ALGO_VERSION))
+            if await cursor.fetchone():
+                return
+        await db.execute("""
+            INSERT INTO audio_fingerprints (fingerprint, bpm, duration, key, file_unique_id, content_hash,
+                                            source, ref_id, fingerprint_version, algo_version, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (fingerprint, int(bpm), int(round(duration)), key, file_unique_id, content_hash, source, ref_id,
+              FINGERPRINT_VERSION, ANALYSIS_ALGO_VERSION, datetime.now().isoformat()))
+        await db.commit()
+    except Exception as e:
+        logging.error(f"Ошибка сохранения отпечатка аудио: {e}")
+        await db.rollback()
+    finally:
+        await db.close()
+
+
+async def match_and_register(analysis: Dict, source: str, ref_id: Optional[int] = None,
+                             file_unique_id: Optional[str] = None, content_hash: Optional[str] = None,
+                             algo_version: Optional[str] = None) -> Optional[Dict]:
+    """
+    Ищет ту же запись по отпечатку из результата audio_analysis.analyze_audio и сохраняет
+    отпечаток нового файла.
+
+    Args:
+        algo_version: Искать только среди записей этой версии анализа (None - среди всех)
+
+    Returns:
+        Ближайшая найденная запись (с key, bpm, algo_version, source, distance) или None
+    """
+    fingerprint = analysis.get("fingerprint")
+    if not fingerprint:
+        return None
+    duration = analysis.get("file_duration") or analysis["duration"]
+    matches = await find_matches(fingerprint, analysis["bpm"], duration)
+    match = next((m for m in matches if (not content_hash or m["content_hash"] != content_hash)
+                  and (algo_version is None or m["algo_version"] == algo_version)), None)
+    if match:
+        logging.info(f"Аудио ({source}) совпадает с записью {match['id']} ({match['source']}), "
+                     f"расстояние {match['distance']}")
+    await save_fingerprint(fingerprint, analysis["bpm"], duration, analysis.get("key"), source,
+                           ref_id, file_unique_id, content_hash)
+    return match
@@ -0,0 +1,283 @@
+"""
+Очередь заданий анализа аудио на пуле процессов.
+
+librosa и декодирование занимают CPU на секунды, поэтому анализ выполняется в
+ProcessPoolExecutor, а не в event loop бота. Очередь ограничивает:
+- количество одновременно выполняемых заданий (по числу воркеров),
+- количество одновременно выполняемых и ожидающих заданий одного пользователя,
+- общий размер очереди.
+
+Функция задания передается строкой "модуль:функция" (например, "audio_analysis:analyze_audio")
+и импортируется только в процессе-воркере, поэтому librosa, numpy и scipy не загружаются
+в процесс бота.
+
+Каждый воркер при запуске прогревается (audio_analysis.warm_up): numba-ядра librosa
+компилируются или читаются из дискового кеша NUMBA_CACHE_DIR до первого задания. Пул
+запускается вместе с ботом (start), все воркеры создаются сразу; get_stats показывает,
+сколько воркеров уже прогреты (ready_workers), у скольких прогрев не удался (warmup_failed) и
+готов ли пул целиком (ready).
+
+Пока задание ждет, вызывается колбэк on_position(позиция) - бот показывает место
+в очереди в статусном сообщении. Ожидающее задание можно отменить; уже запущенное
+задание процесс-воркер доводит до конца, но его результат отбрасывается.
+"""
+import asyncio
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, Dict, List, Optional, Union
+
+# Количество процессов-воркеров анализа
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+# Сколько заданий одного пользователя выполняется одновременно
+AUDIO_USER_MAX_RUNNING = int(os.getenv("AUDIO_USER_MAX_RUNNING", "2"))
+# Сколько заданий одного пользователя может быть в очереди (вместе с выполняемыми)
+AUDIO_USER_MAX_JOBS = int(os.getenv("AUDIO_USER_MAX_JOBS", "20"))
+# Максимальное количество ожидающих заданий всех пользователей
+AUDIO_QUEUE_MAX = int(os.getenv("AUDIO_QUEUE_MAX", "200"))
+# Прогревать воркеры синтетическим сигналом при запуске (1 - да, 0 - нет)
+AUDIO_WORKER_WARMUP = os.getenv("AUDIO_WORKER_WARMUP", "1") == "1"
+# Дисковый кеш скомпилированных numba-ядер: без него каждый новый воркер компилирует их заново
+AUDIO_NUMBA_CACHE_DIR = os.getenv("NUMBA_CACHE_DIR", ".numba_cache")
+# Функция прогрева воркера
+AUDIO_WARMUP_FUNCTION = "audio_analysis:warm_up"
+
+
+class AudioQueueFullError(Exception):
+    """Очередь анализа переполнена (общая или для пользователя)."""
+
+
+class AudioJobCancelledError(Exception):
+    """Задание отменено (пользователь нажал /cancel или бот останавливается)."""
+
+
+def run_job_function(func_path: str, *args):
+    """Выполняется в процессе-воркере: импортирует модуль функции задания и вызывает ее."""
+    module_name, func_name = func_path.split(":")
+    return getattr(importlib.import_module(module_name), func_name)(*args)
+
+
+def init_worker(ready_counter, failed_counter, warmup: bool):
+    """
+    Инициализатор процесса-воркера: включает дисковый кеш numba (до импорта librosa),
+    прогревает анализ и увеличивает счетчик готовых воркеров - только если прогрев удался.
+    """
+    os.environ.setdefault("NUMBA_CACHE_DIR", AUDIO_NUMBA_CACHE_DIR)
+    counter = ready_counter
+    if warmup:
+        try:
+            seconds = run_job_function(AUDIO_WARMUP_FUNCTION)
+            logging.info(f"Воркер анализа аудио {os.getpid()} прогрет за {seconds:.1f} с")
+        except Exception as e:
+            # Воркер остается рабочим (первое задание выполнится медленнее), но готовым не считается
+            logging.error(f"Ошибка прогрева воркера анализа аудио: {e}")
+            counter = failed_counter
+    with counter.get_lock():
+        counter.value += 1
+
+
+class AudioJob:
+    """Задание анализа: функция ("модуль:функция") и ее аргументы (должны передаваться в процесс)."""
+
+    def __init__(self, job_id: int, user_id: int, func: Union[str, Callable], args: tuple,
+                 on_position: Optional[Callable] = None):
+        self.id = job_id
+        self.user_id = user_id
+        self.func = func
+        self.args = args
+        self.on_position = on_position
+        self.status = "queued"  # 'queued', 'running', 'done', 'failed', 'cancelled'
+        self.position = 0
+        self.executor: Optional[ProcessPoolExecutor] = None  # пул, в котором задание запущено
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    async def result(self):
+        """Ждет результат задания."""
+        return await self.future
+
+
+class AudioJobQueue:
+    """Очередь заданий с ограничениями на пользователя и общим пулом процессов."""
+
+    def __init__(self, workers: int = AUDIO_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._ready_workers = None  # multiprocessing.Value: сколько воркеров пула прогреты
+        self._failed_warmups = None  # multiprocessing.Value: у скольких воркеров прогрев не удался
+        self._queued: Deque[AudioJob] = deque()
+        self._running: Dict[int, AudioJob] = {}
+        self._ids = itertools.count(1)
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: воркеры не наследуют event loop и соединения бота
+            context = multiprocessing.get_context("spawn")
+            self._ready_workers = context.Value("i", 0)
+            self._failed_warmups = context.Value("i", 0)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(self._ready_workers, self._failed_warmups, AUDIO_WORKER_WARMUP)
+            )
+            # ProcessPoolExecutor создает процессы по мере заданий - пустые задания запускают
+            # (и прогревают) все воркеры сразу, а не при первых запросах пользователей
+            for _ in range(self.workers):
+                self._executor.submit(os.getpid)
+            logging.info(f"Пул анализа аудио запущен: {self.workers} процессов")
+        return self._executor
+
+    def start(self):
+        """Запускает и прогревает пул заранее (при старте бота), не дожидаясь первого задания."""
+        self._get_executor()
+
+    def _reset_executor(self, executor: Optional[ProcessPoolExecutor] = None):
+        """
+        Останавливает текущий пул - следующее задание создаст новый. Если передан executor
+        (сломанный пул задания), сбрасывает пул только если это все еще текущий пул: когда воркер
+        падает, BrokenProcessPool получают все его задания, и поздние колбэки не должны
+        останавливать уже пересозданный пул.
+        """
+        if executor is not None and executor is not self._executor:
+            return
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._ready_workers = None
+        self._failed_warmups = None
+
+    def _user_jobs(self, user_id: int) -> List[AudioJob]:
+        return [job for job in itertools.chain(self._queued, self._running.values()) if job.user_id == user_id]
+
+    def submit(self, user_id: int, func: Union[str, Callable], *args,
+               on_position: Optional[Callable] = None) -> AudioJob:
+        """
+        Ставит задание в очередь.
+
+        Raises:
+            AudioQueueFullError: У пользователя слишком много заданий или очередь переполнена
+        """
+        if len(self._queued) >= AUDIO_QUEUE_MAX or len(self._user_jobs(user_id)) >= AUDIO_USER_MAX_JOBS:
+            self.stats["rejected"] += 1
+            raise AudioQueueFullError("Очередь анализа аудио переполнена")
+        job = AudioJob(next(self._ids), user_id, func, args, on_position)
+        self._queued.append(job)
+        self.stats["submitted"] += 1
+        self._schedule()
+        return job
+
+    async def run(self, user_id: int, func: Union[str, Callable], *args, on_position: Optional[Callable] = None):
+        """Ставит задание в очередь и ждет результат."""
+        return await self.submit(user_id, func, *args, on_position=on_position).result()
+
+    def _can_start(self, job: AudioJob) -> bool:
+        running_for_user = sum(1 for running in self._running.values() if running.user_id == job.user_id)
+        return running_for_user < AUDIO_USER_MAX_RUNNING
+
+    def _schedule(self):
+        """Запускает ожидающие задания, пока есть свободные воркеры, и обновляет позиции."""
+        while len(self._running) < self.workers:
+            job = next((queued for queued in self._queued if self._can_start(queued)), None)
+            if job is None:
+                break
+            self._queued.remove(job)
+            self._start(job)
+        for position, job in enumerate(self._queued, 1):
+            if job.position != position:
+                job.position = position
+                self._notify(job, position)
+
+    def _notify(self, job: AudioJob, position: int):
+        if job.on_position:
+            try:
+                result = job.on_position(position)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                logging.warning(f"Ошибка колбэка позиции задания {job.id}: {e}")
+
+    def _start(self, job: AudioJob):
+        job.status = "running"
+        self._running[job.id] = job
+        if job.position:
+            # Задание ждало в очереди - сообщаем, что анализ начался
+            self._notify(job, 0)
+        loop = asyncio.get_running_loop()
+        job.executor = self._get_executor()
+        try:
+            if isinstance(job.func, str):
+                executor_future = loop.run_in_executor(job.executor, run_job_function, job.func, *job.args)
+            else:
+                executor_future = loop.run_in_executor(job.executor, job.func, *job.args)
+        except BrokenProcessPool as e:
+            # Воркер упал (например, по памяти) - пересоздаем пул для следующих заданий
+            logging.error(f"Пул анализа аудио сломан, перезапуск: {e}")
+            self._reset_executor(job.executor)
+            self._running.pop(job.id, None)
+            job.status = "failed"
+            self.stats["failed"] += 1
+            job.future.set_exception(e)
+            return
+        executor_future.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+    def _finish(self, job: AudioJob, executor_future: asyncio.Future):
+        self._running.pop(job.id, None)
+        if job.status == "cancelled" or job.future.done():
+            # Результат отмененного задания не нужен, но сломанный пул все равно пересоздается
+            if not executor_future.cancelled() and isinstance(executor_future.exception(), BrokenProcessPool):
+                self._reset_executor(job.executor)
+        elif executor_future.cancelled():
+            job.status = "cancelled"
+            job.future.set_exception(AudioJobCancelledError())
+        elif executor_future.exception() is not None:
+            if isinstance(executor_future.exception(), BrokenProcessPool):
+                logging.error(f"Пул анализа аудио сломан, перезапуск: {executor_future.exception()}")
+                self._reset_executor(job.executor)
+            job.status = "failed"
+            self.stats["failed"] += 1
+            job.future.set_exception(executor_future.exception())
+        else:
+            job.status = "done"
+            self.stats["completed"] += 1
+            job.future.set_result(executor_future.result())
+        self._schedule()
+
+    def cancel_user_jobs(self, user_id: int) -> int:
+        """Отменяет все задания пользователя. Возвращает количество отмененных."""
+        cancelled = 0
+        for job in self._user_jobs(user_id):
+            if job.status == "queued":
+                self._queued.remove(job)
+            job.status = "cancelled"
+            if not job.future.done():
+                job.future.set_exception(AudioJobCancelledError())
+            cancelled += 1
+        self.stats["cancelled"] += cancelled
+        if cancelled:
+            self._schedule()
+        return cancelled
+
+    def get_stats(self) -> Dict:
+        ready_workers = self._ready_workers.value if self._ready_workers is not None else 0
+        warmup_failed = self._failed_warmups.value if self._failed_warmups is not None else 0
+        return dict(self.stats, queued=len(self._queued), running=len(self._running), workers=self.workers,
+                    ready_workers=ready_workers, warmup_failed=warmup_failed, ready=ready_workers >= self.workers)
+
+    def shutdown(self):
+        """Останавливает пул процессов (ожидающие задания отменяются)."""
+        for job in list(self._queued):
+            job.status = "cancelled"
+            if not job.future.done():
+                job.future.set_exception(AudioJobCancelledError())
+        self._queued.clear()
+        self._reset_executor()
+
+
+# Общая очередь процесса
+audio_queue = AudioJobQueue()
@@ -0,0 +1,393 @@
+"""
+Проверка аудиофайла до скачивания.
+
+Сначала проверяются метаданные из сообщения Telegram (file_size, duration, mime_type и
+расширение имени) - без запросов в сеть. Затем probe_telegram_audio читает только начало
+файла (Range-запрос на AUDIO_PROBE_BYTES байт) и по заголовку определяет контейнер и
+кодек: WAV (fmt), FLAC (STREAMINFO), OGG (первый пакет), MP3 (ID3 и MPEG-кадры), M4A
+(ftyp/moov). Для документов, у которых Telegram не сообщает длительность, она берется
+из заголовка, если ее можно вычислить без скачивания всего файла.
+
+Слишком большие, слишком длинные и нераспознанные файлы отклоняются за миллисекунды,
+не занимая канал и воркеры анализа. Если заголовок прочитать не удалось (сеть), файл
+не отклоняется - его проверит скачивание и декодирование.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import File
+
+from audio_download import AUDIO_MAX_DOWNLOAD_MB
+
+# Максимальная длительность аудио для анализа (секунды)
+AUDIO_MAX_DURATION = int(os.getenv("AUDIO_MAX_DURATION", "1200"))
+# Сколько байт начала файла читается для проверки заголовка
+AUDIO_PROBE_BYTES = int(os.getenv("AUDIO_PROBE_BYTES", "65536"))
+# Таймаут чтения заголовка (секунды)
+AUDIO_PROBE_TIMEOUT = int(os.getenv("AUDIO_PROBE_TIMEOUT", "10"))
+
+# Расширения файлов и их контейнеры
+AUDIO_EXTENSION_CONTAINERS = {".mp3": "mp3", ".wav": "wav", ".m4a": "mp4", ".flac": "flac", ".ogg": "ogg"}
+# Расширение, под которым файл с данным контейнером передается в декодирование
+CONTAINER_EXTENSIONS = {"mp3": ".mp3", "wav": ".wav", "mp4": ".m4a", "flac": ".flac", "ogg": ".ogg",
+                        "aiff": ".aiff"}
+# MIME-типы аудио (документ без расширения, но с типом от Telegram)
+AUDIO_MIME_TYPES = ("audio/mpeg", "audio/mp3", "audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave",
+                    "audio/flac", "audio/x-flac", "audio/ogg", "audio/mp4", "audio/x-m4a", "audio/m4a")
+
+# Кодеки WAV (wFormatTag), которые декодирует libsndfile: PCM, ADPCM, float, A-law, u-law, GSM, G721, MPEG
+WAV_FORMAT_CODECS = {0x0001: "pcm", 0x0002: "ms_adpcm", 0x0003: "float", 0x0006: "alaw", 0x0007: "ulaw",
+                     0x0011: "ima_adpcm", 0x0031: "gsm610", 0x0040: "g721", 0x0050: "mp2", 0x0055: "mp3"}
+WAV_FORMAT_EXTENSIBLE = 0xFFFE
+# Сжатие AIFC, которое декодирует libsndfile
+AIFC_COMPRESSIONS = (b"NONE", b"sowt", b"twos", b"raw ", b"fl32", b"FL32", b"fl64", b"FL64",
+                     b"alaw", b"ALAW", b"ulaw", b"ULAW", b"ima4")
+# Кодеки OGG по первому пакету: поддерживаемые (libsndfile) и None - известные, но не декодируемые
+OGG_CODECS = {b"\x01vorbis": "vorbis", b"OpusHead": "opus", b"Speex   ": None, b"\x7fFLAC": None,
+              b"\x80theora": None}
+# Аудиокодеки в описании дорожек MP4 (stsd)
+MP4_AUDIO_CODECS = {b"mp4a": "aac", b"alac": "alac", b"fLaC": "flac", b"Opus": "opus", b".mp3": "mp3",
+                    b"ac-3": "ac3", b"ec-3": "eac3"}
+
+# MPEG-аудио: битрейты (кбит/с) по (MPEG-1, слой) и (MPEG-2/2.5, слой), частоты по версии
+MPEG_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+# Сколько MPEG-кадров подряд должно найтись, чтобы считать файл MP3 (меньше - случайные совпадения)
+MPEG_SYNC_FRAMES = 4
+
+
+class AudioValidationError(Exception):
+    """
+    Файл отклонен до скачивания.
+
+    reason: 'too_large', 'too_long' или 'unsupported'; value - размер (байты) или длительность (секунды)
+    """
+
+    def __init__(self, reason: str, message: str, value: Optional[float] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.value = value
+
+
+def check_audio_metadata(file_name: str, file_size: Optional[int] = None, duration: Optional[int] = None,
+                         mime_type: Optional[str] = None) -> None:
+    """
+    Проверка по метаданным сообщения Telegram (без запросов в сеть).
+
+    Raises:
+        AudioValidationError: Файл больше AUDIO_MAX_DOWNLOAD_MB, длиннее AUDIO_MAX_DURATION
+            или не аудио (ни расширение, ни MIME-тип)
+    """
+    _check_size(file_size)
+    _check_duration(duration)
+    extension = os.path.splitext(file_name or "")[1].lower()
+    if extension not in AUDIO_EXTENSION_CONTAINERS and (mime_type or "").lower() not in AUDIO_MIME_TYPES:
+        raise AudioValidationError("unsupported", f"Не аудиофайл: {file_name} ({mime_type})")
+
+
+def _check_size(file_size: Optional[int]):
+    if file_size and file_size > AUDIO_MAX_DOWNLOAD_MB * 1024 * 1024:
+        raise AudioValidationError("too_large", f"Файл слишком большой: {file_size} байт", file_size)
+
+
+def _check_duration(duration: Optional[float]):
+    if duration and duration > AUDIO_MAX_DURATION:
+        raise AudioValidationError("too_long", f"Аудио слишком длинное: {duration:.0f} с", duration)
+
+
+async def probe_telegram_audio(bot: Bot, file_info: File, file_name: str) -> Optional[Dict]:
+    """
+    Читает начало файла из Telegram и проверяет заголовок (см. sniff_audio_header).
+
+    Returns:
+        Результат sniff_audio_header или None, если заголовок прочитать не удалось
+
+    Raises:
+        AudioValidationError: Файл слишком большой, слишком длинный или не декодируется
+    """
+    _check_size(file_info.file_size)
+    started = time.monotonic()
+    try:
+        header = await _read_range(bot, file_info.file_path, 0, AUDIO_PROBE_BYTES)
+        offset = id3_tag_size(header)
+        if offset and offset + 64 > len(header) and (not file_info.file_size or offset < file_info.file_size):
+            # ID3 с обложкой длиннее окна - второй запрос с конца тега
+            first = header
+            header = await _read_range(bot, file_info.file_path, offset, AUDIO_PROBE_BYTES)
+            if header[:10] == first[:10]:
+                # Сервер не поддерживает Range и отдал файл с начала - кадры не проверить
+                logging.info(f"Заголовок {file_name}: ID3 длиннее окна, Range не поддерживается")
+                return None
+        else:
+            header = header[offset:]
+    except Exception as e:
+        logging.warning(f"Не удалось прочитать заголовок {file_name}, проверка пропущена: {e}")
+        return None
+
+    audio_size = file_info.file_size - offset if file_info.file_size else None
+    probe = sniff_audio_header(header, audio_size)
+    logging.info(f"Заголовок {file_name}: {probe['container']}/{probe['codec']}, "
+                 f"{probe['duration'] or '?'} с, {(time.monotonic() - started) * 1000:.0f} мс")
+    _check_duration(probe["duration"])
+    return probe
+
+
+def probe_file_name(file_name: str, probe: Optional[Dict]) -> str:
+    """
+    Имя файла для декодирования: расширение заменяется, если заголовок показал другой
+    контейнер (от расширения зависит, читается ли файл из памяти, см. audio_download.py).
+    """
+    if not probe:
+        return file_name
+    stem, extension = os.path.splitext(file_name)
+    if AUDIO_EXTENSION_CONTAINERS.get(extension.lower()) == probe["container"]:
+        return file_name
+    return stem + CONTAINER_EXTENSIONS[probe["container"]]
+
+
+async def _read_range(bot: Bot, file_path: str, start: int, length: int) -> bytes:
+    """Читает length байт файла Telegram с позиции start (Range-запрос или локальный файл)."""
+    if bot.session.api.is_local:
+        with open(bot.session.api.wrap_local_file.to_local(file_path), "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    url = bot.session.api.file_url(bot.token, file_path)
+    stream = bot.session.stream_content(url=url, headers={"Range": f"bytes={start}-{start + length - 1}"},
+                                        timeout=AUDIO_PROBE_TIMEOUT, raise_for_status=True)
+    data = bytearray()
+    try:
+        # Если сервер проигнорирует Range, дальше length байт все равно не читаем
+        async for chunk in stream:
+            data += chunk
+            if len(data) >= length:
+                break
+    finally:
+        await stream.aclose()
+    return bytes(data[:length])
+
+
+def id3_tag_size(header: bytes) -> int:
+    """Размер тега ID3v2 в начале файла (0 - тега нет)."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def sniff_audio_header(header: bytes, file_size: Optional[int] = None) -> Dict:
+    """
+    Определяет контейнер и кодек по началу файла (после тега ID3).
+
+    Args:
+        header: Первые байты файла (после ID3)
+        file_size: Размер файла без ID3 - для оценки длительности MP3 без заголовка Xing
+
+    Returns:
+        {"container", "codec", "duration"}; codec и duration - None, если их нет в окне
+
+    Raises:
+        AudioValidationError: Формат не распознан или кодек не декодируется
+    """
+    if header[:4] in (b"RIFF", b"RIFX", b"RF64") and header[8:12] == b"WAVE":
+        return _sniff_wav(header)
+    if header[:4] == b"fLaC":
+        return _sniff_flac(header)
+    if header[:4] == b"OggS":
+        return _sniff_ogg(header)
+    if header[4:8] == b"ftyp":
+        return _sniff_mp4(header)
+    if header[:4] == b"FORM" and header[8:12] in (b"AIFF", b"AIFC"):
+        return _sniff_aiff(header)
+    probe = _sniff_mpeg(header, file_size)
+    if probe:
+        return probe
+    raise AudioValidationError("unsupported", f"Формат аудио не распознан: {header[:12]!r}")
+
+
+def _unsupported_codec(container: str, codec) -> AudioValidationError:
+    return AudioValidationError("unsupported", f"Кодек {codec} в {container} не поддерживается")
+
+
+def _sniff_wav(header: bytes) -> Dict:
+    order = "big" if header[:4] == b"RIFX" else "little"
+    codec, byte_rate, duration = None, 0, None
+    pos = 12
+    while pos + 8 <= len(header):
+        chunk_id, size = header[pos:pos + 4], int.from_bytes(header[pos + 4:pos + 8], order)
+        body = header[pos + 8:pos + 8 + size]
+        if chunk_id == b"fmt " and len(body) >= 16:
+            format_tag = int.from_bytes(body[0:2], order)
+            if format_tag == WAV_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE: кодек в первых байтах GUID подформата
+                format_tag = int.from_bytes(body[24:26], order)
+            if format_tag not in WAV_FORMAT_CODECS:
+                raise _unsupported_codec("WAV", hex(format_tag))
+            codec, byte_rate = WAV_FORMAT_CODECS[format_tag], int.from_bytes(body[8:12], order)
+        elif chunk_id == b"data":
+            # 0xFFFFFFFF - размер в чанке ds64 (RF64) или неизвестен (потоковая запись)
+            if byte_rate and 0 < size < 0xFFFFFFFF:
+                duration = round(size / byte_rate, 1)
+            break
+        pos += 8 + size + (size & 1)
+    return {"container": "wav", "codec": codec, "duration": duration}
+
+
+def _sniff_flac(header: bytes) -> Dict:
+    duration = None
+    # Первый блок метаданных - STREAMINFO: частота (20 бит) и число сэмплов (36 бит)
+    if len(header) >= 26 and header[4] & 0x7F == 0:
+        fields = int.from_bytes(header[18:26], "big")
+        sample_rate, total_samples = fields >> 44, fields & ((1 << 36) - 1)
+        if sample_rate and total_samples:
+            duration = round(total_samples / sample_rate, 1)
+    return {"container": "flac", "codec": "flac", "duration": duration}
+
+
+def _sniff_ogg(header: bytes) -> Dict:
+    # Первая страница содержит только заголовок кодека: пакет начинается после таблицы сегментов
+    segments = header[26] if len(header) > 26 else 0
+    packet = header[27 + segments:27 + segments + 8]
+    for signature, codec in OGG_CODECS.items():
+        if packet.startswith(signature):
+            if codec is None:
+                raise _unsupported_codec("OGG", signature.strip(b"\x01\x7f\x80 ").decode())
+            return {"container": "ogg", "codec": codec, "duration": None}
+    raise _unsupported_codec("OGG", packet[:8])
+
+
+def _sniff_mp4(header: bytes) -> Dict:
+    codec, duration = None, None
+    pos = 0
+    while pos + 8 <= len(header):
+        size, box = int.from_bytes(header[pos:pos + 4], "big"), header[pos + 4:pos + 8]
+        if size == 1 and pos + 16 <= len(header):
+            size = int.from_bytes(header[pos + 8:pos + 16], "big")
+        if size < 8:
+            break
+        if box == b"moov":
+            # moov в начале файла (faststart): длительность из mvhd, кодеки из описаний дорожек
+            moov = header[pos:pos + size]
+            codec = next((name for tag, name in MP4_AUDIO_CODECS.items() if tag in moov), None)
+            if codec is None and len(moov) == size:
+                raise AudioValidationError("unsupported", "В MP4 нет аудиодорожки")
+            duration = _mvhd_duration(moov)
+            break
+        pos += size
+    return {"container": "mp4", "codec": codec, "duration": duration}
+
+
+def _mvhd_duration(moov: bytes) -> Optional[float]:
+    index = moov.find(b"mvhd")
+    if index < 0:
+        return None
+    body = moov[index + 4:]
+    if body[:1] == b"\x01" and len(body) >= 36:
+        timescale, duration = int.from_bytes(body[20:24], "big"), int.from_bytes(body[24:32], "big")
+    elif len(body) >= 20:
+        timescale, duration = int.from_bytes(body[12:16], "big"), int.from_bytes(body[16:20], "big")
+    else:
+        return None
+    return round(duration / timescale, 1) if timescale else None
+
+
+def _sniff_aiff(header: bytes) -> Dict:
+    codec, duration = "pcm", None
+    pos = 12
+    while pos + 8 <= len(header):
+        chunk_id, size = header[pos:pos + 4], int.from_bytes(header[pos + 4:pos + 8], "big")
+        if chunk_id == b"COMM":
+            body = header[pos + 8:pos + 8 + size]
+            if header[8:12] == b"AIFC" and len(body) >= 22:
+                if body[18:22] not in AIFC_COMPRESSIONS:
+                    raise _unsupported_codec("AIFC", body[18:22])
+                codec = body[18:22].decode(errors="replace").strip().lower()
+            if len(body) >= 18:
+                # Частота - 80-битное число с плавающей точкой
+                exponent = int.from_bytes(body[8:10], "big") & 0x7FFF
+                sample_rate = int.from_bytes(body[10:18], "big") * 2.0 ** (exponent - 16383 - 63)
+                frames = int.from_bytes(body[2:6], "big")
+                if sample_rate >= 1 and frames:
+                    duration = round(frames / sample_rate, 1)
+            break
+        pos += 8 + size + (size & 1)
+    return {"container": "aiff", "codec": codec, "duration": duration}
+
+
+def _mpeg_frame(header: bytes, pos: int) -> Optional[Dict]:
+    """Параметры MPEG-кадра с заголовком в позиции pos или None, если заголовок недействителен."""
+    if pos + 4 > len(header) or header[pos] != 0xFF or header[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (header[pos + 1] >> 3) & 0x03  # 3 - MPEG-1, 2 - MPEG-2, 0 - MPEG-2.5
+    layer = 4 - ((header[pos + 1] >> 1) & 0x03)
+    bitrate_index, rate_index = header[pos + 2] >> 4, (header[pos + 2] >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MPEG_SAMPLE_RATES[version][rate_index]
+    padding = (header[pos + 2] >> 1) & 0x01
+    samples = 384 if layer == 1 else (1152 if mpeg1 or layer == 2 else 576)
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {"version": version, "layer": layer, "bitrate": bitrate, "sample_rate": sample_rate,
+            "samples": samples, "length": length, "mono": header[pos + 3] >> 6 == 3}
+
+
+def _mpeg_frame_chain(header: bytes, pos: int) -> List[Dict]:
+    """Кадры подряд с позиции pos (не больше MPEG_SYNC_FRAMES) с теми же версией, слоем и частотой."""
+    frames = []
+    while len(frames) < MPEG_SYNC_FRAMES:
+        frame = _mpeg_frame(header, pos)
+        if not frame or (frames and (frame["version"], frame["layer"], frame["sample_rate"]) != (
+                frames[0]["version"], frames[0]["layer"], frames[0]["sample_rate"])):
+            break
+        frames.append(frame)
+        pos += frame["length"]
+    return frames
+
+
+def _sniff_mpeg(header: bytes, file_size: Optional[int]) -> Optional[Dict]:
+    """MP3/MP2: MPEG_SYNC_FRAMES кадров подряд (или цепочка до конца файла, если он короче окна)."""
+    whole_file = file_size is not None and len(header) >= file_size
+    pos = header.find(b"\xff")
+    while 0 <= pos < len(header) - 4:
+        frames = _mpeg_frame_chain(header, pos)
+        end = pos + sum(frame["length"] for frame in frames)
+        if len(frames) == MPEG_SYNC_FRAMES or (frames and whole_file and end + 4 > len(header)):
+            break
+        pos = header.find(b"\xff", pos + 1)
+    else:
+        return None
+
+    frame = frames[0]
+    codec = {1: "mp1", 2: "mp2", 3: "mp3"}[frame["layer"]]
+    duration = None
+    # Заголовок Xing/Info (VBR) после side info первого кадра: число кадров
+    side_info = (17 if frame["mono"] else 32) if frame["version"] == 3 else (9 if frame["mono"] else 17)
+    xing = pos + 4 + side_info
+    if header[xing:xing + 4] in (b"Xing", b"Info") and len(header) >= xing + 12 and header[xing + 7] & 0x01:
+        frames = int.from_bytes(header[xing + 8:xing + 12], "big")
+        duration = round(frames * frame["samples"] / frame["sample_rate"], 1)
+    elif header[pos + 36:pos + 40] == b"VBRI":
+        frames = int.from_bytes(header[pos + 50:pos + 54], "big")
+        duration = round(frames * frame["samples"] / frame["sample_rate"], 1)
+    elif file_size and len({frame["bitrate"] for frame in frames[1:]}) == 1:
+        # Без заголовка VBR и с одинаковым битрейтом кадров - CBR: длительность по размеру и битрейту
+        duration = round((file_size - pos) * 8 / frame["bitrate"], 1)
+    return {"container": "mp3", "codec": codec, "duration": duration}
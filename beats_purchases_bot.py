@@ -25,17 +25,10 @@ main_bot = None
 if MAIN_BOT_TOKEN:
     try:
         from aiogram import Bot
-        from aiogram.client.session.aiohttp import AiohttpSession
+        from http_sessions import create_session
         
-        # Используем те же настройки таймаутов и прокси
-        PROXY_URL = os.getenv("PROXY_URL", None)
-        if PROXY_URL:
-            main_session = AiohttpSession(proxy=PROXY_URL)
-            main_session.timeout = 60
-        else:
-            main_session = AiohttpSession()
-            main_session.timeout = 60
-        main_bot = Bot(token=MAIN_BOT_TOKEN, session=main_session)
+        # Отдельная HTTP-сессия для основного бота (настройки в http_sessions.py)
+        main_bot = Bot(token=MAIN_BOT_TOKEN, session=create_session("main"))
         logging.info("Основной бот инициализирован для отправки сообщений клиентам.")
     except Exception as e:
         logging.error(f"Ошибка инициализации основного бота: {e}")
@@ -43,21 +36,11 @@ if MAIN_BOT_TOKEN:
 if not PURCHASES_BOT_TOKEN:
     raise ValueError("PURCHASES_BOT_TOKEN не найден в .env файле")
 
-# Настройки прокси (если Telegram заблокирован, укажите в .env)
-PROXY_URL = os.getenv("PROXY_URL", None)
-
-# Настройки таймаутов (увеличены для нестабильных соединений)
-from aiogram.client.session.aiohttp import AiohttpSession
+# Настройки прокси, таймаутов и пулов соединений находятся в http_sessions.py
+from http_sessions import create_session
+from render_cache import cached_render
 
-# Создаем сессию с увеличенными таймаутами
-if PROXY_URL:
-    session = AiohttpSession(proxy=PROXY_URL)
-    session.timeout = 60  # Устанавливаем таймаут как число (в секундах)
-else:
-    session = AiohttpSession()
-    session.timeout = 60  # Устанавливаем таймаут как число (в секундах)
-
-bot = Bot(token=PURCHASES_BOT_TOKEN, session=session)
+bot = Bot(token=PURCHASES_BOT_TOKEN, session=create_session("purchases"))
 dp = Dispatcher()
 
 # ID чата, куда будут приходить покупки
@@ -738,6 +721,7 @@ def format_compact_button_text(purchase: dict, emoji: str = "") -> str:
     purchase_num = format_purchase_number(purchase["id"], purchase.get("created_at"))
     return f"{emoji}{purchase_num}"
     
+@cached_render("purchase")
 def format_purchase_message(purchase: dict) -> str:
     """Форматирует сообщение о покупке."""
     from datetime import datetime
@@ -803,6 +787,7 @@ def format_purchase_message(purchase: dict) -> str:
     
     return text
 
+@cached_render("purchase")
 def get_purchase_keyboard(purchase: dict) -> InlineKeyboardMarkup:
     """Создает клавиатуру для управления покупкой."""
     buttons = []
@@ -1971,7 +1956,11 @@ async def main():
     await init_db()
     
     logging.info("Запуск бота для покупок...")
-    await dp.start_polling(bot)
+    from webhook_server import is_webhook_enabled, run_webhook
+    if is_webhook_enabled():
+        await run_webhook(dp, bot, "purchases")
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
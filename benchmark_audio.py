@@ -0,0 +1,486 @@
+"""
+Бенчмарки и проверка точности анализа аудио.
+
+Запуск:
+    python benchmark_audio.py suite [--quick] [--baseline файл.json] [--save-baseline файл.json]
+    python benchmark_audio.py autocorr [файлы...]
+    python benchmark_audio.py startup [--top N]
+
+suite - синтетический корпус (клики, барабанные лупы, пэды с аккордами) с известными BPM
+и тональностью в нескольких форматах и длительностях. Для каждой точки входа
+(analyze_bpm, analyze_bpm_fast, analyze_key_bpm, fix_bpm) печатает перцентили задержки,
+пиковый RSS процесса и точность, включая октавные ошибки BPM; для analyze_bpm_fast (первый
+этап Key & BPM) - еще долю файлов, где быстрая оценка BPM окончательная (bpm_final). С --baseline завершается с кодом 1,
+если задержка или память выросли больше чем на --max-regression, а точность упала
+больше чем на --max-accuracy-drop.
+
+autocorr - сравнение автокорреляции onset-огибающей через FFT (audio_analysis.autocorr_bpm)
+с прежней реализацией (np.correlate mode='full' + поиск пиков циклом): время на огибающих
+длиной 30 секунд и целого трека, и совпадение BPM на синтетическом корпусе и на переданных файлах.
+
+startup - время импорта elementBot (python -X importtime в отдельном процессе), самые тяжелые
+модули, RSS после импорта и какие из тяжелых пакетов (librosa, numpy, scipy, openai, ...)
+загружены в процесс бота. Анализ аудио и AI-клиент должны загружаться только при первом обращении.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_analysis import BPM_MAX, BPM_MIN, HOP_LENGTH, ANALYSIS_SAMPLE_RATE, autocorr_bpm
+
+FRAME_RATE = ANALYSIS_SAMPLE_RATE / HOP_LENGTH
+
+
+def reference_autocorr_bpm(onset_env: np.ndarray, frame_rate: float):
+    """Прежняя реализация метода 2 из analyze_bpm (эталон для сравнения)."""
+    onset_strength_norm = (onset_env - np.mean(onset_env)) / (np.std(onset_env) + 1e-10)
+    autocorr = np.correlate(onset_strength_norm, onset_strength_norm, mode='full')
+    autocorr = autocorr[len(autocorr)//2:]
+    min_period_frames = int(frame_rate * 60 / BPM_MAX)
+    max_period_frames = int(frame_rate * 60 / BPM_MIN)
+    if max_period_frames < len(autocorr) and min_period_frames < max_period_frames:
+        autocorr_range = autocorr[min_period_frames:max_period_frames]
+        if len(autocorr_range) > 0:
+            threshold = np.max(autocorr_range) * 0.5
+            peaks = []
+            for i in range(1, len(autocorr_range) - 1):
+                if (autocorr_range[i] > autocorr_range[i-1] and
+                        autocorr_range[i] > autocorr_range[i+1] and
+                        autocorr_range[i] > threshold):
+                    peaks.append((i, autocorr_range[i]))
+            if len(peaks) > 0:
+                peaks.sort(key=lambda x: x[1], reverse=True)
+                period_frames = peaks[0][0] + min_period_frames
+                return 60.0 / (period_frames / frame_rate)
+    return None
+
+
+def synthetic_onset_env(bpm: float, seconds: float, rng: np.random.RandomState) -> np.ndarray:
+    """Onset-огибающая трека с заданным темпом: удары с небольшим джиттером, офбиты и шум."""
+    n = int(seconds * FRAME_RATE)
+    env = rng.rand(n) * 0.3
+    period = FRAME_RATE * 60 / bpm
+    beat = 0
+    while True:
+        pos = int(round(beat * period + rng.randn() * 0.5))
+        if pos >= n:
+            break
+        if pos >= 0:
+            env[pos] += 1.0 + rng.rand() * 0.5
+        off = int(round((beat + 0.5) * period))
+        if off < n:
+            env[off] += rng.rand() * 0.4
+        beat += 1
+    return env
+
+
+def _time(func, *args, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_autocorr(files: list) -> int:
+    rng = np.random.RandomState(42)
+
+    print(f"Время (лучшее из повторов), frame_rate={FRAME_RATE:.1f}:")
+    for label, seconds, repeat in (("30 s", 30, 20), ("3 min", 180, 5), ("10 min", 600, 3)):
+        env = synthetic_onset_env(128, seconds, rng)
+        old = _time(reference_autocorr_bpm, env, FRAME_RATE, repeat=repeat)
+        new = _time(autocorr_bpm, env, FRAME_RATE, repeat=repeat)
+        print(f"  {label:>6} ({len(env)} кадров): np.correlate {old * 1000:8.2f} ms, "
+              f"FFT {new * 1000:7.2f} ms, ускорение x{old / new:.1f}")
+
+    mismatches = 0
+    corpus = [(bpm, seconds) for bpm in range(70, 191, 3) for seconds in (30, 180)]
+    for bpm, seconds in corpus:
+        env = synthetic_onset_env(bpm, seconds, rng)
+        old, new = reference_autocorr_bpm(env, FRAME_RATE), autocorr_bpm(env, FRAME_RATE)
+        if old != new and (old is None or new is None or abs(old - new) > 1e-6):
+            mismatches += 1
+            print(f"  расхождение: bpm={bpm}, {seconds} s: {old} != {new}")
+    print(f"Синтетический корпус: {len(corpus) - mismatches}/{len(corpus)} совпадений")
+
+    if files:
+        from audio_analysis import extract_features, load_audio
+        for path in files:
+            features = extract_features(*load_audio(path))
+            old = reference_autocorr_bpm(features["onset_env"], features["frame_rate"])
+            new = autocorr_bpm(features["onset_env"], features["frame_rate"])
+            same = old == new or (old is not None and new is not None and abs(old - new) <= 1e-6)
+            mismatches += 0 if same else 1
+            print(f"  {path}: {old} / {new} {'OK' if same else 'РАСХОЖДЕНИЕ'}")
+    return 1 if mismatches else 0
+
+
+# --- Синтетический корпус ---
+CORPUS_SAMPLE_RATE = 44100
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Ступени аккордов (от тоники, в полутонах): I-vi-IV-V и i-VI-III-VII
+PROGRESSIONS = {
+    "major": [(0, 4, 7), (9, 12, 16), (5, 9, 12), (7, 11, 14)],
+    "minor": [(0, 3, 7), (8, 12, 15), (3, 7, 10), (10, 14, 17)],
+}
+# (вид, BPM, тональность или None, формат, длительность)
+FULL_CORPUS = [
+    ("click", 85, None, "WAV", 30), ("click", 128, None, "MP3", 30), ("click", 174, None, "OGG", 30),
+    ("drums", 92, None, "FLAC", 30), ("drums", 140, None, "WAV", 120), ("drums", 160, None, "MP3", 60),
+    ("pad", 100, "C major", "WAV", 60), ("pad", 120, "A minor", "MP3", 30), ("pad", 128, "F# major", "OGG", 60),
+    ("pad", 140, "D minor", "FLAC", 120), ("pad", 95, "G major", "MP3", 60), ("pad", 150, "E minor", "WAV", 30),
+    ("pad", 110, "A# major", "FLAC", 30), ("pad", 86, "C# minor", "OGG", 60),
+]
+QUICK_CORPUS = [FULL_CORPUS[i] for i in (0, 4, 6, 7, 9)]
+CORPUS_WRITE_BLOCK = 65536  # Кадров за одну запись при кодировании корпуса
+
+
+def _tone(freq: float, t: np.ndarray) -> np.ndarray:
+    """Нота с несколькими гармониками (пэд)."""
+    return sum(np.sin(2 * np.pi * freq * h * t) / h for h in (1, 2, 3, 4))
+
+
+def _hit(kind: str, sr: int, rng: np.random.RandomState) -> np.ndarray:
+    """Один удар: бочка, малый барабан, хэт или клик."""
+    if kind == "kick":
+        t = np.arange(int(0.25 * sr)) / sr
+        return np.sin(2 * np.pi * (50 + 80 * np.exp(-t * 30)) * t) * np.exp(-t * 12)
+    if kind == "snare":
+        t = np.arange(int(0.15 * sr)) / sr
+        return 0.6 * rng.randn(len(t)) * np.exp(-t * 25) + 0.3 * np.sin(2 * np.pi * 190 * t) * np.exp(-t * 20)
+    if kind == "hat":
+        t = np.arange(int(0.04 * sr)) / sr
+        return 0.25 * np.diff(rng.randn(len(t) + 1)) * np.exp(-t * 90)
+    t = np.arange(int(0.01 * sr)) / sr
+    return np.sin(2 * np.pi * 1500 * t) * np.exp(-t * 400)
+
+
+def synthesize(kind: str, bpm: float, key: str, seconds: float, sr: int = CORPUS_SAMPLE_RATE,
+               seed: int = 0) -> np.ndarray:
+    """Синтетический трек: клики, барабанный луп или пэд с аккордами поверх барабанов."""
+    rng = np.random.RandomState(seed)
+    n = int(seconds * sr)
+    y = np.zeros(n)
+    beat = 60.0 / bpm
+
+    def place(hit: np.ndarray, at: float, gain: float = 1.0):
+        start = int(at * sr)
+        if start < n:
+            end = min(n, start + len(hit))
+            y[start:end] += gain * hit[:end - start]
+
+    steps = int(seconds / (beat / 2))
+    for step in range(steps):
+        at = step * beat / 2
+        if kind == "click":
+            if step % 2 == 0:
+                place(_hit("click", sr, rng), at, 1.0 if step % 8 == 0 else 0.6)
+            continue
+        if step % 8 in (0, 4) or (step % 16 == 11):
+            place(_hit("kick", sr, rng), at)
+        if step % 8 in (2, 6):
+            place(_hit("snare", sr, rng), at, 0.8)
+        place(_hit("hat", sr, rng), at, 0.5 if step % 2 else 0.8)
+
+    if kind == "pad":
+        tonic, mode = key.split()
+        root = 130.81 * 2 ** (PITCH_CLASSES.index(tonic) / 12)
+        bar = 4 * beat
+        for bar_index in range(int(seconds / bar) + 1):
+            chord = PROGRESSIONS[mode][bar_index % 4]
+            start, end = int(bar_index * bar * sr), min(n, int((bar_index + 1) * bar * sr))
+            if start >= n:
+                break
+            t = np.arange(end - start) / sr
+            envelope = np.minimum(1.0, t / 0.05) * np.minimum(1.0, (t[-1] - t) / 0.05 + 1e-3)
+            pad = sum(_tone(root * 2 ** (semitone / 12), t) for semitone in chord)
+            # Тоника в басу, чтобы тональность была однозначной
+            pad += 0.8 * _tone(root / 2 * 2 ** (chord[0] / 12), t)
+            y[start:end] += 0.12 * envelope * pad
+
+    y /= np.max(np.abs(y)) + 1e-9
+    return (0.8 * y).astype(np.float32)
+
+
+def build_corpus(quick: bool = False) -> list:
+    """Корпус в памяти: [{"name", "kind", "bpm", "key", "format", "seconds", "data"}]."""
+    import soundfile as sf
+
+    corpus = []
+    for index, (kind, bpm, key, fmt, seconds) in enumerate(QUICK_CORPUS if quick else FULL_CORPUS):
+        y = synthesize(kind, bpm, key, seconds, seed=index)
+        buffer = io.BytesIO()
+        # Блоками: кодер Vorbis в libsndfile 1.2 падает (segfault) на одной большой записи
+        with sf.SoundFile(buffer, "w", CORPUS_SAMPLE_RATE, 1, format=fmt) as f:
+            for start in range(0, len(y), CORPUS_WRITE_BLOCK):
+                f.write(y[start:start + CORPUS_WRITE_BLOCK])
+        corpus.append({
+            "name": f"{kind}_{bpm}_{(key or 'nokey').replace(' ', '_').replace('#', 's')}_{seconds}s.{fmt.lower()}",
+            "kind": kind, "bpm": bpm, "key": key, "format": fmt, "seconds": seconds, "data": buffer.getvalue(),
+        })
+    return corpus
+
+
+# --- Оценка точности ---
+def classify_bpm(detected: float, expected: float) -> str:
+    """'exact' (±1 BPM), 'octave' (x2, x1/2, x3/2, x2/3) или 'wrong'."""
+    if abs(detected - expected) <= 1:
+        return "exact"
+    ratio = detected / expected
+    if any(abs(ratio - octave) <= 0.03 * octave for octave in (2.0, 0.5, 1.5, 2 / 3)):
+        return "octave"
+    return "wrong"
+
+
+def classify_key(detected: str, expected: str) -> str:
+    """'exact', 'relative' (параллельный мажор/минор), 'fifth' (соседняя по квинте) или 'wrong'."""
+    if detected == expected:
+        return "exact"
+    d_tonic, d_mode = detected.split()
+    e_tonic, e_mode = expected.split()
+    d_index, e_index = PITCH_CLASSES.index(d_tonic), PITCH_CLASSES.index(e_tonic)
+    if d_mode != e_mode:
+        shift = 9 if e_mode == "major" else 3
+        if d_index == (e_index + shift) % 12:
+            return "relative"
+    elif (d_index - e_index) % 12 in (5, 7):
+        return "fifth"
+    return "wrong"
+
+
+# Ожидаемые значения fix_bpm (текущее поведение) и проверка диапазона на развертке
+FIX_BPM_CASES = [(128, 128), (60, 120), (45, 90), (200, 100), (240, 120), (400, 133.33), (30, 90), (800, 180)]
+
+
+def _percentiles(values: list) -> dict:
+    values = np.array(values) * 1000
+    return {"p50_ms": float(np.percentile(values, 50)), "p90_ms": float(np.percentile(values, 90)),
+            "max_ms": float(values.max())}
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss в Linux - килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_entry_point(name: str, corpus: list) -> dict:
+    """Выполняется в отдельном процессе, чтобы пиковый RSS относился к одной точке входа."""
+    import audio_analysis
+
+    rss_after_import = _max_rss_mb()
+    report = {"rss_after_import_mb": rss_after_import}
+
+    if name == "fix_bpm":
+        sweep = np.linspace(1, 1000, 20000)
+        start = time.perf_counter()
+        outputs = [audio_analysis.fix_bpm(float(bpm)) for bpm in sweep]
+        report["per_call_us"] = (time.perf_counter() - start) / len(sweep) * 1e6
+        in_range = sum(1 for bpm in outputs if audio_analysis.BPM_MIN <= bpm <= audio_analysis.BPM_MAX)
+        correct = sum(1 for bpm, expected in FIX_BPM_CASES
+                      if abs(audio_analysis.fix_bpm(bpm) - expected) < 0.01)
+        report["accuracy"] = {"cases": correct / len(FIX_BPM_CASES), "in_range": in_range / len(sweep)}
+        report["peak_rss_mb"] = _max_rss_mb()
+        return report
+
+    func = getattr(audio_analysis, name)
+    # Первый вызов отдельно: компиляция numba-ядер librosa
+    start = time.perf_counter()
+    func(corpus[0]["data"])
+    report["first_call_ms"] = (time.perf_counter() - start) * 1000
+
+    timings, bpm_classes, key_classes, rows, finals = [], [], [], [], []
+    for item in corpus:
+        start = time.perf_counter()
+        result = func(item["data"])
+        timings.append(time.perf_counter() - start)
+        if name == "analyze_bpm_fast":
+            bpm = result["bpm"]
+            finals.append(result["final"])
+        else:
+            bpm = result if name == "analyze_bpm" else result[1]
+        bpm_class = classify_bpm(bpm, item["bpm"])
+        bpm_classes.append(bpm_class)
+        row = {"name": item["name"], "bpm": bpm, "bpm_class": bpm_class, "ms": timings[-1] * 1000}
+        if name == "analyze_key_bpm" and item["key"]:
+            key_class = classify_key(result[0], item["key"])
+            key_classes.append(key_class)
+            row.update(key=result[0], key_class=key_class)
+        rows.append(row)
+
+    report.update(_percentiles(timings))
+    report["accuracy"] = {
+        "bpm": bpm_classes.count("exact") / len(bpm_classes),
+        "bpm_octave_errors": bpm_classes.count("octave") / len(bpm_classes),
+    }
+    if finals:
+        report["accuracy"]["bpm_final"] = sum(finals) / len(finals)
+    if key_classes:
+        report["accuracy"]["key"] = key_classes.count("exact") / len(key_classes)
+        report["accuracy"]["key_close"] = sum(1 for c in key_classes if c != "wrong") / len(key_classes)
+    report["rows"] = rows
+    report["peak_rss_mb"] = _max_rss_mb()
+    return report
+
+
+ENTRY_POINTS = ("fix_bpm", "analyze_bpm", "analyze_bpm_fast", "analyze_key_bpm")
+
+
+def run_suite(quick: bool) -> dict:
+    corpus = build_corpus(quick)
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in ENTRY_POINTS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(_run_entry_point, name, corpus).result()
+    return results
+
+
+def print_report(results: dict):
+    for name, report in results.items():
+        print(f"\n== {name} ==")
+        if "per_call_us" in report:
+            print(f"  {report['per_call_us']:.2f} us на вызов")
+        else:
+            print(f"  первый вызов {report['first_call_ms']:.0f} ms; p50 {report['p50_ms']:.0f} ms, "
+                  f"p90 {report['p90_ms']:.0f} ms, max {report['max_ms']:.0f} ms")
+        print(f"  RSS: {report['rss_after_import_mb']:.0f} MB после импорта, пик {report['peak_rss_mb']:.0f} MB")
+        print("  точность: " + ", ".join(f"{k}={v:.0%}" for k, v in report["accuracy"].items()))
+        for row in report.get("rows", []):
+            key_text = f"  key {row['key']} ({row['key_class']})" if "key" in row else ""
+            print(f"    {row['name']:<36} bpm {row['bpm']:>3} ({row['bpm_class']}){key_text}  {row['ms']:.0f} ms")
+
+
+def check_regressions(results: dict, baseline: dict, max_regression: float, max_accuracy_drop: float) -> list:
+    """Список регрессий относительно сохраненного прогона."""
+    problems = []
+    for name, report in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p90_ms", "per_call_us", "peak_rss_mb"):
+            if metric in report and metric in base and report[metric] > base[metric] * (1 + max_regression):
+                problems.append(f"{name}.{metric}: {report[metric]:.1f} > {base[metric]:.1f} "
+                                f"(+{max_regression:.0%})")
+        for metric, value in report["accuracy"].items():
+            base_value = base.get("accuracy", {}).get(metric)
+            if base_value is None:
+                continue
+            # Октавных ошибок должно быть не больше, остальных метрик - не меньше
+            worse = value - base_value if metric == "bpm_octave_errors" else base_value - value
+            if worse > max_accuracy_drop:
+                problems.append(f"{name}.accuracy.{metric}: {value:.0%} (было {base_value:.0%})")
+    return problems
+
+
+def bench_suite(args) -> int:
+    results = run_suite(args.quick)
+    print_report(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({name: {k: v for k, v in report.items() if k != "rows"} for name, report in results.items()},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline сохранен: {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = check_regressions(results, baseline, args.max_regression, args.max_accuracy_drop)
+        if problems:
+            print("\nРЕГРЕССИИ:")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+        print("\nРегрессий нет")
+    return 0
+
+
+# Пакеты, которые не должны загружаться при запуске бота
+STARTUP_HEAVY_MODULES = ("librosa", "numpy", "scipy", "numba", "soundfile", "openai", "httpx")
+
+STARTUP_PROBE = (
+    "import resource, sys, time\n"
+    "t = time.perf_counter()\n"
+    "import elementBot\n"
+    "print('STARTUP', time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,\n"
+    "      ','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)\n"
+)
+
+
+def bench_startup(top: int) -> int:
+    """Импортирует elementBot в чистом процессе и печатает, на что уходит время запуска."""
+    env = dict(os.environ)
+    # Токен нужен только для создания объекта Bot, к Telegram импорт не обращается
+    env.setdefault("TOKEN", "123456789:AAStartupBenchmarkTokenxxxxxxxxxxxx")
+    probe = STARTUP_PROBE.format(heavy=STARTUP_HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], env=env,
+                               cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr[-2000:])
+        return 1
+
+    modules, summary = [], None
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            # Вложенность показана отступом в 2 пробела; глубина 1 - то, что импортирует сам elementBot
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if cumulative.strip().isdigit() and (depth == 1 or name.strip() in STARTUP_HEAVY_MODULES):
+                modules.append((int(cumulative) / 1000, name.strip()))
+        elif line.startswith("STARTUP"):
+            summary = line.split(" ", 3)
+
+    if summary is None:
+        print("Не удалось получить результат импорта")
+        return 1
+    _, seconds, rss, loaded = summary + [""] * (4 - len(summary))
+    print(f"Импорт elementBot: {float(seconds):.2f} с, RSS {float(rss):.0f} МБ")
+    print(f"Тяжелые пакеты в процессе бота: {loaded.strip() or 'нет'}")
+    print("\nСамые долгие импорты (накопительно, мс):")
+    seen = set()
+    for ms, name in sorted(modules, reverse=True):
+        if name in seen:
+            continue
+        seen.add(name)
+        print(f"  {ms:>8.1f}  {name}")
+        if len(seen) >= top:
+            break
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки анализа аудио")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    suite_parser = subparsers.add_parser("suite", help="Задержка, память и точность на синтетическом корпусе")
+    suite_parser.add_argument("--quick", action="store_true", help="Маленький корпус (5 файлов)")
+    suite_parser.add_argument("--baseline", help="Сравнить с сохраненным прогоном (JSON)")
+    suite_parser.add_argument("--save-baseline", help="Сохранить результаты как baseline (JSON)")
+    suite_parser.add_argument("--max-regression", type=float, default=0.25,
+                              help="Допустимый рост задержки и памяти (доля, по умолчанию 0.25)")
+    suite_parser.add_argument("--max-accuracy-drop", type=float, default=0.0,
+                              help="Допустимое падение точности (доля, по умолчанию 0)")
+    autocorr_parser = subparsers.add_parser("autocorr", help="FFT-автокорреляция против np.correlate")
+    autocorr_parser.add_argument("files", nargs="*", help="Аудиофайлы для проверки совпадения BPM")
+    startup_parser = subparsers.add_parser("startup", help="Время импорта и тяжелые модули при запуске бота")
+    startup_parser.add_argument("--top", type=int, default=15, help="Сколько самых долгих импортов показать")
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        return bench_suite(args)
+    if args.command == "autocorr":
+        return bench_autocorr(args.files)
+    if args.command == "startup":
+        return bench_startup(args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
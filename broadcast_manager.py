@@ -0,0 +1,295 @@
+"""
+Модуль для рассылок сообщений пользователям.
+Задания рассылки и статус каждого получателя хранятся в SQLite, поэтому рассылку
+можно поставить на паузу, продолжить и она автоматически продолжается после перезапуска бота.
+Сообщения отправляются параллельно, скорость ограничивает общий лимитер (rate_limiter.py).
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from database import get_db
+
+# Сколько сообщений рассылки отправляется одновременно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+# Как часто обновлять сообщение с прогрессом у админа (секунды)
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))
+# Сколько получателей загружать из БД за раз и как часто сохранять результаты
+BROADCAST_BATCH_SIZE = 50
+
+# Запущенные рассылки: job_id -> asyncio.Task
+_running_jobs: Dict[int, asyncio.Task] = {}
+
+
+# ========== Работа с БД ==========
+
+async def get_broadcast_audience() -> List[int]:
+    """Возвращает список user_id для рассылки (все пользователи, не заблокировавшие бота)."""
+    from users_manager import get_active_audience
+    return await get_active_audience()
+
+
+async def create_broadcast_job(admin_chat_id: int, user_ids: List[int], text: str = None,
+                               parse_mode: str = None, source_chat_id: int = None,
+                               source_message_id: int = None) -> Dict:
+    """
+    Создает задание рассылки и список получателей.
+
+    Args:
+        admin_chat_id: Чат админа, куда выводится прогресс
+        user_ids: Получатели
+        text: Текст сообщения (для текстовой рассылки)
+        parse_mode: Режим разметки текста ('HTML' или None)
+        source_chat_id: Чат исходного сообщения (для рассылки копии сообщения с медиа)
+        source_message_id: ID исходного сообщения
+    """
+    db = await get_db()
+    try:
+        created_at = datetime.now().isoformat()
+        payload_type = "copy" if source_message_id else "text"
+        cursor = await db.execute("""
+            INSERT INTO broadcast_jobs (admin_chat_id, payload_type, text, parse_mode, source_chat_id,
+                                        source_message_id, status, total, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'running', ?, ?)
+        """, (admin_chat_id, payload_type, text, parse_mode, source_chat_id, source_message_id,
+              len(user_ids), created_at))
+        job_id = cursor.lastrowid
+        await db.executemany(
+            "INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id, status) VALUES (?, ?, 'pending')",
+            [(job_id, user_id) for user_id in user_ids]
+        )
+        await db.commit()
+        return await _get_job(db, job_id)
+    except Exception as e:
+        logging.error(f"Ошибка создания рассылки: {e}")
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
+
+
+async def _get_job(db, job_id: int) -> Optional[Dict]:
+    cursor = await db.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+    row = await cursor.fetchone()
+    return dict(row) if row else None
+
+
+async def get_broadcast_job(job_id: int) -> Optional[Dict]:
+    """Возвращает задание рассылки по ID."""
+    db = await get_db()
+    try:
+        return await _get_job(db, job_id)
+    finally:
+        await db.close()
+
+
+async def get_recent_broadcast_jobs(limit: int = 5) -> List[Dict]:
+    """Возвращает последние задания рассылки."""
+    db = await get_db()
+    try:
+        cursor = await db.execute("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limit,))
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        await db.close()
+
+
+async def set_broadcast_job_status(job_id: int, status: str, **kwargs) -> bool:
+    """Меняет статус задания ('running', 'paused', 'completed', 'cancelled')."""
+    db = await get_db()
+    try:
+        updates = ["status = ?"]
+        values = [status]
+        if status in ("completed", "cancelled"):
+            updates.append("finished_at = ?")
+            values.append(datetime.now().isoformat())
+        for key, value in kwargs.items():
+            if key in ["progress_message_id"]:
+                updates.append(f"{key} = ?")
+                values.append(value)
+        values.append(job_id)
+        cursor = await db.execute(f"UPDATE broadcast_jobs SET {', '.join(updates)} WHERE id = ?", values)
+        await db.commit()
+        return cursor.rowcount > 0
+    finally:
+        await db.close()
+
+
+async def _fetch_pending_recipients(job_id: int, limit: int) -> List[int]:
+    db = await get_db()
+    try:
+        cursor = await db.execute("""
+            SELECT user_id FROM broadcast_recipients
+            WHERE job_id = ? AND status = 'pending'
+            LIMIT ?
+        """, (job_id, limit))
+        rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+    finally:
+        await db.close()
+
+
+async def _save_results(job_id: int, results: List[tuple]):
+    """Сохраняет результаты отправки [(user_id, status, error)] и обновляет счетчики задания."""
+    if not results:
+        return
+    db = await get_db()
+    try:
+        now = datetime.now().isoformat()
+        await db.executemany("""
+            UPDATE broadcast_recipients SET status = ?, error = ?, sent_at = ?
+            WHERE job_id = ? AND user_id = ?
+        """, [(status, error, now, job_id, user_id) for user_id, status, error in results])
+        sent = sum(1 for _, status, _ in results if status == "sent")
+        failed = sum(1 for _, status, _ in results if status == "failed")
+        blocked = sum(1 for _, status, _ in results if status == "blocked")
+        await db.execute("""
+            UPDATE broadcast_jobs SET sent = sent + ?, failed = failed + ?, blocked = blocked + ?
+            WHERE id = ?
+        """, (sent, failed, blocked, job_id))
+        await db.commit()
+    finally:
+        await db.close()
+    
+    # Заблокировавших бота больше не включаем в рассылки
+    blocked_ids = [user_id for user_id, status, _ in results if status == "blocked"]
+    if blocked_ids:
+        from users_manager import mark_users_blocked
+        await mark_users_blocked(blocked_ids)
+
+
+async def get_unfinished_broadcast_jobs() -> List[Dict]:
+    """Возвращает рассылки, прерванные перезапуском бота."""
+    db = await get_db()
+    try:
+        cursor = await db.execute("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        await db.close()
+
+
+# ========== Отправка ==========
+
+def format_broadcast_progress(job: Dict) -> str:
+    """Форматирует прогресс рассылки для админа (HTML)."""
+    done = job["sent"] + job["failed"] + job["blocked"]
+    percent = int(done / job["total"] * 100) if job["total"] else 100
+    status_titles = {
+        "running": "⏳ Рассылка идет",
+        "paused": "⏸ Рассылка на паузе",
+        "completed": "✅ Рассылка завершена!",
+        "cancelled": "🛑 Рассылка отменена",
+    }
+    text = (
+        f"📢 <b>{status_titles.get(job['status'], job['status'])}</b> (#{job['id']})\n\n"
+        f"📊 Прогресс: {done}/{job['total']} ({percent}%)\n"
+        f"✅ Успешно отправлено: {job['sent']}\n"
+        f"❌ Ошибки: {job['failed']}\n"
+        f"🚫 Заблокировали бота: {job['blocked']}"
+    )
+    if job["status"] == "running":
+        text += f"\n\n/broadcast_pause {job['id']} - пауза, /broadcast_cancel {job['id']} - отмена"
+    elif job["status"] == "paused":
+        text += f"\n\n/broadcast_resume {job['id']} - продолжить"
+    return text
+
+
+async def _send_one(bot: Bot, job: Dict, user_id: int) -> tuple:
+    """Отправляет сообщение рассылки одному получателю. Возвращает (user_id, status, error)."""
+    try:
+        if job["payload_type"] == "copy":
+            await bot.copy_message(user_id, job["source_chat_id"], job["source_message_id"])
+        else:
+            await bot.send_message(user_id, job["text"], parse_mode=job["parse_mode"])
+        return user_id, "sent", None
+    except TelegramForbiddenError as e:
+        return user_id, "blocked", str(e)[:200]
+    except TelegramBadRequest as e:
+        error_str = str(e).lower()
+        if "chat not found" in error_str or "user is deactivated" in error_str:
+            return user_id, "blocked", str(e)[:200]
+        return user_id, "failed", str(e)[:200]
+    except Exception as e:
+        logging.warning(f"Ошибка отправки рассылки пользователю {user_id}: {type(e).__name__}: {e}")
+        return user_id, "failed", str(e)[:200]
+
+
+async def _update_progress(bot: Bot, job_id: int):
+    """Редактирует сообщение с прогрессом у админа."""
+    job = await get_broadcast_job(job_id)
+    if not job or not job.get("progress_message_id"):
+        return
+    try:
+        await bot.edit_message_text(
+            format_broadcast_progress(job),
+            chat_id=job["admin_chat_id"],
+            message_id=job["progress_message_id"],
+            parse_mode="HTML"
+        )
+    except TelegramBadRequest as e:
+        # "message is not modified" - прогресс не изменился
+        if "not modified" not in str(e).lower():
+            logging.warning(f"Не удалось обновить прогресс рассылки #{job_id}: {e}")
+    except Exception as e:
+        logging.warning(f"Не удалось обновить прогресс рассылки #{job_id}: {e}")
+
+
+async def _run_job(bot: Bot, job_id: int):
+    """Выполняет рассылку до конца, паузы или отмены."""
+    job = await get_broadcast_job(job_id)
+    if not job:
+        return
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    last_progress = 0.0
+
+    async def send_limited(user_id: int) -> tuple:
+        async with semaphore:
+            return await _send_one(bot, job, user_id)
+
+    try:
+        while True:
+            current = await get_broadcast_job(job_id)
+            if not current or current["status"] != "running":
+                break
+            user_ids = await _fetch_pending_recipients(job_id, BROADCAST_BATCH_SIZE)
+            if not user_ids:
+                await set_broadcast_job_status(job_id, "completed")
+                break
+            results = await asyncio.gather(*(send_limited(user_id) for user_id in user_ids))
+            await _save_results(job_id, list(results))
+            if time.monotonic() - last_progress >= BROADCAST_PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await _update_progress(bot, job_id)
+        await _update_progress(bot, job_id)
+        final = await get_broadcast_job(job_id)
+        logging.info(f"Рассылка #{job_id} остановлена со статусом {final['status'] if final else 'unknown'}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"Ошибка выполнения рассылки #{job_id}: {e}", exc_info=True)
+    finally:
+        _running_jobs.pop(job_id, None)
+
+
+def start_broadcast_job(bot: Bot, job_id: int) -> bool:
+    """Запускает выполнение рассылки в фоне. Возвращает False, если она уже выполняется."""
+    if job_id in _running_jobs:
+        return False
+    _running_jobs[job_id] = asyncio.create_task(_run_job(bot, job_id))
+    return True
+
+
+async def resume_unfinished_broadcasts(bot: Bot) -> int:
+    """Продолжает рассылки, прерванные перезапуском. Возвращает количество запущенных рассылок."""
+    jobs = await get_unfinished_broadcast_jobs()
+    for job in jobs:
+        logging.info(f"Продолжаю рассылку #{job['id']} после перезапуска")
+        start_broadcast_job(bot, job["id"])
+    return len(jobs)
@@ -4,6 +4,7 @@
 """
 import aiosqlite
 import logging
+from datetime import datetime
 from typing import Optional
 
 DB_FILE = "bot_database.db"
@@ -55,6 +56,8 @@ async def init_db():
                 payment_logs TEXT,  -- JSON строка
                 accept_lock TEXT,
                 partner_message_ids TEXT,  -- JSON строка: {"partner_id": message_id, ...}
+                partner_message_kind TEXT,  -- 'caption' или 'text'
+                version INTEGER DEFAULT 0,  -- увеличивается при каждом обновлении (ключ кеша отрисовки)
                 UNIQUE(type, id)
             )
         """)
@@ -74,6 +77,14 @@ async def init_db():
             if "duplicate column" not in str(e).lower():
                 logging.debug(f"Поле partner_message_ids уже существует или другая ошибка: {e}")
         
+        # Тип сообщений с заказом у админа и партнеров: 'caption' (с файлом) или 'text'
+        try:
+            await db.execute("ALTER TABLE orders ADD COLUMN partner_message_kind TEXT")
+            logging.info("Добавлено поле partner_message_kind в таблицу orders")
+        except Exception as e:
+            if "duplicate column" not in str(e).lower():
+                logging.debug(f"Поле partner_message_kind уже существует или другая ошибка: {e}")
+        
         # Таблица покупок готовых битов
         await db.execute("""
             CREATE TABLE IF NOT EXISTS beats_purchases (
@@ -89,10 +100,20 @@ async def init_db():
                 file_sent_at TEXT,
                 client_message_id INTEGER,
                 waiting_card_details INTEGER DEFAULT 0,
-                card_details_sent INTEGER DEFAULT 0
+                card_details_sent INTEGER DEFAULT 0,
+                version INTEGER DEFAULT 0
             )
         """)
         
+        # Версия строки для кеша отрисовки (render_cache.py) - миграция для существующих БД
+        for table in ("orders", "beats_purchases"):
+            try:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER DEFAULT 0")
+                logging.info(f"Добавлено поле version в таблицу {table}")
+            except Exception as e:
+                if "duplicate column" not in str(e).lower():
+                    logging.debug(f"Поле version в {table} уже существует или другая ошибка: {e}")
+        
         await db.execute("CREATE INDEX IF NOT EXISTS idx_purchases_user_id ON beats_purchases(user_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_purchases_status ON beats_purchases(status)")
         
@@ -140,6 +161,132 @@ async def init_db():
         
         await db.execute("CREATE INDEX IF NOT EXISTS idx_user_languages_user_id ON user_languages(user_id)")
         
+        # Таблица пользователей основного бота (обновляется при каждом обращении)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                language TEXT,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                blocked_at TEXT  -- время, когда пользователь заблокировал бота (NULL - не заблокирован)
+            )
+        """)
+        
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_blocked_at ON users(blocked_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users(last_seen)")
+        
+        # Заполняем users пользователями из существующих таблиц (миграция для существующих БД)
+        now = datetime.now().isoformat()
+        await db.execute("""
+            INSERT OR IGNORE INTO users (user_id, username, language, first_seen, last_seen)
+            SELECT user_id, MAX(username), NULL, MIN(created_at), MAX(created_at) FROM orders GROUP BY user_id
+        """)
+        await db.execute("""
+            INSERT OR IGNORE INTO users (user_id, username, language, first_seen, last_seen)
+            SELECT user_id, MAX(username), NULL, MIN(created_at), MAX(created_at) FROM beats_purchases GROUP BY user_id
+        """)
+        await db.execute("""
+            INSERT OR IGNORE INTO users (user_id, username, language, first_seen, last_seen)
+            SELECT user_id, username, NULL, ?, ? FROM partners WHERE active = 1
+        """, (now, now))
+        await db.execute("""
+            UPDATE users SET language = (SELECT language FROM user_languages WHERE user_languages.user_id = users.user_id)
+            WHERE language IS NULL
+        """)
+        
+        # Таблица заданий рассылки
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_chat_id INTEGER NOT NULL,
+                progress_message_id INTEGER,
+                payload_type TEXT NOT NULL DEFAULT 'text',  -- 'text' или 'copy' (копия сообщения с медиа)
+                text TEXT,
+                parse_mode TEXT,
+                source_chat_id INTEGER,
+                source_message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'running',  -- 'running', 'paused', 'completed', 'cancelled'
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+        """)
+        
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)")
+        
+        # Получатели рассылки и статус отправки каждому
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',  -- 'pending', 'sent', 'failed', 'blocked'
+                error TEXT,
+                sent_at TEXT,
+                PRIMARY KEY (job_id, user_id)
+            )
+        """)
+        
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status ON broadcast_recipients(job_id, status)")
+        
+        # Кеш результатов Key & BPM (по file_unique_id Telegram и хешу содержимого)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS audio_analysis_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_unique_id TEXT,
+                content_hash TEXT,  -- sha256 содержимого файла
+                key TEXT NOT NULL,
+                bpm INTEGER NOT NULL,
+                confidence REAL,  -- уверенность определения тональности (0-1)
+                features TEXT,  -- JSON: признаки и оценка настроения для AI-чата (audio_cache.CACHED_FEATURE_KEYS)
+                algo_version TEXT NOT NULL,  -- версия алгоритма анализа
+                created_at TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        # Признаки настроения - миграция для существующих БД
+        try:
+            await db.execute("ALTER TABLE audio_analysis_cache ADD COLUMN features TEXT")
+            logging.info("Добавлено поле features в таблицу audio_analysis_cache")
+        except Exception as e:
+            if "duplicate column" not in str(e).lower():
+                logging.debug(f"Поле features в audio_analysis_cache уже существует или другая ошибка: {e}")
+        
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_unique_id ON audio_analysis_cache(file_unique_id, algo_version)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_hash ON audio_analysis_cache(content_hash, algo_version)")
+        
+        # Таблица отпечатков аудио (audio_fingerprint.py): одна и та же запись в разных файлах и разделах
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS audio_fingerprints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fingerprint TEXT NOT NULL,  -- 128 бит в hex
+                bpm INTEGER NOT NULL,
+                duration INTEGER NOT NULL,  -- длительность всего файла (секунды, округлено)
+                key TEXT,
+                file_unique_id TEXT,
+                content_hash TEXT,
+                source TEXT NOT NULL,  -- 'key_bpm', 'ai_chat', 'order'
+                ref_id INTEGER,  -- user_id или order_id
+                fingerprint_version TEXT NOT NULL,
+                algo_version TEXT,  -- версия анализа, которым получены key и bpm (audio_cache.ANALYSIS_ALGO_VERSION)
+                created_at TEXT NOT NULL
+            )
+        """)
+        
+        # Версия анализа у отпечатков - миграция для существующих БД
+        try:
+            await db.execute("ALTER TABLE audio_fingerprints ADD COLUMN algo_version TEXT")
+            logging.info("Добавлено поле algo_version в таблицу audio_fingerprints")
+        except Exception as e:
+            if "duplicate column" not in str(e).lower():
+                logging.debug(f"Поле algo_version в audio_fingerprints уже существует или другая ошибка: {e}")
+        
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_audio_fingerprints_lookup ON audio_fingerprints(fingerprint_version, bpm, duration)")
+        
         await db.commit()
         logging.info("База данных инициализирована успешно")
     except Exception as e:
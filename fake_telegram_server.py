@@ -0,0 +1,193 @@
+"""
+Локальный фейковый сервер Telegram Bot API для тестирования режима webhook.
+
+Отвечает на вызовы методов Bot API (sendMessage, editMessageText, setWebhook, ...)
+правдоподобными ответами и может генерировать поток обновлений в webhook бота.
+
+Использование:
+    python fake_telegram_server.py --port 8090 \\
+        --webhook http://127.0.0.1:8081/webhook/main --secret mysecret \\
+        --users 100 --updates 1000 --rate 200
+
+В .env бота укажите TELEGRAM_API_URL=http://127.0.0.1:8090, чтобы бот
+отправлял запросы в этот сервер, а не в api.telegram.org.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import aiohttp
+from aiohttp import web
+
+logging.basicConfig(level=logging.INFO)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class FakeTelegramServer:
+    """Фейковый Bot API: сохраняет все вызовы и возвращает заглушки."""
+
+    def __init__(self):
+        self.calls = []  # [(method, params)]
+        self.webhooks = {}  # token -> {"url": str, "secret_token": str}
+        self.files = {}  # file_id -> содержимое, которое отдается через getFile и /file/bot{token}/...
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+
+    def _message(self, params: dict) -> dict:
+        """Формирует объект Message для ответов на send*/edit* методы."""
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        return message
+
+    def _result(self, token: str, method: str, params: dict):
+        """Возвращает результат для метода Bot API."""
+        method_lower = method.lower()
+        if method_lower == "getme":
+            bot_id = int(token.split(":")[0]) if token.split(":")[0].isdigit() else 1
+            return {"id": bot_id, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method_lower == "setwebhook":
+            self.webhooks[token] = {"url": params.get("url"), "secret_token": params.get("secret_token")}
+            return True
+        if method_lower == "deletewebhook":
+            self.webhooks.pop(token, None)
+            return True
+        if method_lower == "getfile":
+            return {
+                "file_id": params.get("file_id"),
+                "file_unique_id": f"u{params.get('file_id')}",
+                "file_size": len(self.files.get(params.get("file_id"), b"")),
+                "file_path": f"files/{params.get('file_id')}",
+            }
+        if method_lower == "copymessage":
+            return {"message_id": next(self._message_ids)}
+        if method_lower.startswith(("send", "edit")):
+            return self._message(params)
+        return True
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+            # Файлы и поля в multipart приходят строками/объектами, приводим к простому виду
+            params = {k: (v if isinstance(v, str) else "<file>") for k, v in params.items()}
+        self.calls.append((method, params))
+        return web.json_response({"ok": True, "result": self._result(token, method, params)})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        """Отдает содержимое файла, добавленного в self.files."""
+        file_id = request.match_info["path"].split("/")[-1]
+        if file_id not in self.files:
+            return web.Response(status=404)
+        self.calls.append(("downloadFile", {"file_id": file_id}))
+        return web.Response(body=self.files[file_id])
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        counts = {}
+        for method, _ in self.calls:
+            counts[method] = counts.get(method, 0) + 1
+        return web.json_response({"calls": counts, "webhooks": self.webhooks})
+
+    def make_text_update(self, user_id: int, text: str) -> dict:
+        """Создает обновление с текстовым сообщением от пользователя."""
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "text": text,
+            },
+        }
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+
+async def push_updates(server: FakeTelegramServer, webhook_url: str, secret: str,
+                       users: int, updates: int, rate: float, text: str):
+    """Отправляет поток обновлений в webhook бота с заданной частотой."""
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers[SECRET_TOKEN_HEADER] = secret
+
+    statuses = {}
+    latencies = []
+    interval = 1.0 / rate if rate > 0 else 0
+
+    async with aiohttp.ClientSession() as session:
+        async def send_one(i: int):
+            update = server.make_text_update(100000 + (i % users), text)
+            start = time.perf_counter()
+            try:
+                async with session.post(webhook_url, data=json.dumps(update), headers=headers) as resp:
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            except Exception as e:
+                statuses[str(type(e).__name__)] = statuses.get(str(type(e).__name__), 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+        tasks = []
+        for i in range(updates):
+            tasks.append(asyncio.create_task(send_one(i)))
+            if interval:
+                await asyncio.sleep(interval)
+        await asyncio.gather(*tasks)
+
+    latencies.sort()
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        logging.info(f"Отправлено обновлений: {updates}, статусы: {statuses}, p50={p50:.1f} мс, p99={p99:.1f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Фейковый сервер Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--webhook", default="", help="URL webhook бота, куда отправлять обновления")
+    parser.add_argument("--secret", default="", help="Секретный токен webhook")
+    parser.add_argument("--users", type=int, default=10, help="Количество разных пользователей")
+    parser.add_argument("--updates", type=int, default=0, help="Сколько обновлений отправить")
+    parser.add_argument("--rate", type=float, default=100.0, help="Обновлений в секунду")
+    parser.add_argument("--text", default="/start", help="Текст сообщений")
+    args = parser.parse_args()
+
+    server = FakeTelegramServer()
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    logging.info(f"Фейковый Bot API запущен на http://{args.host}:{args.port}")
+
+    try:
+        if args.webhook and args.updates:
+            await push_updates(server, args.webhook, args.secret, args.users, args.updates, args.rate, args.text)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
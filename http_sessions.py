@@ -0,0 +1,170 @@
+"""
+Модуль для создания HTTP-сессий ботов.
+У каждого бота своя сессия: отдельный пул соединений, keep-alive и таймауты по методам,
+чтобы медленная загрузка файла партнеру не занимала соединения для ответов клиентам.
+"""
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from rate_limiter import RateLimitMiddleware, format_limiter_report
+
+# Настройки прокси (если Telegram заблокирован, укажите в .env)
+PROXY_URL = os.getenv("PROXY_URL", None)
+# Адрес Bot API (по умолчанию api.telegram.org). Для тестов можно указать fake_telegram_server.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", None)
+
+# Таймауты по группам методов (в секундах)
+HTTP_TIMEOUT_DEFAULT = float(os.getenv("HTTP_TIMEOUT_DEFAULT", "60"))
+HTTP_TIMEOUT_FAST = float(os.getenv("HTTP_TIMEOUT_FAST", "10"))
+HTTP_TIMEOUT_UPLOAD = float(os.getenv("HTTP_TIMEOUT_UPLOAD", "300"))
+
+# Короткие служебные методы - пользователь ждет мгновенной реакции
+FAST_METHODS = {
+    "answerCallbackQuery",
+    "sendChatAction",
+    "editMessageReplyMarkup",
+    "deleteMessage",
+    "getMe",
+    "getFile",
+}
+
+# Методы с отправкой файлов - могут идти долго
+UPLOAD_METHODS = {
+    "sendAudio",
+    "sendDocument",
+    "sendPhoto",
+    "sendVideo",
+    "sendVoice",
+    "sendMediaGroup",
+    "editMessageMedia",
+}
+
+# Параметры пула соединений по умолчанию для каждого бота
+# (переопределяются через {BOT}_HTTP_LIMIT и {BOT}_HTTP_KEEPALIVE)
+DEFAULT_SESSION_PROFILES = {
+    "main": {"limit": 100, "keepalive": 30},
+    "orders": {"limit": 50, "keepalive": 30},
+    "purchases": {"limit": 30, "keepalive": 30},
+}
+
+# Все созданные сессии (имя -> сессия) для вывода метрик
+_sessions: Dict[str, "TunedAiohttpSession"] = {}
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession с отдельными таймаутами по методам и сбором метрик.
+    """
+
+    def __init__(self, name: str, limit: int = 100, keepalive: float = 30, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        self.name = name
+        self.timeout = HTTP_TIMEOUT_DEFAULT
+        # Время жизни простаивающего соединения в пуле
+        self._connector_init["keepalive_timeout"] = keepalive
+        self.in_flight = 0
+        self.metrics: Dict[str, Dict] = {}  # method -> {"count", "errors", "total_time", "max_time"}
+
+    def get_method_timeout(self, method_name: str) -> float:
+        """Возвращает таймаут для метода Bot API."""
+        if method_name in FAST_METHODS:
+            return HTTP_TIMEOUT_FAST
+        if method_name in UPLOAD_METHODS:
+            return HTTP_TIMEOUT_UPLOAD
+        return self.timeout
+
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None):
+        method_name = method.__api_method__
+        if timeout is None:
+            timeout = self.get_method_timeout(method_name)
+
+        stats = self.metrics.setdefault(method_name, {"count": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0})
+        self.in_flight += 1
+        start = time.monotonic()
+        try:
+            return await super().make_request(bot, method, timeout=timeout)
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            self.in_flight -= 1
+            stats["count"] += 1
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+
+    def get_metrics(self) -> Dict:
+        """Возвращает метрики сессии."""
+        connector = self._session.connector if self._session and not self._session.closed else None
+        return {
+            "name": self.name,
+            "limit": self._connector_init.get("limit"),
+            "in_flight": self.in_flight,
+            "connector_closed": connector.closed if connector else True,
+            "methods": {
+                name: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total_time"] / stats["count"] * 1000, 1) if stats["count"] else 0,
+                    "max_ms": round(stats["max_time"] * 1000, 1),
+                }
+                for name, stats in self.metrics.items()
+            },
+        }
+
+
+def create_session(bot_name: str) -> TunedAiohttpSession:
+    """
+    Создает отдельную HTTP-сессию для бота.
+
+    Args:
+        bot_name: Имя бота ('main', 'orders', 'purchases')
+    """
+    profile = DEFAULT_SESSION_PROFILES.get(bot_name, DEFAULT_SESSION_PROFILES["main"])
+    limit = int(os.getenv(f"{bot_name.upper()}_HTTP_LIMIT", str(profile["limit"])))
+    keepalive = float(os.getenv(f"{bot_name.upper()}_HTTP_KEEPALIVE", str(profile["keepalive"])))
+
+    kwargs = {}
+    if TELEGRAM_API_URL:
+        kwargs["api"] = TelegramAPIServer.from_base(TELEGRAM_API_URL)
+    if PROXY_URL:
+        kwargs["proxy"] = PROXY_URL
+
+    session = TunedAiohttpSession(bot_name, limit=limit, keepalive=keepalive, **kwargs)
+    # Все отправки и редактирования проходят через общий лимитер процесса; для основного бота
+    # он же отмечает пользователей, заблокировавших бота (TelegramForbiddenError)
+    session.middleware(RateLimitMiddleware(track_blocked=bot_name == "main"))
+    # Если один процесс создает несколько сессий для одного бота, в метриках будут видны все
+    key = bot_name if bot_name not in _sessions else f"{bot_name}#{len(_sessions)}"
+    _sessions[key] = session
+    logging.info(f"HTTP-сессия '{bot_name}' создана (limit={limit}, keepalive={keepalive}s)")
+    return session
+
+
+def get_all_metrics() -> Dict[str, Dict]:
+    """Возвращает метрики всех сессий процесса."""
+    return {key: session.get_metrics() for key, session in _sessions.items()}
+
+
+def format_metrics_report() -> str:
+    """Форматирует метрики сессий для отправки админу (HTML)."""
+    lines = ["📡 <b>HTTP-сессии</b>"]
+    for key, metrics in get_all_metrics().items():
+        lines.append(f"\n<b>{key}</b> (limit={metrics['limit']}, в работе: {metrics['in_flight']})")
+        methods = sorted(metrics["methods"].items(), key=lambda x: x[1]["count"], reverse=True)
+        if not methods:
+            lines.append("  нет запросов")
+        for name, stats in methods:
+            lines.append(
+                f"  {name}: {stats['count']} (ошибок: {stats['errors']}), "
+                f"avg {stats['avg_ms']} мс, max {stats['max_ms']} мс"
+            )
+    lines.append("")
+    lines.append(format_limiter_report())
+    return "\n".join(lines)
@@ -25,21 +25,12 @@ MAIN_BOT_TOKEN = os.getenv("TOKEN", "8588087035:AAGSyPJesse5NnbIx98wovIeJGtQGUTh
 if not ORDERS_BOT_TOKEN:
     raise ValueError("ORDERS_BOT_TOKEN не найден в .env файле")
 
-# Настройки прокси (если Telegram заблокирован, укажите в .env)
-PROXY_URL = os.getenv("PROXY_URL", None)
+# Настройки прокси, таймаутов и пулов соединений находятся в http_sessions.py
+from http_sessions import create_session
+from render_cache import cached_render
+from partner_sync import MESSAGE_KIND_CAPTION, MESSAGE_KIND_TEXT, get_partner_message_edits, message_sync
 
-# Настройки таймаутов (увеличены для нестабильных соединений)
-from aiogram.client.session.aiohttp import AiohttpSession
-
-# Создаем сессию с увеличенными таймаутами
-if PROXY_URL:
-    session = AiohttpSession(proxy=PROXY_URL)
-    session.timeout = 60  # Устанавливаем таймаут как число (в секундах)
-else:
-    session = AiohttpSession()
-    session.timeout = 60  # Устанавливаем таймаут как число (в секундах)
-
-bot = Bot(token=ORDERS_BOT_TOKEN, session=session)
+bot = Bot(token=ORDERS_BOT_TOKEN, session=create_session("orders"))
 dp = Dispatcher()
 
 # Отслеживание, какой заказ админ отправляет (order_id -> (order_type, user_id))
@@ -53,7 +44,7 @@ dp.waiting_client_price = {}  # {user_id: (order_id, order_type)} - клиент
 main_bot = None
 if MAIN_BOT_TOKEN:
     try:
-        main_bot = Bot(token=MAIN_BOT_TOKEN, session=session)
+        main_bot = Bot(token=MAIN_BOT_TOKEN, session=create_session("main"))
         logging.info("Основной бот инициализирован для отправки сообщений клиентам.")
     except Exception as e:
         logging.error(f"Ошибка инициализации основного бота: {e}")
@@ -61,6 +52,9 @@ if MAIN_BOT_TOKEN:
 # ID чата, куда будут приходить заказы (можно использовать ADMIN_ID или создать канал)
 ORDERS_CHAT_ID = ADMIN_ID  # По умолчанию личка админа, можно изменить на ID канала
 
+# Сколько сообщений с новым заказом отправляется одновременно (админ + партнеры)
+ORDER_FANOUT_CONCURRENCY = int(os.getenv("ORDER_FANOUT_CONCURRENCY", "10"))
+
 @dp.message(Command("register"))
 async def cmd_register(message: Message):
     """Регистрация партнера."""
@@ -381,6 +375,16 @@ async def cmd_in_progress(message: Message):
         kb = get_order_keyboard(order, message.from_user.id)
         await message.answer(order_text, reply_markup=kb, parse_mode="HTML")
 
+@dp.message(Command("http_stats"))
+async def cmd_http_stats(message: Message):
+    """Метрики HTTP-сессий бота."""
+    from http_sessions import format_metrics_report
+    
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    await message.answer(format_metrics_report(), parse_mode="HTML")
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: Message):
     """Подробная статистика."""
@@ -1581,6 +1585,23 @@ def get_order_display_number(order: dict) -> str:
     from orders_manager import format_order_number
     return format_order_number(order["id"], order["type"], order.get("created_at"))
 
+def get_order_viewer_role(order: dict, user_id: int = None) -> str:
+    """
+    Определяет роль зрителя заказа для кеша отрисовки.
+    Текст и клавиатуры зависят от user_id только через эти признаки.
+    """
+    if not user_id:
+        return "none"
+    roles = []
+    if user_id == ADMIN_ID:
+        roles.append("admin")
+    if user_id == ORDERS_CHAT_ID:
+        roles.append("orders_chat")
+    if order.get("partner_id") == user_id:
+        roles.append("assignee")
+    return "+".join(roles) or "partner"
+
+@cached_render("order", get_order_viewer_role)
 def format_order_message(order: dict, user_id: int = None) -> str:
     """Форматирует сообщение о заказе."""
     from orders_manager import format_order_number
@@ -1723,6 +1744,7 @@ def format_order_message(order: dict, user_id: int = None) -> str:
     
     return text
 
+@cached_render("order", get_order_viewer_role)
 def get_order_keyboard(order: dict, user_id: int = None) -> InlineKeyboardMarkup:
     """Создает клавиатуру для управления заказом."""
     buttons = []
@@ -1898,54 +1920,7 @@ async def accept_order(callback: CallbackQuery):
         
         # Обновляем сообщения у всех партнеров (показываем, что заказ принят админом)
         try:
-            partner_message_ids = updated_order.get("partner_message_ids", {})
-            if not partner_message_ids:
-                partner_message_ids = {}
-            elif isinstance(partner_message_ids, str):
-                import json
-                try:
-                    partner_message_ids = json.loads(partner_message_ids)
-                except:
-                    partner_message_ids = {}
-            
-            # Обновляем сообщения у всех партнеров
-            for pid_str, msg_id in partner_message_ids.items():
-                try:
-                    pid = int(pid_str)
-                    logging.info(f"Обновление сообщения у партнера {pid} (заказ принят админом)")
-                    
-                    # Формируем текст с обновленным статусом
-                    partner_text = format_order_message(updated_order, pid)
-                    # Создаем клавиатуру без кнопок (заказ принят админом)
-                    partner_kb = get_partner_order_keyboard(updated_order, pid)
-                    
-                    # Пытаемся обновить сообщение
-                    updated = False
-                    try:
-                        await bot.edit_message_caption(
-                            chat_id=pid,
-                            message_id=msg_id,
-                            caption=partner_text,
-                            reply_markup=partner_kb,
-                            parse_mode="HTML"
-                        )
-                        updated = True
-                        logging.info(f"Обновлен caption у партнера {pid} (message_id={msg_id})")
-                    except:
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=pid,
-                                message_id=msg_id,
-                                text=partner_text,
-                                reply_markup=partner_kb,
-                                parse_mode="HTML"
-                            )
-                            updated = True
-                            logging.info(f"Обновлен текст у партнера {pid} (message_id={msg_id})")
-                        except Exception as e:
-                            logging.error(f"Ошибка обновления сообщения у партнера {pid}: {e}")
-                except (ValueError, KeyError) as e:
-                    logging.error(f"Ошибка обработки partner_message_id для партнера {pid_str}: {e}")
+            await sync_partner_messages(updated_order)
         except Exception as e:
             logging.error(f"Ошибка обновления сообщений партнеров: {e}")
         
@@ -2812,71 +2787,11 @@ async def partner_accept_order(callback: CallbackQuery):
     except Exception as e:
         logging.error(f"Ошибка отправки сообщения партнеру: {e}")
     
-    # Обновляем сообщения у всех партнеров (убираем кнопки Принять/Отклонить)
+    # Обновляем сообщения у всех партнеров, кроме того, кто принял заказ (убираем кнопки Принять/Отклонить)
     try:
         updated_order = await get_order_by_id(order_id, order_type)
         if updated_order:
-            partner_message_ids = updated_order.get("partner_message_ids", {})
-            if not partner_message_ids:
-                partner_message_ids = {}
-            elif isinstance(partner_message_ids, str):
-                import json
-                try:
-                    partner_message_ids = json.loads(partner_message_ids)
-                except:
-                    partner_message_ids = {}
-            
-            # Обновляем сообщения у всех партнеров, кроме того, кто принял заказ
-            for pid_str, msg_id in partner_message_ids.items():
-                try:
-                    pid = int(pid_str)
-                    # Пропускаем партнера, который принял заказ (его сообщение уже обновлено выше)
-                    if pid == partner_id:
-                        continue
-                    
-                    logging.info(f"Обновление сообщения у партнера {pid} (заказ принят партнером {partner_id})")
-                    
-                    # Формируем текст с обновленным статусом
-                    partner_text = format_order_message(updated_order, pid)
-                    # Создаем клавиатуру без кнопок (заказ принят другим партнером)
-                    partner_kb = get_partner_order_keyboard(updated_order, pid)
-                    
-                    logging.info(f"Текст для партнера {pid}: {partner_text[:100]}...")
-                    logging.info(f"Клавиатура для партнера {pid}: {partner_kb}")
-                    
-                    # Пытаемся обновить сообщение
-                    # Сначала пробуем edit_caption (для сообщений с файлом), затем edit_text
-                    updated = False
-                    try:
-                        await bot.edit_message_caption(
-                            chat_id=pid,
-                            message_id=msg_id,
-                            caption=partner_text,
-                            reply_markup=partner_kb,
-                            parse_mode="HTML"
-                        )
-                        logging.info(f"Обновлен caption у партнера {pid} (message_id={msg_id})")
-                        updated = True
-                    except Exception as e1:
-                        # Если не удалось обновить caption (сообщение без файла), пробуем edit_text
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=pid,
-                                message_id=msg_id,
-                                text=partner_text,
-                                reply_markup=partner_kb,
-                                parse_mode="HTML"
-                            )
-                            logging.info(f"Обновлено сообщение у партнера {pid} (message_id={msg_id})")
-                            updated = True
-                        except Exception as e2:
-                            logging.error(f"Ошибка обновления сообщения у партнера {pid} (message_id={msg_id}): {e2}")
-                    if not updated:
-                        logging.warning(f"Не удалось обновить сообщение у партнера {pid} (message_id={msg_id})")
-                except (ValueError, KeyError) as e:
-                    logging.error(f"Ошибка обработки partner_message_id для партнера {pid_str}: {e}")
-                except Exception as e:
-                    logging.error(f"Ошибка обновления сообщения у партнера {pid_str}: {e}")
+            await sync_partner_messages(updated_order, exclude=(partner_id,))
     except Exception as e:
         logging.error(f"Ошибка обновления сообщений партнеров: {e}")
     
@@ -3071,39 +2986,7 @@ async def mark_order_completed(callback: CallbackQuery):
         # Обновляем сообщения у других партнеров (если заказ принят партнером)
         if is_partner:
             try:
-                partner_message_ids = updated_order.get("partner_message_ids", {})
-                if not partner_message_ids:
-                    partner_message_ids = {}
-                elif isinstance(partner_message_ids, str):
-                    import json
-                    try:
-                        partner_message_ids = json.loads(partner_message_ids)
-                    except:
-                        partner_message_ids = {}
-                
-                # Обновляем сообщения у других партнеров
-                for pid_str, msg_id in partner_message_ids.items():
-                    try:
-                        pid = int(pid_str)
-                        if pid == user_id:
-                            continue
-                        
-                        partner_text = format_order_message(updated_order, pid)
-                        partner_kb = get_partner_order_keyboard(updated_order, pid)
-                        
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=pid,
-                                message_id=msg_id,
-                                text=partner_text,
-                                reply_markup=partner_kb,
-                                parse_mode="HTML"
-                            )
-                            logging.info(f"Обновлено сообщение у партнера {pid} (message_id={msg_id})")
-                        except Exception as e:
-                            logging.error(f"Ошибка обновления сообщения у партнера {pid}: {e}")
-                    except (ValueError, KeyError) as e:
-                        logging.error(f"Ошибка обработки partner_message_id для партнера {pid_str}: {e}")
+                await sync_partner_messages(updated_order, exclude=(user_id,))
             except Exception as e:
                 logging.error(f"Ошибка обновления сообщений у партнеров: {e}")
         
@@ -3217,64 +3100,20 @@ async def mark_order_cancelled(callback: CallbackQuery):
         except Exception as e:
             logging.error(f"Ошибка обновления сообщения: {e}")
         
-        # Обновляем сообщения у админа и других партнеров
+        # Обновляем сообщения у админа (если заказ отменен партнером) и других партнеров
         try:
             updated_order = await get_order_by_id(order_id, order_type)
             if updated_order:
-                partner_message_ids = updated_order.get("partner_message_ids", {})
-                if not partner_message_ids:
-                    partner_message_ids = {}
-                elif isinstance(partner_message_ids, str):
-                    import json
-                    try:
-                        partner_message_ids = json.loads(partner_message_ids)
-                    except:
-                        partner_message_ids = {}
-                
-                # Обновляем сообщение у админа, если заказ отменен партнером
-                if is_partner:
-                    admin_text = format_order_message(updated_order, ADMIN_ID)
-                    admin_kb = get_order_keyboard(updated_order, ADMIN_ID)
-                    
-                    # Ищем message_id админа
-                    admin_msg_id = updated_order.get("client_message_id")
-                    if admin_msg_id:
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=ORDERS_CHAT_ID,
-                                message_id=admin_msg_id,
-                                text=admin_text,
-                                reply_markup=admin_kb,
-                                parse_mode="HTML"
-                            )
-                            logging.info(f"Обновлено сообщение у админа (message_id={admin_msg_id})")
-                        except Exception as e:
-                            logging.error(f"Ошибка обновления сообщения у админа: {e}")
-                
-                # Обновляем сообщения у других партнеров (если заказ отменен)
-                for pid_str, msg_id in partner_message_ids.items():
-                    try:
-                        pid = int(pid_str)
-                        # Пропускаем партнера, который отменил заказ
-                        if pid == user_id:
-                            continue
-                        
-                        partner_text = format_order_message(updated_order, pid)
-                        partner_kb = get_partner_order_keyboard(updated_order, pid)
-                        
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=pid,
-                                message_id=msg_id,
-                                text=partner_text,
-                                reply_markup=partner_kb,
-                                parse_mode="HTML"
-                            )
-                            logging.info(f"Обновлено сообщение у партнера {pid} (message_id={msg_id})")
-                        except Exception as e:
-                            logging.error(f"Ошибка обновления сообщения у партнера {pid}: {e}")
-                    except (ValueError, KeyError) as e:
-                        logging.error(f"Ошибка обработки partner_message_id для партнера {pid_str}: {e}")
+                admin_edits = []
+                admin_msg_id = updated_order.get("client_message_id")
+                if is_partner and admin_msg_id:
+                    admin_edits.append((
+                        ORDERS_CHAT_ID,
+                        admin_msg_id,
+                        format_order_message(updated_order, ADMIN_ID),
+                        get_order_keyboard(updated_order, ADMIN_ID)
+                    ))
+                await sync_partner_messages(updated_order, exclude=(user_id,), extra_edits=admin_edits)
         except Exception as e:
             logging.error(f"Ошибка обновления сообщений: {e}")
         
@@ -3322,27 +3161,13 @@ async def handle_price_input(message: Message):
                     partner_kb = None
                     order_display_num = get_order_display_number(updated_order)
                     # Обновляем сообщение с заказом, убирая кнопки
-                    # Нужно найти message_id сообщения с заказом
-                    partner_message_ids = updated_order.get("partner_message_ids", {})
-                    if isinstance(partner_message_ids, str):
-                        import json
-                        try:
-                            partner_message_ids = json.loads(partner_message_ids)
-                        except:
-                            partner_message_ids = {}
-                    
-                    msg_id = partner_message_ids.get(str(user_id))
+                    msg_id = updated_order["partner_message_ids"].get(str(user_id))
                     if msg_id:
-                        try:
-                            await bot.edit_message_text(
-                                chat_id=user_id,
-                                message_id=msg_id,
-                                text=partner_text,
-                                reply_markup=None,
-                                parse_mode="HTML"
-                            )
-                        except Exception as e:
-                            logging.error(f"Ошибка обновления сообщения партнера: {e}")
+                        await message_sync.edit_many(
+                            bot,
+                            [(user_id, msg_id, partner_text, partner_kb)],
+                            updated_order.get("partner_message_kind")
+                        )
                     
                     await message.answer(
                         f"✅ Сумма заказа {order_display_num} сохранена: {price_text}"
@@ -3521,6 +3346,7 @@ async def handle_price_input(message: Message):
             if main_bot:
                 await main_bot.send_message(user_id, "❌ Произошла ошибка. Попробуй еще раз:")
 
+@cached_render("order", get_order_viewer_role)
 def get_partner_order_keyboard(order: dict, user_id: int = None) -> InlineKeyboardMarkup:
     """Создает клавиатуру для партнеров с кнопками Принять/Отклонить."""
     buttons = []
@@ -3576,8 +3402,40 @@ def get_partner_order_keyboard(order: dict, user_id: int = None) -> InlineKeyboa
     
     return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
 
+async def sync_partner_messages(order: dict, exclude=(), extra_edits=None) -> int:
+    """
+    Обновляет сообщения с заказом у всех партнеров (кроме exclude) по текущему состоянию заказа.
+    Сообщения редактируются параллельно, повторные правки одного сообщения схлопываются.
+
+    Args:
+        order: Обновленный заказ
+        exclude: ID партнеров, чьи сообщения уже обновлены
+        extra_edits: Дополнительные правки [(chat_id, message_id, text, reply_markup)], например сообщение админа
+    """
+    edits = get_partner_message_edits(
+        order,
+        lambda pid: (format_order_message(order, pid), get_partner_order_keyboard(order, pid)),
+        exclude
+    )
+    edits.extend(extra_edits or [])
+    updated = await message_sync.edit_many(bot, edits, order.get("partner_message_kind"))
+    logging.info(f"Заказ {order['id']}: обновлено сообщений {updated}/{len(edits)}")
+    return updated
+
+async def _send_order_copy(bot_instance: Bot, chat_id: int, order: dict, file_id: str, text: str, reply_markup):
+    """Отправляет одно сообщение с заказом (с файлом или без) и возвращает Message."""
+    if file_id:
+        if order["type"] == "custom_beat":
+            return await bot_instance.send_audio(chat_id=chat_id, audio=file_id, caption=text, reply_markup=reply_markup, parse_mode="HTML")
+        return await bot_instance.send_document(chat_id=chat_id, document=file_id, caption=text, reply_markup=reply_markup, parse_mode="HTML")
+    return await bot_instance.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode="HTML")
+
 async def send_order_to_bot(order: dict, file_id: str = None, orders_bot_instance: Bot = None, admin_chat_id: int = None):
-    """Отправляет заказ в бот заказов партнерам и админу. Вызывается из основного бота."""
+    """
+    Отправляет заказ в бот заказов партнерам и админу. Вызывается из основного бота.
+    Сообщения админу и всем партнерам отправляются параллельно (не больше ORDER_FANOUT_CONCURRENCY
+    одновременно, скорость ограничивает общий лимитер), message_id сохраняются одной записью в БД.
+    """
     # Импортируем функции для работы с заказами
     from orders_manager import update_order_status
     
@@ -3596,78 +3454,49 @@ async def send_order_to_bot(order: dict, file_id: str = None, orders_bot_instanc
     partners = await get_active_partners()
     logging.info(f"Найдено активных партнеров: {len(partners)}")
     
-    # Текст для админа
-    order_text = format_order_message(order, chat_id)
-    logging.info(f"Сформирован текст заказа для админа: {order_text[:100]}...")
-    
-    # Клавиатура для партнеров (передаем partner_id для каждого партнера отдельно)
-    # Клавиатура для админа
-    admin_kb = get_order_keyboard(order, chat_id)
-    logging.info(f"Клавиатура для админа: {admin_kb}")
+    semaphore = asyncio.Semaphore(ORDER_FANOUT_CONCURRENCY)
     
-    # Отправляем заказ админу
-    try:
-        if file_id:
-            if order["type"] == "custom_beat":
-                msg = await bot_instance.send_audio(chat_id=chat_id, audio=file_id, caption=order_text, reply_markup=admin_kb, parse_mode="HTML")
-            else:
-                msg = await bot_instance.send_document(chat_id=chat_id, document=file_id, caption=order_text, reply_markup=admin_kb, parse_mode="HTML")
-            # Сохраняем ID сообщения в заказе
-            await update_order_status(order["id"], order["type"], order["status"], client_message_id=msg.message_id)
-        else:
-            msg = await bot_instance.send_message(chat_id=chat_id, text=order_text, reply_markup=admin_kb, parse_mode="HTML")
-            # Сохраняем ID сообщения в заказе
-            await update_order_status(order["id"], order["type"], order["status"], client_message_id=msg.message_id)
-        logging.info(f"✅ Заказ {order['id']} отправлен админу (chat_id: {chat_id}, message_id: {msg.message_id})")
-    except Exception as e:
-        logging.error(f"❌ Ошибка отправки заказа админу: {e}", exc_info=True)
-    
-    # Отправляем заказ всем активным партнерам
-    partner_message_ids = {}  # Словарь для хранения message_id партнеров
-    if partners:
-        for partner in partners:
+    async def send_to(recipient_id: int, text: str, reply_markup, label: str):
+        """Отправляет заказ одному получателю. Возвращает (recipient_id, message_id или None)."""
+        async with semaphore:
             try:
-                partner_id = partner["user_id"]
-                # Формируем текст для каждого партнера отдельно с его user_id
-                partner_order_text = format_order_message(order, partner_id)
-                # Создаем клавиатуру для каждого партнера отдельно
-                partner_kb = get_partner_order_keyboard(order, partner_id)
-                msg = None
-                if file_id:
-                    if order["type"] == "custom_beat":
-                        msg = await bot_instance.send_audio(
-                            chat_id=partner_id,
-                            audio=file_id,
-                            caption=partner_order_text,
-                            reply_markup=partner_kb,
-                            parse_mode="HTML"
-                        )
-                    else:
-                        msg = await bot_instance.send_document(
-                            chat_id=partner_id,
-                            document=file_id,
-                            caption=partner_order_text,
-                            reply_markup=partner_kb,
-                            parse_mode="HTML"
-                        )
-                else:
-                    msg = await bot_instance.send_message(
-                        chat_id=partner_id,
-                        text=partner_order_text,
-                        reply_markup=partner_kb,
-                        parse_mode="HTML"
-                    )
-                # Сохраняем message_id партнера
-                if msg:
-                    partner_message_ids[str(partner_id)] = msg.message_id
-                logging.info(f"Заказ {order['id']} отправлен партнеру {partner_id} ({partner.get('name', partner.get('username'))}), message_id={msg.message_id if msg else None}")
+                msg = await _send_order_copy(bot_instance, recipient_id, order, file_id, text, reply_markup)
+                logging.info(f"Заказ {order['id']} отправлен {label} {recipient_id}, message_id={msg.message_id}")
+                return recipient_id, msg.message_id
             except Exception as e:
-                logging.error(f"Ошибка отправки заказа партнеру {partner.get('user_id')}: {e}", exc_info=True)
-        
-        # Сохраняем message_id всех партнеров в заказе
-        if partner_message_ids:
-            from orders_manager import update_order_status
-            await update_order_status(order["id"], order["type"], order["status"], partner_message_ids=partner_message_ids)
+                logging.error(f"❌ Ошибка отправки заказа {label} {recipient_id}: {e}", exc_info=True)
+                return recipient_id, None
+    
+    # Текст и клавиатура для админа
+    admin_task = send_to(chat_id, format_order_message(order, chat_id), get_order_keyboard(order, chat_id), "админу")
+    
+    # Для каждого партнера отдельно формируем текст и клавиатуру с его user_id
+    partner_tasks = [
+        send_to(
+            partner["user_id"],
+            format_order_message(order, partner["user_id"]),
+            get_partner_order_keyboard(order, partner["user_id"]),
+            "партнеру"
+        )
+        for partner in partners
+    ]
+    
+    results = await asyncio.gather(admin_task, *partner_tasks)
+    admin_result, partner_results = results[0], results[1:]
+    
+    # Сохраняем message_id админа и всех партнеров одной записью
+    updates = {}
+    if admin_result[1]:
+        updates["client_message_id"] = admin_result[1]
+    partner_message_ids = {str(partner_id): message_id for partner_id, message_id in partner_results if message_id}
+    if partner_message_ids:
+        updates["partner_message_ids"] = partner_message_ids
+    if updates:
+        updates["partner_message_kind"] = MESSAGE_KIND_CAPTION if file_id else MESSAGE_KIND_TEXT
+        await update_order_status(order["id"], order["type"], order["status"], **updates)
+    
+    failed = sum(1 for _, message_id in partner_results if not message_id)
+    logging.info(f"Заказ {order['id']} разослан: партнерам {len(partner_message_ids)}/{len(partners)}, ошибок {failed}")
 
 async def main():
     """Запуск бота."""
@@ -3677,7 +3506,11 @@ async def main():
     await init_db()
     
     logging.info("Запуск бота для заказов...")
-    await dp.start_polling(bot)
+    from webhook_server import is_webhook_enabled, run_webhook
+    if is_webhook_enabled():
+        await run_webhook(dp, bot, "orders")
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
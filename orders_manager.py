@@ -7,6 +7,7 @@ import aiosqlite
 from datetime import datetime
 from typing import Dict, List, Optional
 from database import get_db
+from render_cache import render_cache
 
 def format_order_number(order_id: int, order_type: str, created_at: str = None) -> str:
     """
@@ -83,6 +84,8 @@ async def create_custom_order(user_id: int, username: str, description: str, fil
             "payment_logs": [],
             "accept_lock": None,
             "partner_message_ids": {},
+            "partner_message_kind": None,
+            "version": 0,
         }
     finally:
         await db.close()
@@ -122,6 +125,8 @@ async def create_mixing_order(user_id: int, username: str, description: str, fil
             "payment_logs": [],
             "accept_lock": None,
             "partner_message_ids": {},
+            "partner_message_kind": None,
+            "version": 0,
         }
     finally:
         await db.close()
@@ -176,7 +181,7 @@ async def update_order_status(order_id: int, order_type: str, status: str, **kwa
     db = await get_db()
     try:
         # Подготавливаем обновления
-        updates = ["status = ?"]
+        updates = ["status = ?", "version = version + 1"]
         values = [status]
         
         # Обновляем временные метки в зависимости от статуса
@@ -197,7 +202,8 @@ async def update_order_status(order_id: int, order_type: str, status: str, **kwa
         # Обновляем дополнительные поля
         for key, value in kwargs.items():
             if key in ["price", "partner_price", "client_price", "partner_id", "partner_username", 
-                       "client_message_id", "first_payment", "second_payment", "accept_lock"]:
+                       "client_message_id", "first_payment", "second_payment", "accept_lock",
+                       "partner_message_kind"]:
                 updates.append(f"{key} = ?")
                 values.append(value)
             elif key == "payment_logs" and isinstance(value, list):
@@ -217,6 +223,7 @@ async def update_order_status(order_id: int, order_type: str, status: str, **kwa
         
         await db.execute(query, values)
         await db.commit()
+        render_cache.invalidate("order", order_id)
         
         # Возвращаем обновленный заказ
         return await get_order_by_id(order_id, order_type)
@@ -264,6 +271,7 @@ async def create_beats_purchase(user_id: int, username: str, beat: str, license:
             "payment_received_at": None,
             "file_sent_at": None,
             "client_message_id": None,
+            "version": 0,
         }
     finally:
         await db.close()
@@ -304,7 +312,7 @@ async def update_beats_purchase_status(purchase_id: int, status: str, **kwargs)
     """Обновляет статус покупки готового бита."""
     db = await get_db()
     try:
-        updates = ["status = ?"]
+        updates = ["status = ?", "version = version + 1"]
         values = [status]
         
         now = datetime.now().isoformat()
@@ -331,6 +339,7 @@ async def update_beats_purchase_status(purchase_id: int, status: str, **kwargs)
         
         await db.execute(query, values)
         await db.commit()
+        render_cache.invalidate("purchase", purchase_id)
         
         return await get_beats_purchase_by_id(purchase_id)
     finally:
@@ -0,0 +1,180 @@
+"""
+Модуль синхронизации сообщений с заказом у партнеров и админа.
+
+Когда статус заказа меняется, сообщение с заказом нужно отредактировать у каждого
+партнера. Редактирования выполняются параллельно (не больше PARTNER_SYNC_CONCURRENCY
+одновременно, скорость ограничивает общий лимитер), а несколько ожидающих
+редактирований одного сообщения схлопываются: отправляется только последнее состояние.
+
+Тип сообщения ('caption' - с файлом, 'text' - без файла) хранится в заказе
+(partner_message_kind), поэтому на каждое сообщение тратится один запрос, без
+неудачной попытки edit_message_caption для текстовых сообщений.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+# Сколько сообщений редактируется одновременно
+PARTNER_SYNC_CONCURRENCY = int(os.getenv("PARTNER_SYNC_CONCURRENCY", "10"))
+# Сколько типов сообщений, определенных по ошибке Telegram, хранится (давно не использованные удаляются)
+MAX_MESSAGE_KINDS = 10000
+
+MESSAGE_KIND_CAPTION = "caption"
+MESSAGE_KIND_TEXT = "text"
+
+
+class MessageSync:
+    """Параллельное редактирование сообщений с объединением повторных правок одного сообщения."""
+
+    def __init__(self, concurrency: int = PARTNER_SYNC_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: Dict[Tuple[int, int], Dict] = {}  # (chat_id, message_id) -> последнее состояние
+        self._tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        # Тип, определенный по ошибке Telegram (LRU: не больше MAX_MESSAGE_KINDS сообщений)
+        self._kinds: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+        self.stats = {"requested": 0, "coalesced": 0, "edits": 0, "errors": 0, "kind_fallbacks": 0}
+
+    def schedule(self, bot: Bot, chat_id: int, message_id: int, text: str, reply_markup=None,
+                 kind: Optional[str] = None) -> asyncio.Task:
+        """
+        Ставит редактирование сообщения в очередь и возвращает задачу, которая его выполнит.
+        Если для сообщения уже есть ожидающая правка, она заменяется новой.
+        """
+        key = (chat_id, message_id)
+        self.stats["requested"] += 1
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+        self._pending[key] = {
+            "bot": bot,
+            "text": text,
+            "reply_markup": reply_markup,
+            "kind": self._get_kind(key) or kind or MESSAGE_KIND_TEXT,
+        }
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._drain(key))
+            self._tasks[key] = task
+        return task
+
+    def _get_kind(self, key: Tuple[int, int]) -> Optional[str]:
+        kind = self._kinds.get(key)
+        if kind is not None:
+            self._kinds.move_to_end(key)
+        return kind
+
+    def _remember_kind(self, key: Tuple[int, int], kind: str):
+        self._kinds[key] = kind
+        self._kinds.move_to_end(key)
+        while len(self._kinds) > MAX_MESSAGE_KINDS:
+            self._kinds.popitem(last=False)
+
+    async def edit_many(self, bot: Bot, edits: Iterable[Tuple[int, int, str, object]],
+                        kind: Optional[str] = None) -> int:
+        """
+        Редактирует несколько сообщений параллельно.
+
+        Args:
+            edits: [(chat_id, message_id, text, reply_markup)]
+            kind: Тип сообщений ('caption' или 'text')
+
+        Returns:
+            Количество успешно обновленных сообщений
+        """
+        tasks = [self.schedule(bot, chat_id, message_id, text, reply_markup, kind)
+                 for chat_id, message_id, text, reply_markup in edits]
+        if not tasks:
+            return 0
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return sum(1 for result in results if result is True)
+
+    async def _drain(self, key: Tuple[int, int]) -> bool:
+        """Отправляет правки сообщения, пока они появляются. Возвращает результат последней."""
+        ok = False
+        try:
+            while key in self._pending:
+                async with self._semaphore:
+                    # Состояние берется после ожидания семафора - за это время его могли обновить
+                    state = self._pending.pop(key, None)
+                    if state is None:
+                        break
+                    ok = await self._edit(key, state)
+            return ok
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _edit(self, key: Tuple[int, int], state: Dict) -> bool:
+        chat_id, message_id = key
+        bot = state["bot"]
+        kind = state["kind"]
+        for attempt in range(2):
+            try:
+                if kind == MESSAGE_KIND_CAPTION:
+                    await bot.edit_message_caption(
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        caption=state["text"],
+                        reply_markup=state["reply_markup"],
+                        parse_mode="HTML"
+                    )
+                else:
+                    await bot.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        text=state["text"],
+                        reply_markup=state["reply_markup"],
+                        parse_mode="HTML"
+                    )
+                self.stats["edits"] += 1
+                if attempt:
+                    self._remember_kind(key, kind)
+                return True
+            except TelegramBadRequest as e:
+                error_str = str(e).lower()
+                if "not modified" in error_str:
+                    return True
+                # Тип сообщения не совпал (старые заказы без partner_message_kind) - пробуем другой
+                if attempt == 0 and ("no caption" in error_str or "no text in the message" in error_str):
+                    self.stats["kind_fallbacks"] += 1
+                    kind = MESSAGE_KIND_TEXT if kind == MESSAGE_KIND_CAPTION else MESSAGE_KIND_CAPTION
+                    continue
+                self.stats["errors"] += 1
+                logging.error(f"Ошибка обновления сообщения {message_id} в чате {chat_id}: {e}")
+                return False
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"Ошибка обновления сообщения {message_id} в чате {chat_id}: {e}")
+                return False
+        return False
+
+
+# Общий экземпляр для бота заказов
+message_sync = MessageSync()
+
+
+def get_partner_message_edits(order: Dict, render, exclude: Iterable[int] = ()) -> List[Tuple[int, int, str, object]]:
+    """
+    Формирует список правок сообщений партнеров по заказу.
+
+    Args:
+        order: Заказ (с partner_message_ids)
+        render: Функция partner_id -> (text, reply_markup)
+        exclude: ID партнеров, чьи сообщения обновлять не нужно
+    """
+    exclude = set(exclude)
+    edits = []
+    for pid_str, msg_id in (order.get("partner_message_ids") or {}).items():
+        try:
+            pid = int(pid_str)
+        except (TypeError, ValueError):
+            logging.error(f"Некорректный partner_id в partner_message_ids заказа {order.get('id')}: {pid_str}")
+            continue
+        if pid in exclude or not msg_id:
+            continue
+        text, reply_markup = render(pid)
+        edits.append((pid, msg_id, text, reply_markup))
+    return edits
@@ -0,0 +1,201 @@
+"""
+Модуль ограничения исходящих запросов к Telegram.
+
+Telegram ограничивает отправку: около 30 сообщений в секунду на бота, около 1 сообщения
+в секунду в один личный чат и 20 сообщений в минуту в группу. Лимитер выдает
+разрешения через token bucket для каждого бота и каждого чата и подключается
+к HTTP-сессиям ботов как request middleware, поэтому все send_*/edit_* вызовы
+всех ботов процесса проходят через него автоматически.
+
+При ответе TelegramRetryAfter отправка для этого бота приостанавливается
+на retry_after секунд, после чего запрос повторяется.
+
+Для основного бота (track_blocked) ответ TelegramForbiddenError на запрос в личный чат
+отмечает пользователя заблокировавшим бота (users_manager.mark_users_blocked) - при любой
+отправке, а не только в рассылке.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+# Глобальный лимит сообщений в секунду на одного бота
+RATE_LIMIT_GLOBAL_PER_SEC = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SEC", "30"))
+# Лимит для личного чата (сообщений в секунду) и допустимый "всплеск"
+RATE_LIMIT_PRIVATE_PER_SEC = float(os.getenv("RATE_LIMIT_PRIVATE_PER_SEC", "1"))
+RATE_LIMIT_PRIVATE_BURST = float(os.getenv("RATE_LIMIT_PRIVATE_BURST", "3"))
+# Лимит для групп и каналов (сообщений в минуту)
+RATE_LIMIT_GROUP_PER_MIN = float(os.getenv("RATE_LIMIT_GROUP_PER_MIN", "20"))
+# Сколько раз повторять запрос после TelegramRetryAfter
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Префиксы методов, на которые распространяются лимиты
+LIMITED_METHOD_PREFIXES = ("send", "edit", "copy", "forward")
+# Методы с этими префиксами, которые Telegram не ограничивает так строго
+UNLIMITED_METHODS = {"sendChatAction"}
+
+# Максимальное количество хранимых bucket'ов чатов (старые неактивные удаляются)
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity. Ожидающие обслуживаются по очереди."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_idle(self) -> bool:
+        """Bucket полностью восстановился - его можно удалить без потери информации."""
+        self._refill()
+        return self.tokens >= self.capacity and not self._lock.locked()
+
+    async def acquire(self) -> float:
+        """Ждет и забирает один токен. Возвращает время ожидания в секундах."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class TelegramRateLimiter:
+    """Планировщик исходящих сообщений: глобальные и поканальные лимиты для нескольких ботов."""
+
+    def __init__(self):
+        self._global: Dict[int, TokenBucket] = {}  # bot_id -> bucket
+        self._chats: Dict[Tuple[int, str], TokenBucket] = {}  # (bot_id, chat_id) -> bucket
+        self._paused_until: Dict[int, float] = {}  # bot_id -> время окончания паузы (monotonic)
+        self.stats = {"requests": 0, "delayed": 0, "wait_time": 0.0, "retry_after": 0}
+
+    def _get_global_bucket(self, bot_id: int) -> TokenBucket:
+        bucket = self._global.get(bot_id)
+        if bucket is None:
+            bucket = TokenBucket(RATE_LIMIT_GLOBAL_PER_SEC, RATE_LIMIT_GLOBAL_PER_SEC)
+            self._global[bot_id] = bucket
+        return bucket
+
+    def _get_chat_bucket(self, bot_id: int, chat_id) -> TokenBucket:
+        key = (bot_id, str(chat_id))
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._prune()
+            if str(chat_id).startswith("-") or str(chat_id).startswith("@"):
+                # Группы и каналы
+                bucket = TokenBucket(RATE_LIMIT_GROUP_PER_MIN / 60.0, RATE_LIMIT_PRIVATE_BURST)
+            else:
+                bucket = TokenBucket(RATE_LIMIT_PRIVATE_PER_SEC, RATE_LIMIT_PRIVATE_BURST)
+            self._chats[key] = bucket
+        return bucket
+
+    def _prune(self):
+        """Удаляет bucket'ы чатов, которые давно не использовались."""
+        for key in [k for k, b in self._chats.items() if b.is_idle()]:
+            del self._chats[key]
+
+    async def acquire(self, bot_id: int, chat_id=None):
+        """Ждет разрешения на отправку сообщения ботом bot_id в чат chat_id."""
+        waited = 0.0
+        paused_until = self._paused_until.get(bot_id, 0)
+        now = time.monotonic()
+        if paused_until > now:
+            await asyncio.sleep(paused_until - now)
+            waited += paused_until - now
+        if chat_id is not None:
+            waited += await self._get_chat_bucket(bot_id, chat_id).acquire()
+        waited += await self._get_global_bucket(bot_id).acquire()
+
+        self.stats["requests"] += 1
+        if waited > 0:
+            self.stats["delayed"] += 1
+            self.stats["wait_time"] += waited
+
+    def pause(self, bot_id: int, seconds: float):
+        """Приостанавливает отправку бота (после TelegramRetryAfter)."""
+        self.stats["retry_after"] += 1
+        until = time.monotonic() + seconds
+        self._paused_until[bot_id] = max(self._paused_until.get(bot_id, 0), until)
+
+
+# Общий лимитер для всех ботов процесса
+rate_limiter = TelegramRateLimiter()
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Request middleware aiogram: ограничивает send_*/edit_* и повторяет запросы после RetryAfter.
+
+    Args:
+        track_blocked: Отмечать пользователей, заблокировавших бота (только для основного бота:
+            таблица users - его аудитория)
+    """
+
+    def __init__(self, limiter: TelegramRateLimiter = rate_limiter, max_retries: int = RATE_LIMIT_MAX_RETRIES,
+                 track_blocked: bool = False):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.track_blocked = track_blocked
+
+    async def __call__(self, make_request, bot, method):
+        try:
+            return await self._request(make_request, bot, method)
+        except TelegramForbiddenError:
+            chat_id = getattr(method, "chat_id", None)
+            # Положительный chat_id - личный чат с пользователем
+            if self.track_blocked and isinstance(chat_id, int) and chat_id > 0:
+                await self._mark_blocked(chat_id)
+            raise
+
+    async def _mark_blocked(self, user_id: int):
+        try:
+            from users_manager import mark_users_blocked
+            await mark_users_blocked([user_id])
+        except Exception as e:
+            logging.error(f"Не удалось отметить блокировку бота пользователем {user_id}: {e}")
+
+    async def _request(self, make_request, bot, method):
+        method_name = method.__api_method__
+        if not method_name.startswith(LIMITED_METHOD_PREFIXES) or method_name in UNLIMITED_METHODS:
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(bot.id, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.limiter.pause(bot.id, e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                logging.warning(f"Flood control: {method_name} в чат {chat_id}, повтор через {e.retry_after} с (попытка {attempt})")
+
+
+def format_limiter_report() -> str:
+    """Форматирует статистику лимитера для отправки админу (HTML)."""
+    stats = rate_limiter.stats
+    avg_wait = stats["wait_time"] / stats["delayed"] * 1000 if stats["delayed"] else 0
+    return (
+        "🚦 <b>Лимитер отправки</b>\n"
+        f"  запросов: {stats['requests']}, задержано: {stats['delayed']} (avg {avg_wait:.0f} мс)\n"
+        f"  RetryAfter от Telegram: {stats['retry_after']}"
+    )
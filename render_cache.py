@@ -0,0 +1,96 @@
+"""
+Кеш отрисовки сообщений о заказах и покупках.
+
+Текст и клавиатура зависят только от состояния записи и роли того, кто смотрит
+(админ, исполнитель, другой партнер), поэтому результат кешируется по ключу
+(сущность, id, версия строки, функция, роль). Версия (колонка version) увеличивается
+при каждом обновлении записи в orders_manager, так что после смены статуса старые
+варианты больше не используются, в том числе в других процессах с той же БД.
+"""
+import functools
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+# Максимальное количество закешированных вариантов
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2000"))
+
+
+class RenderCache:
+    """LRU-кеш отрисованных текстов и клавиатур."""
+
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[Tuple, object]" = OrderedDict()
+        self._by_entity: Dict[Tuple[str, int], Set[Tuple]] = {}  # (сущность, id) -> ключи
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get_or_render(self, entity: str, entity_id: int, version: Optional[int], variant: Tuple,
+                      render: Callable[[], object]):
+        """
+        Возвращает закешированный результат или вызывает render().
+        Записи без версии (например, только что созданные словари) не кешируются.
+        """
+        if entity_id is None or version is None:
+            self.stats["misses"] += 1
+            return render()
+        key = (entity, entity_id, version) + variant
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._items[key]
+
+        self.stats["misses"] += 1
+        result = render()
+        self._items[key] = result
+        self._by_entity.setdefault((entity, entity_id), set()).add(key)
+        while len(self._items) > self.max_size:
+            old_key, _ = self._items.popitem(last=False)
+            self._discard_index(old_key)
+        return result
+
+    def _discard_index(self, key: Tuple):
+        keys = self._by_entity.get((key[0], key[1]))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_entity[(key[0], key[1])]
+
+    def invalidate(self, entity: str, entity_id: int):
+        """Удаляет все варианты записи (вызывается при изменении записи)."""
+        keys = self._by_entity.pop((entity, entity_id), None)
+        if keys:
+            self.stats["invalidations"] += 1
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+        self._by_entity.clear()
+
+
+# Общий кеш процесса
+render_cache = RenderCache()
+
+
+def cached_render(entity: str, get_role: Callable = None):
+    """
+    Декоратор для функций вида func(record, *args) -> текст или клавиатура.
+
+    Args:
+        entity: Тип записи ('order', 'purchase')
+        get_role: Функция (record, *args, **kwargs) -> роль зрителя; результат входит в ключ кеша
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(record: dict, *args, **kwargs):
+            role = get_role(record, *args, **kwargs) if get_role else ""
+            return render_cache.get_or_render(
+                entity,
+                record.get("id"),
+                record.get("version"),
+                (func.__name__, role),
+                lambda: func(record, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
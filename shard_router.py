@@ -0,0 +1,282 @@
+"""
+Шардирование основного бота (elementBot) по user_id.
+
+Несколько процессов elementBot работают как воркеры в режиме webhook, каждый на своем
+порту (или на своей машине). Входной маршрутизатор (ingress) принимает webhook от
+Telegram и пересылает каждое обновление воркеру, которому принадлежит пользователь
+по консистентному хешу. Все состояние пользователя (dp.*) остается в памяти одного
+воркера, а обновления одного пользователя доставляются строго по порядку.
+
+Обновления от админа маршрутизируются по ID клиента, к которому относится действие
+(например, callback "offer_accept_123" или команда "/send_file_123"), поэтому
+состояние, которое админ меняет у клиента, находится на шарде клиента. Ответ, которого
+ждет такое действие (файл, цена - сообщение без команды), в течение SHARD_ADMIN_TARGET_TTL
+секунд отправляется на тот же шард. Все остальные обновления админа (команды, кнопки без
+клиента, сообщения после истечения TTL) идут на один постоянный шард - шард самого админа.
+
+Каждый воркер запускает свой пул анализа аудио (AUDIO_WORKERS процессов) и свой лимитер
+исходящих сообщений, поэтому на машине работает шарды x AUDIO_WORKERS процессов librosa, а
+суммарный лимит - шарды x RATE_LIMIT_GLOBAL_PER_SEC. Оба значения воркерам делятся на число шардов.
+
+Запуск:
+    # воркеры (2 шарда на 8 ядрах)
+    export AUDIO_WORKERS=3 RATE_LIMIT_GLOBAL_PER_SEC=15
+    MAIN_WEBHOOK_PORT=9001 MAIN_WEBHOOK_REGISTER=0 MAIN_WEBHOOK_ORDERED=1 python elementBot.py
+    MAIN_WEBHOOK_PORT=9002 MAIN_WEBHOOK_REGISTER=0 MAIN_WEBHOOK_ORDERED=1 python elementBot.py
+    # маршрутизатор
+    SHARD_WORKERS=http://127.0.0.1:9001,http://127.0.0.1:9002 python shard_router.py
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+
+ADMIN_ID = int(os.getenv("ADMIN_ID", "830030557"))
+
+# Адреса воркеров elementBot через запятую (http://host:port)
+SHARD_WORKERS = [w.strip().rstrip("/") for w in os.getenv("SHARD_WORKERS", "").split(",") if w.strip()]
+# Порт и адрес, на которых маршрутизатор принимает webhook от Telegram
+SHARD_ROUTER_HOST = os.getenv("SHARD_ROUTER_HOST", "0.0.0.0")
+SHARD_ROUTER_PORT = int(os.getenv("SHARD_ROUTER_PORT", "8081"))
+# Количество виртуальных узлов на воркер (чем больше, тем равномернее распределение)
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "160"))
+# Количество параллельных "полос" пересылки на воркер (обновления одного пользователя идут в одну полосу)
+SHARD_LANES = int(os.getenv("SHARD_LANES", "16"))
+# Размер очереди каждой полосы
+SHARD_LANE_QUEUE_SIZE = int(os.getenv("SHARD_LANE_QUEUE_SIZE", "200"))
+# Максимальная пауза между повторами пересылки (секунды). Обновление не отбрасывается: пока
+# воркер недоступен, полоса заполняется, и маршрутизатор отвечает Telegram 503 (Telegram повторит)
+SHARD_FORWARD_MAX_BACKOFF = float(os.getenv("SHARD_FORWARD_MAX_BACKOFF", "5"))
+# Сколько секунд после действия админа с клиентом его ответ (файл, цена) идет на шард клиента
+SHARD_ADMIN_TARGET_TTL = float(os.getenv("SHARD_ADMIN_TARGET_TTL", "300"))
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# ID клиента в конце callback_data ("offer_accept_123") или команды ("/send_file_123")
+TARGET_USER_RE = re.compile(r"_(\d{5,})$")
+
+
+def _hash(key: str) -> int:
+    """Стабильный 64-битный хеш (не зависит от PYTHONHASHSEED)."""
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Консистентный хеш: при добавлении/удалении воркера переезжает только ~1/N пользователей."""
+
+    def __init__(self, nodes: List[str], vnodes: int = SHARD_VNODES):
+        self.nodes = list(nodes)
+        self._ring = []  # [(hash, node)]
+        for node in self.nodes:
+            for i in range(vnodes):
+                self._ring.append((_hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._hashes = [h for h, _ in self._ring]
+
+    def get_node(self, user_id: int) -> str:
+        """Возвращает воркер, которому принадлежит пользователь."""
+        if not self._ring:
+            raise ValueError("Нет воркеров для шардирования")
+        idx = bisect.bisect(self._hashes, _hash(str(user_id))) % len(self._ring)
+        return self._ring[idx][1]
+
+
+def get_raw_update_user_id(update: Dict) -> int:
+    """Возвращает ID пользователя из необработанного JSON обновления (0, если его нет)."""
+    for key, event in update.items():
+        if isinstance(event, dict):
+            user = event.get("from") or event.get("user")
+            if isinstance(user, dict) and "id" in user:
+                return int(user["id"])
+            chat = event.get("chat")
+            if isinstance(chat, dict) and "id" in chat:
+                return int(chat["id"])
+    return 0
+
+
+def get_admin_target_user_id(update: Dict) -> Optional[int]:
+    """Для обновлений от админа возвращает ID клиента, к которому относится действие."""
+    callback = update.get("callback_query")
+    if callback:
+        match = TARGET_USER_RE.search(callback.get("data") or "")
+        if match:
+            return int(match.group(1))
+    message = update.get("message")
+    if message and (message.get("text") or "").startswith("/"):
+        command = message["text"].split()[0]
+        match = TARGET_USER_RE.search(command)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def is_admin_reply(update: Dict) -> bool:
+    """Сообщение без команды (файл, цена) - ответ на действие админа с клиентом."""
+    message = update.get("message")
+    return bool(message) and not (message.get("text") or "").startswith("/")
+
+
+class ShardRouter:
+    """Пересылает обновления воркерам с сохранением порядка для каждого пользователя."""
+
+    def __init__(self, workers: List[str], path: str, secret: str = ""):
+        self.ring = HashRing(workers)
+        self.path = path
+        self.secret = secret
+        self.admin_target_user_id = None  # клиент последнего действия админа, ждущего ответа
+        self.admin_target_expires = 0.0  # до какого момента (time.monotonic) ответ админа идет к клиенту
+        self.lanes: Dict[str, List[asyncio.Queue]] = {}
+        self._tasks = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.forwarded = 0
+        self.retries = 0
+        self.rejected = 0  # ответов 503 Telegram из-за заполненной полосы
+
+    def route_key(self, update: Dict) -> int:
+        """Определяет ID пользователя, по которому выбирается шард."""
+        user_id = get_raw_update_user_id(update)
+        if user_id == ADMIN_ID:
+            target = get_admin_target_user_id(update)
+            if target:
+                self.admin_target_user_id = target
+                self.admin_target_expires = time.monotonic() + SHARD_ADMIN_TARGET_TTL
+                return target
+            if (self.admin_target_user_id and is_admin_reply(update)
+                    and time.monotonic() < self.admin_target_expires):
+                return self.admin_target_user_id
+            # Команды и кнопки без клиента - всегда на шард админа, чтобы его состояние не делилось
+        return user_id
+
+    def enqueue(self, update: Dict) -> bool:
+        """Кладет обновление в полосу воркера. Возвращает False, если полоса переполнена."""
+        key = self.route_key(update)
+        worker = self.ring.get_node(key)
+        lanes = self.lanes[worker]
+        try:
+            lanes[_hash(f"lane{key}") % len(lanes)].put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _forward_loop(self, worker: str, queue: asyncio.Queue):
+        """
+        Последовательно пересылает обновления одной полосы воркеру. Telegram уже получил 200,
+        поэтому обновление повторяется, пока воркер его не примет; следующие ждут в полосе.
+        """
+        url = f"{worker}{self.path}"
+        headers = {SECRET_TOKEN_HEADER: self.secret} if self.secret else {}
+        while True:
+            update = await queue.get()
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        async with self._session.post(url, json=update, headers=headers) as resp:
+                            if resp.status < 500:
+                                if resp.status != 200:
+                                    logging.warning(f"Воркер {worker} вернул {resp.status} для обновления {update.get('update_id')}")
+                                self.forwarded += 1
+                                break
+                            logging.warning(f"Воркер {worker} вернул {resp.status}, повтор обновления {update.get('update_id')}")
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        logging.warning(f"Ошибка пересылки воркеру {worker}: {e}")
+                    # Воркер перегружен или недоступен - ждем и повторяем (порядок сохраняется)
+                    self.retries += 1
+                    await asyncio.sleep(min(0.2 * 2 ** min(attempt, 10), SHARD_FORWARD_MAX_BACKOFF))
+                    attempt += 1
+            finally:
+                queue.task_done()
+
+    async def start(self):
+        """Создает HTTP-сессию и запускает пересылку."""
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        for worker in self.ring.nodes:
+            self.lanes[worker] = [asyncio.Queue(maxsize=SHARD_LANE_QUEUE_SIZE) for _ in range(SHARD_LANES)]
+            for queue in self.lanes[worker]:
+                self._tasks.append(asyncio.create_task(self._forward_loop(worker, queue)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session:
+            await self._session.close()
+
+    def create_app(self) -> web.Application:
+        async def handle_update(request: web.Request) -> web.Response:
+            if self.secret and request.headers.get(SECRET_TOKEN_HEADER) != self.secret:
+                return web.Response(status=401)
+            try:
+                update = await request.json()
+            except Exception:
+                return web.Response(status=400)
+            if not self.enqueue(update):
+                # Полоса заполнена (воркер не успевает или недоступен) - Telegram доставит повторно
+                self.rejected += 1
+                return web.Response(status=503)
+            return web.Response(status=200)
+
+        async def handle_health(request: web.Request) -> web.Response:
+            return web.json_response({
+                "workers": {w: sum(q.qsize() for q in lanes) for w, lanes in self.lanes.items()},
+                "forwarded": self.forwarded,
+                "retries": self.retries,
+                "rejected": self.rejected,
+            })
+
+        app = web.Application()
+        app.router.add_post(self.path, handle_update)
+        app.router.add_get(f"{self.path}/health", handle_health)
+        return app
+
+
+async def main():
+    from aiogram import Bot
+    from http_sessions import create_session
+    from webhook_server import WEBHOOK_BASE_URL, get_webhook_path, get_webhook_setting
+
+    if not SHARD_WORKERS:
+        raise ValueError("SHARD_WORKERS не найден в .env файле")
+    if not WEBHOOK_BASE_URL:
+        raise ValueError("WEBHOOK_BASE_URL не найден в .env файле")
+
+    path = get_webhook_path("main")
+    secret = get_webhook_setting("main", "SECRET", "")
+    router = ShardRouter(SHARD_WORKERS, path, secret)
+    await router.start()
+
+    runner = web.AppRunner(router.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, SHARD_ROUTER_HOST, SHARD_ROUTER_PORT).start()
+    logging.info(f"Маршрутизатор шардов запущен на {SHARD_ROUTER_HOST}:{SHARD_ROUTER_PORT}{path}, воркеров: {len(SHARD_WORKERS)}")
+
+    # Регистрируем webhook основного бота на маршрутизатор (через ту же сессию, что у бота:
+    # TELEGRAM_API_URL и прокси)
+    bot = Bot(token=os.getenv("TOKEN", ""), session=create_session("main"))
+    try:
+        await bot.set_webhook(url=f"{WEBHOOK_BASE_URL}{path}", secret_token=secret or None)
+        logging.info(f"Webhook зарегистрирован: {WEBHOOK_BASE_URL}{path}")
+    finally:
+        await bot.session.close()
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await router.stop()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
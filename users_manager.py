@@ -0,0 +1,144 @@
+"""
+Модуль для учета пользователей основного бота.
+Таблица users обновляется при каждом обращении пользователя к боту и хранит
+first_seen, last_seen, язык и blocked_at (пользователь заблокировал бота).
+Используется для рассылок и статистики вместо объединения orders/beats_purchases/partners.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from aiogram import BaseMiddleware
+
+from database import get_db
+
+# Как часто обновлять last_seen одного пользователя (секунды)
+USERS_TOUCH_INTERVAL = int(os.getenv("USERS_TOUCH_INTERVAL", "300"))
+
+# Максимальное количество пользователей в кеше touch_user (самые старые записи удаляются)
+MAX_TOUCH_CACHE = 10000
+
+# user_id -> (время последней записи, язык) - чтобы не писать в БД на каждое сообщение.
+# Записи упорядочены по времени записи: при обновлении ключ переставляется в конец
+_touch_cache: Dict[int, tuple] = {}
+
+
+def _remember_touch(user_id: int, now_ts: float, language: Optional[str]):
+    """
+    Запоминает время записи пользователя в БД. Когда кеш заполнен, удаляет записи старше
+    USERS_TOUCH_INTERVAL, а если их не хватило - самые старые.
+    """
+    _touch_cache.pop(user_id, None)
+    if len(_touch_cache) >= MAX_TOUCH_CACHE:
+        for cached_id, (cached_ts, _) in list(_touch_cache.items()):
+            if now_ts - cached_ts < USERS_TOUCH_INTERVAL and len(_touch_cache) < MAX_TOUCH_CACHE:
+                break
+            del _touch_cache[cached_id]
+    _touch_cache[user_id] = (now_ts, language)
+
+
+async def touch_user(user_id: int, username: Optional[str] = None, language: Optional[str] = None) -> bool:
+    """
+    Добавляет пользователя или обновляет last_seen/язык и снимает отметку о блокировке.
+    Запись в БД выполняется не чаще раза в USERS_TOUCH_INTERVAL секунд (или при смене языка).
+
+    Returns:
+        True если запись в БД была выполнена
+    """
+    now_ts = time.monotonic()
+    cached = _touch_cache.get(user_id)
+    if cached and now_ts - cached[0] < USERS_TOUCH_INTERVAL and cached[1] == language:
+        return False
+
+    db = await get_db()
+    try:
+        now = datetime.now().isoformat()
+        await db.execute("""
+            INSERT INTO users (user_id, username, language, first_seen, last_seen, blocked_at)
+            VALUES (?, ?, ?, ?, ?, NULL)
+            ON CONFLICT(user_id) DO UPDATE SET
+                username = COALESCE(excluded.username, users.username),
+                language = COALESCE(excluded.language, users.language),
+                last_seen = excluded.last_seen,
+                blocked_at = NULL
+        """, (user_id, username, language, now, now))
+        await db.commit()
+        _remember_touch(user_id, now_ts, language)
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка обновления пользователя {user_id}: {e}")
+        await db.rollback()
+        return False
+    finally:
+        await db.close()
+
+
+async def mark_users_blocked(user_ids: List[int]) -> int:
+    """Отмечает пользователей, заблокировавших бота. Возвращает количество обновленных записей."""
+    if not user_ids:
+        return 0
+    db = await get_db()
+    try:
+        now = datetime.now().isoformat()
+        cursor = await db.executemany(
+            "UPDATE users SET blocked_at = ? WHERE user_id = ? AND blocked_at IS NULL",
+            [(now, user_id) for user_id in user_ids]
+        )
+        await db.commit()
+        for user_id in user_ids:
+            _touch_cache.pop(user_id, None)
+        return cursor.rowcount
+    finally:
+        await db.close()
+
+
+async def get_active_audience() -> List[int]:
+    """Возвращает user_id всех пользователей, которые не заблокировали бота."""
+    db = await get_db()
+    try:
+        cursor = await db.execute("SELECT user_id FROM users WHERE blocked_at IS NULL")
+        rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+    finally:
+        await db.close()
+
+
+async def get_users_stats() -> Dict:
+    """Возвращает статистику пользователей: всего, активных за 7/30 дней, заблокировавших бота."""
+    db = await get_db()
+    try:
+        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
+        month_ago = (datetime.now() - timedelta(days=30)).isoformat()
+        cursor = await db.execute("""
+            SELECT
+                COUNT(*) AS total,
+                SUM(CASE WHEN blocked_at IS NOT NULL THEN 1 ELSE 0 END) AS blocked,
+                SUM(CASE WHEN last_seen >= ? THEN 1 ELSE 0 END) AS active_7d,
+                SUM(CASE WHEN last_seen >= ? THEN 1 ELSE 0 END) AS active_30d
+            FROM users
+        """, (week_ago, month_ago))
+        row = await cursor.fetchone()
+        return {key: row[key] or 0 for key in ("total", "blocked", "active_7d", "active_30d")}
+    finally:
+        await db.close()
+
+
+class UserTrackingMiddleware(BaseMiddleware):
+    """
+    Outer middleware для dp.update: отмечает каждое обращение пользователя в таблице users.
+
+    Args:
+        get_language: Функция user_id -> язык (например, dp.user_language.get)
+    """
+
+    def __init__(self, get_language=None):
+        self.get_language = get_language
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user and not user.is_bot:
+            language = self.get_language(user.id) if self.get_language else None
+            await touch_user(user.id, user.username, language or user.language_code)
+        return await handler(event, data)
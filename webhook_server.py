@@ -0,0 +1,243 @@
+"""
+Модуль для приема обновлений Telegram через webhook (aiohttp).
+Используется вместо dp.start_polling, если в .env указан WEBHOOK_BASE_URL.
+
+Обновления принимаются HTTP-обработчиком, проверяется секретный токен
+(заголовок X-Telegram-Bot-Api-Secret-Token), после чего обновление кладется
+в ограниченную очередь и обрабатывается пулом воркеров.
+Несколько процессов могут слушать один порт (WEBHOOK_REUSE_PORT=1).
+"""
+import asyncio
+import logging
+import os
+from typing import Callable, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+# Внешний адрес, по которому Telegram будет доставлять обновления (например, https://bot.example.com)
+# Если не указан, боты работают в режиме polling
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+
+# Заголовок, в котором Telegram передает секретный токен webhook
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Настройки по умолчанию для каждого бота (переопределяются через {BOT}_WEBHOOK_PORT / {BOT}_WEBHOOK_PATH)
+DEFAULT_WEBHOOK_PORTS = {
+    "main": 8081,
+    "orders": 8082,
+    "purchases": 8083,
+}
+
+
+def get_webhook_setting(bot_name: str, key: str, default: str = "") -> str:
+    """
+    Возвращает настройку webhook для конкретного бота.
+    Сначала ищется переменная {BOT}_WEBHOOK_{KEY}, затем общая WEBHOOK_{KEY}.
+
+    Args:
+        bot_name: Имя бота ('main', 'orders', 'purchases')
+        key: Имя настройки (PATH, PORT, SECRET, ...)
+        default: Значение по умолчанию
+    """
+    value = os.getenv(f"{bot_name.upper()}_WEBHOOK_{key}")
+    if value is None:
+        value = os.getenv(f"WEBHOOK_{key}", default)
+    return value
+
+
+def is_webhook_enabled() -> bool:
+    """Проверяет, включен ли режим webhook."""
+    return bool(WEBHOOK_BASE_URL)
+
+
+def get_webhook_path(bot_name: str) -> str:
+    """Возвращает путь webhook для бота (по умолчанию /webhook/{bot_name})."""
+    path = get_webhook_setting(bot_name, "PATH", f"/webhook/{bot_name}")
+    if not path.startswith("/"):
+        path = "/" + path
+    return path
+
+
+def get_update_user_id(update: Update) -> int:
+    """Возвращает ID пользователя, от которого пришло обновление (0, если его нет)."""
+    event = update.event
+    user = getattr(event, "from_user", None) if event is not None else None
+    return user.id if user else 0
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь обновлений с пулом воркеров.
+    Если очередь переполнена, webhook отвечает 503 и Telegram повторит доставку позже.
+
+    В режиме ordered у каждого воркера своя очередь, и обновления одного пользователя
+    всегда попадают к одному воркеру, поэтому обрабатываются строго по порядку.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, maxsize: int = 1000, workers: int = 8, ordered: bool = False):
+        self.dp = dp
+        self.bot = bot
+        self.workers_count = max(1, workers)
+        self.ordered = ordered
+        if ordered:
+            lane_size = max(1, maxsize // self.workers_count)
+            self.queues = [asyncio.Queue(maxsize=lane_size) for _ in range(self.workers_count)]
+        else:
+            self.queues = [asyncio.Queue(maxsize=maxsize)]
+        self.maxsize = maxsize
+        self._workers = []
+        self.accepted = 0
+        self.rejected = 0
+
+    def qsize(self) -> int:
+        """Количество обновлений, ожидающих обработки."""
+        return sum(q.qsize() for q in self.queues)
+
+    def put_nowait(self, update: Update) -> bool:
+        """Кладет обновление в очередь. Возвращает False, если очередь заполнена."""
+        if self.ordered:
+            queue = self.queues[get_update_user_id(update) % len(self.queues)]
+        else:
+            queue = self.queues[0]
+        try:
+            queue.put_nowait(update)
+            self.accepted += 1
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def _worker(self, worker_id: int, queue: asyncio.Queue):
+        """Воркер, обрабатывающий обновления из очереди."""
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logging.error(f"Ошибка обработки обновления {update.update_id} (воркер {worker_id}): {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def start(self):
+        """Запускает воркеров."""
+        for i in range(self.workers_count):
+            queue = self.queues[i] if self.ordered else self.queues[0]
+            self._workers.append(asyncio.create_task(self._worker(i, queue)))
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Дожидается обработки оставшихся обновлений и останавливает воркеров."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Не все обновления обработаны при остановке: осталось {self.qsize()}")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+def create_webhook_app(bot: Bot, update_queue: UpdateQueue, path: str, secret: str = "",
+                       health_info: Optional[Callable[[], dict]] = None) -> web.Application:
+    """
+    Создает aiohttp приложение с обработчиком webhook.
+
+    Args:
+        bot: Экземпляр бота (нужен для привязки обновлений)
+        update_queue: Очередь, в которую складываются обновления
+        path: Путь webhook
+        secret: Секретный токен (если пустой, проверка отключена)
+        health_info: Дополнительные поля для /health (например, готовность воркеров анализа аудио)
+    """
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_TOKEN_HEADER) != secret:
+            logging.warning(f"Webhook: неверный секретный токен от {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={"bot": bot})
+        except Exception as e:
+            logging.warning(f"Webhook: не удалось разобрать обновление: {e}")
+            return web.Response(status=400)
+
+        if not update_queue.put_nowait(update):
+            logging.warning(f"Webhook: очередь переполнена, обновление {update.update_id} отклонено")
+            return web.Response(status=503)
+
+        return web.Response(status=200)
+
+    async def handle_health(request: web.Request) -> web.Response:
+        health = {
+            "queue_size": update_queue.qsize(),
+            "queue_maxsize": update_queue.maxsize,
+            "accepted": update_queue.accepted,
+            "rejected": update_queue.rejected,
+        }
+        if health_info:
+            health.update(health_info())
+        return web.json_response(health)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get(f"{path}/health", handle_health)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, bot_name: str,
+                      health_info: Optional[Callable[[], dict]] = None):
+    """
+    Запускает бота в режиме webhook. Работает до отмены задачи.
+
+    Args:
+        dp: Диспетчер бота
+        bot: Экземпляр бота
+        bot_name: Имя бота для настроек ('main', 'orders', 'purchases')
+        health_info: Дополнительные поля для /health
+    """
+    path = get_webhook_path(bot_name)
+    host = get_webhook_setting(bot_name, "HOST", "0.0.0.0")
+    port = int(get_webhook_setting(bot_name, "PORT", str(DEFAULT_WEBHOOK_PORTS.get(bot_name, 8080))))
+    secret = get_webhook_setting(bot_name, "SECRET", "")
+    queue_size = int(get_webhook_setting(bot_name, "QUEUE_SIZE", "1000"))
+    workers = int(get_webhook_setting(bot_name, "WORKERS", "8"))
+    reuse_port = get_webhook_setting(bot_name, "REUSE_PORT", "0") == "1"
+    # Строгий порядок обработки обновлений каждого пользователя (нужен для шардирования)
+    ordered = get_webhook_setting(bot_name, "ORDERED", "0") == "1"
+    # Если за одним портом несколько процессов, регистрирует webhook только один из них
+    register = get_webhook_setting(bot_name, "REGISTER", "1") == "1"
+
+    if not secret:
+        logging.warning("WEBHOOK_SECRET не задан - проверка секретного токена отключена")
+
+    update_queue = UpdateQueue(dp, bot, maxsize=queue_size, workers=workers, ordered=ordered)
+    app = create_webhook_app(bot, update_queue, path, secret, health_info)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port, reuse_port=reuse_port or None)
+    await site.start()
+    update_queue.start()
+    logging.info(f"Webhook сервер запущен на {host}:{port}{path} (очередь: {queue_size}, воркеров: {workers})")
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    if register:
+        url = f"{WEBHOOK_BASE_URL}{path}"
+        await bot.set_webhook(
+            url=url,
+            secret_token=secret or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logging.info(f"Webhook зарегистрирован: {url}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await update_queue.stop()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        logging.info("Webhook сервер остановлен")